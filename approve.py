@@ -1,5 +1,4 @@
 import json
-import boto3
 import email
 import urllib3
 import urllib.parse
@@ -11,6 +10,8 @@ from email.parser import BytesParser
 from typing import Optional, List
 from pydantic import BaseModel, EmailStr, Field, ValidationError, field_validator
 from datetime import datetime, timedelta, date
+from lambda_profiler import profile_handler
+from lazy_clients import LazyClient
 
 # ログ設定
 logger = logging.getLogger(__name__)
@@ -18,9 +19,15 @@ logger.setLevel(logging.INFO)
 
 # urllib3設定（タイムアウト付き）
 http = urllib3.PoolManager(timeout=urllib3.Timeout(30))
+# boto3のimport・クライアント作成は初回のS3呼び出しまで遅延し、以降の呼び出しでは再利用する
+s3 = LazyClient('s3')
 
 # Teams API設定
 TEAMS_API_URL = "https://tumr4jppl1.execute-api.ap-northeast-1.amazonaws.com/dev/teams/message"
+# trueの場合はTeams APIへ非同期送信（202受付）を依頼し、Graph送信完了を待たない
+TEAMS_ASYNC_DELIVERY = os.environ.get('TEAMS_ASYNC_DELIVERY', 'false').lower() == 'true'
+# trueの場合は承認依頼・受付通知をTeams APIの一括送信（mode 4）で1回の呼び出しにまとめる
+TEAMS_BATCH_DELIVERY = os.environ.get('TEAMS_BATCH_DELIVERY', 'false').lower() == 'true'
 
 # ========== 例外クラス ==========
 
@@ -83,6 +90,7 @@ def create_error_response(status_code: int, message: str) -> dict:
 
 # ========== 1. メインハンドラー ==========
 
+@profile_handler
 def lambda_handler(event, context):
     """AWS Lambda メインハンドラー関数"""
     sender_email = None
@@ -115,11 +123,19 @@ def lambda_handler(event, context):
             mail_body, mail_subject, sender_email
         )
         
-        # Teams承認メッセージ送信（承認者用）
-        teams_result = send_teams_approval_message(approval_data)
-        
-        # Teams受付通知送信（申請者用）
-        notification_result = send_teams_acceptance_notification(approval_data)
+        if TEAMS_BATCH_DELIVERY:
+            # Teams承認メッセージ・受付通知を一括送信
+            send_teams_messages_batch([
+                build_teams_approval_data(approval_data, f"{message_id}:approval"),
+                build_teams_acceptance_data(approval_data, f"{message_id}:acceptance")
+            ])
+        else:
+            # Teams承認メッセージ送信（承認者用）
+            # SESの再実行で同じ承認依頼が二重投稿されないよう、メールのMessageIdを冪等キーにする
+            teams_result = send_teams_approval_message(approval_data, f"{message_id}:approval")
+            
+            # Teams受付通知送信（申請者用）
+            notification_result = send_teams_acceptance_notification(approval_data, f"{message_id}:acceptance")
         
         logger.info("REQUEST_SUCCESS")
         return create_success_response("承認依頼を正常に送信しました")
@@ -221,7 +237,6 @@ def extract_and_validate_approval_data(mail_body: str, subject: str, sender: str
 
 def get_email_body_from_s3(message_id: str) -> str:
     """S3からメール本文を取得する"""
-    s3 = boto3.client('s3')
     bucket_name = os.environ.get('BUCKET_NAME')
     
     if not bucket_name:
@@ -443,29 +458,64 @@ def create_mailto_link(approval_data: ApprovalData) -> str:
 
 # ========== 4. API呼び出し関数 ==========
 
-def send_teams_approval_message(approval_data: ApprovalData) -> dict:
+def create_period_string(approval_data: ApprovalData) -> str:
+    """期間文字列作成（dateオブジェクトを文字列に変換）"""
+    period_str = f"FROM: {approval_data.from_date.strftime('%Y-%m-%d')}"
+    if approval_data.to_date:
+        period_str += f" TO: {approval_data.to_date.strftime('%Y-%m-%d')}"
+    return period_str
+
+def build_teams_approval_data(approval_data: ApprovalData, idempotency_key: Optional[str] = None) -> dict:
+    """Teams承認メッセージ（承認者用）のTeams APIデータ作成"""
+    period_str = create_period_string(approval_data)
+    
+    # メール下書きリンク作成
+    draft_link = create_mailto_link(approval_data)
+    
+    # HTMLメッセージ作成
+    html_message = create_teams_approval_html_message(approval_data, period_str, draft_link)
+    
+    teams_data = {
+        "mode": 2,
+        "team_name": os.environ.get('TEAMS_TEAM_NAME'),
+        "channel_name": os.environ.get('TEAMS_CHANNEL_NAME'),
+        "message_text": html_message,
+        "content_type": "html",
+        "subject": "ログ取得の申請：API承認依頼"
+    }
+    if idempotency_key:
+        teams_data["idempotency_key"] = idempotency_key
+    return teams_data
+
+def build_teams_acceptance_data(approval_data: ApprovalData, idempotency_key: Optional[str] = None) -> dict:
+    """Teams受付通知（申請者用）のTeams APIデータ作成（申請者メンション付き）"""
+    period_str = create_period_string(approval_data)
+    
+    # HTMLメッセージ作成
+    html_message = create_teams_acceptance_html_message(approval_data, period_str)
+    
+    teams_data = {
+        "mode": 2,
+        "team_name": os.environ.get('ERROR_NOTIFICATION_TEAM_NAME'),
+        "channel_name": os.environ.get('ERROR_NOTIFICATION_CHANNEL_NAME'),
+        "message_text": html_message,
+        "content_type": "html",
+        "subject": "ログ取得の申請：受付完了",
+        "mentions": [
+            {
+                "mention_type": "user",
+                "email_address": approval_data.mail
+            }
+        ]
+    }
+    if idempotency_key:
+        teams_data["idempotency_key"] = idempotency_key
+    return teams_data
+
+def send_teams_approval_message(approval_data: ApprovalData, idempotency_key: Optional[str] = None) -> dict:
     """Teams承認メッセージ送信（承認者用）"""
     try:
-        # 期間文字列作成（dateオブジェクトを文字列に変換）
-        period_str = f"FROM: {approval_data.from_date.strftime('%Y-%m-%d')}"
-        if approval_data.to_date:
-            period_str += f" TO: {approval_data.to_date.strftime('%Y-%m-%d')}"
-        
-        # メール下書きリンク作成
-        draft_link = create_mailto_link(approval_data)
-        
-        # HTMLメッセージ作成
-        html_message = create_teams_approval_html_message(approval_data, period_str, draft_link)
-        
-        # Teams APIデータ作成
-        teams_data = {
-            "mode": 2,
-            "team_name": os.environ.get('TEAMS_TEAM_NAME'),
-            "channel_name": os.environ.get('TEAMS_CHANNEL_NAME'),
-            "message_text": html_message,
-            "content_type": "html",
-            "subject": "ログ取得の申請：API承認依頼"
-        }
+        teams_data = build_teams_approval_data(approval_data, idempotency_key)
         
         # Teams API呼び出し
         result = call_teams_api(teams_data)
@@ -477,32 +527,10 @@ def send_teams_approval_message(approval_data: ApprovalData) -> dict:
         logger.error(f"TEAMS_APPROVAL_MESSAGE_ERROR - {str(e)}")
         raise APIException(502, f"Teams承認メッセージ送信に失敗しました: {str(e)}")
 
-def send_teams_acceptance_notification(approval_data: ApprovalData) -> dict:
+def send_teams_acceptance_notification(approval_data: ApprovalData, idempotency_key: Optional[str] = None) -> dict:
     """Teams受付通知送信（申請者用）"""
     try:
-        # 期間文字列作成（dateオブジェクトを文字列に変換）
-        period_str = f"FROM: {approval_data.from_date.strftime('%Y-%m-%d')}"
-        if approval_data.to_date:
-            period_str += f" TO: {approval_data.to_date.strftime('%Y-%m-%d')}"
-        
-        # HTMLメッセージ作成
-        html_message = create_teams_acceptance_html_message(approval_data, period_str)
-        
-        # Teams APIデータ作成（申請者メンション付き）
-        teams_data = {
-            "mode": 2,
-            "team_name": os.environ.get('ERROR_NOTIFICATION_TEAM_NAME'),
-            "channel_name": os.environ.get('ERROR_NOTIFICATION_CHANNEL_NAME'),
-            "message_text": html_message,
-            "content_type": "html",
-            "subject": "ログ取得の申請：受付完了",
-            "mentions": [
-                {
-                    "mention_type": "user",
-                    "email_address": approval_data.mail
-                }
-            ]
-        }
+        teams_data = build_teams_acceptance_data(approval_data, idempotency_key)
         
         # Teams API呼び出し
         result = call_teams_api(teams_data)
@@ -552,17 +580,33 @@ def send_error_notification(error: APIException, sender_email: str, mail_subject
         logger.error(f"ERROR_NOTIFICATION_FAILED - {str(e)}")
         return None  # 通知失敗でもメイン処理は継続
 
+def send_teams_messages_batch(messages: List[dict]) -> dict:
+    """複数のTeamsメッセージを一括送信（mode 4）し、1件でも失敗があれば例外"""
+    result = call_teams_api({"mode": 4, "messages": messages})
+    
+    failed = [item for item in result.get("data", {}).get("results", []) if item["status"] >= 400]
+    if failed:
+        details = ", ".join(f"#{item['index']} Status:{item['status']} - {item['message']}" for item in failed)
+        logger.error(f"TEAMS_BATCH_ERROR - {details}")
+        raise APIException(502, f"Teams一括送信に失敗しました: {details}")
+    
+    logger.info(f"TEAMS_BATCH_SUCCESS - Messages:{len(messages)}")
+    return result
+
 def call_teams_api(teams_data: dict) -> dict:
     """Teams API呼び出し"""
     try:
         headers = {"Content-Type": "application/json"}
+        if TEAMS_ASYNC_DELIVERY:
+            # キュー投入のみで202が返り、送信はteamsapiのワーカーで行われる
+            teams_data = {**teams_data, "async_delivery": True}
         request_body = json.dumps(teams_data, ensure_ascii=False).encode("utf-8")
         
         response = http.request("POST", TEAMS_API_URL, headers=headers, body=request_body)
         response_body = response.data.decode() if response.data else ""
         
-        # 成功の場合
-        if response.status in [200, 201]:
+        # 成功の場合（207は一括送信の一部失敗。各メッセージの結果は呼び出し元で判定）
+        if response.status in [200, 201, 202, 207]:
             return json.loads(response_body) if response_body else {}
         
         # エラーの場合：API Gatewayのレスポンスからメッセージを取得
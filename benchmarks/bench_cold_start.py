@@ -0,0 +1,191 @@
+"""Lambdaハンドラーモジュール コールドスタート import 時間ベンチマーク
+
+各ハンドラーモジュールを新しいPythonプロセスで読み込み、`-X importtime` の出力から
+モジュール読み込み時間（自身のトップレベル処理を含む）と依存パッケージ別の内訳を計測する。
+同じ実行の中で、遅延import対象のパッケージを先に読み込んだ場合（従来のトップレベルimport相当）
+も交互に計測し、遅延importによる短縮量を比較する。絶対値は実行環境のCPU性能に依存するため、
+短縮量は同一実行内の比較で評価する。
+
+計測項目:
+    lazy ms（中央値） / eager ms（中央値） / 短縮量 / 予算 / 読み込まれた遅延import対象 / 内訳上位
+
+使い方:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --module teamsapi --runs 10 --top 15
+    python benchmarks/bench_cold_start.py --check          # 予算超過・遅延import対象の読み込みで終了コード1
+    python benchmarks/bench_cold_start.py --check --budget teamsapi=500   # 予算を上書き
+    python benchmarks/bench_cold_start.py --json bench_cold_start.json
+
+--check は遅延import対象（HANDLER_MODULES の2番目の値）がモジュール読み込み時に
+読み込まれていないことと、lazy の中央値が予算（HANDLER_MODULES の3番目の値）以内であることを判定する。
+既定の予算は計測した lazy の中央値に約25%の余裕を加えた値で、CPU性能の異なる環境では
+--budget（または環境変数 BENCH_COLD_START_BUDGETS、"teamsapi=500,get_log=200" 形式）で上書きする。
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# モジュール名 -> (ファイル名, 遅延importしているパッケージ, lazy import予算ms)
+# 予算は --runs 7 の lazy 中央値（teamsapi 285〜330ms、approve 255〜276ms、get_log 119〜121ms）に約25%の余裕を加えた値
+HANDLER_MODULES = {
+    "teamsapi": ("teamsapi.py", ["boto3"], 400.0),
+    "approve": ("approve.py", ["boto3"], 340.0),
+    "get_log": ("get-log.py", ["boto3", "paramiko", "pyzipper"], 150.0),
+}
+
+# 遅延importの対象（読み込まれていればレポートに表示する）
+HEAVY_PACKAGES = ["boto3", "botocore", "paramiko", "cryptography", "pyzipper", "pydantic", "email_validator"]
+
+# import時に参照される環境変数のダミー値
+IMPORT_ENV = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "TENANT_ID": "bench-tenant",
+    "CLIENT_ID": "bench-client",
+    "CLIENT_SECRET": "bench-secret",
+    "REFRESH_TOKEN_PARAM_NAME": "/bench/refresh_token",
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# 子プロセスで実行するコード（ハイフンを含むファイル名でも読み込めるようspec経由で読み込む）
+LOADER_CODE = """
+import importlib.util, json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+for package in {eager!r}:
+    __import__(package)
+spec = importlib.util.spec_from_file_location({name!r}, {path!r})
+module = importlib.util.module_from_spec(spec)
+sys.modules[{name!r}] = module
+spec.loader.exec_module(module)
+elapsed_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({{"elapsed_ms": elapsed_ms, "loaded": [p for p in {heavy!r} if p in sys.modules]}}))
+"""
+
+def measure_import(name: str, filename: str, eager: list) -> dict:
+    """新しいプロセスで1回読み込み、経過時間と依存パッケージ別の内訳を返す
+
+    eager に指定したパッケージはモジュールより先に（計測時間内で）読み込む。
+    """
+    code = LOADER_CODE.format(root=REPO_ROOT, name=name, path=os.path.join(REPO_ROOT, filename),
+                              heavy=HEAVY_PACKAGES, eager=eager)
+    env = {**os.environ, **IMPORT_ENV}
+    # Lambda環境と誤認させない（初期化時の接続事前確立などを行わない）
+    env.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=env, cwd=REPO_ROOT, check=True
+    )
+
+    # インデントの最も浅い（ハンドラーから直接importされた）パッケージ単位で集計
+    breakdown = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            package = match.group(4).split(".")[0]
+            breakdown[package] = breakdown.get(package, 0) + int(match.group(2)) / 1000
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["breakdown_ms"] = breakdown
+    return result
+
+def run_module(name: str, filename: str, deferred: list, runs: int, budget_ms: float) -> dict:
+    """遅延import（lazy）と先読み（eager）を交互に計測し、中央値と差を返す"""
+    lazy_samples, eager_samples = [], []
+    for _ in range(runs):
+        lazy_samples.append(measure_import(name, filename, []))
+        eager_samples.append(measure_import(name, filename, deferred))
+
+    lazy_ms = statistics.median(s["elapsed_ms"] for s in lazy_samples)
+    eager_ms = statistics.median(s["elapsed_ms"] for s in eager_samples)
+    packages = {p for s in lazy_samples for p in s["breakdown_ms"]}
+    breakdown = {p: statistics.median(s["breakdown_ms"].get(p, 0.0) for s in lazy_samples) for p in packages}
+    deferred_loaded = sorted({p for s in lazy_samples for p in s["loaded"] if p in deferred})
+    return {
+        "module": name,
+        "lazy_ms": lazy_ms,
+        "eager_ms": eager_ms,
+        "saved_ms": eager_ms - lazy_ms,
+        "saved_percent": (eager_ms - lazy_ms) / eager_ms * 100 if eager_ms else 0.0,
+        "budget_ms": budget_ms,
+        "deferred_loaded": deferred_loaded,
+        "passed": not deferred_loaded and lazy_ms <= budget_ms,
+        "heavy_loaded": lazy_samples[-1]["loaded"],
+        "breakdown_ms": dict(sorted(breakdown.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+def parse_budgets(values: list) -> dict:
+    """"module=ms" 形式（カンマ区切り可）の予算指定を辞書に変換"""
+    budgets = {}
+    for value in values:
+        for item in filter(None, (v.strip() for v in value.split(","))):
+            name, _, ms = item.partition("=")
+            if name not in HANDLER_MODULES or not ms:
+                raise ValueError(f"invalid budget: {item!r} (expected module=ms)")
+            budgets[name] = float(ms)
+    return budgets
+
+# ========== エントリーポイント ==========
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lambda handler cold-start import benchmark")
+    parser.add_argument("--module", action="append", choices=sorted(HANDLER_MODULES), help="measure only the given module (repeatable)")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module and mode")
+    parser.add_argument("--top", type=int, default=8, help="number of packages to show in the breakdown")
+    parser.add_argument("--budget", action="append", default=[], help="override a lazy import budget as module=ms (repeatable)")
+    parser.add_argument("--check", action="store_true",
+                        help="exit with 1 when a budget is exceeded or a deferred package is loaded at import")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    budgets = {name: budget_ms for name, (_, _, budget_ms) in HANDLER_MODULES.items()}
+    try:
+        budgets.update(parse_budgets([os.environ.get("BENCH_COLD_START_BUDGETS", "")] + args.budget))
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = []
+    for name in args.module or list(HANDLER_MODULES):
+        filename, deferred, _ = HANDLER_MODULES[name]
+        try:
+            results.append(run_module(name, filename, deferred, max(1, args.runs), budgets[name]))
+        except subprocess.CalledProcessError as e:
+            error = (e.stderr or "").strip().splitlines()[-1:] or ["import failed"]
+            print(f"{name}: {error[0]}", file=sys.stderr)
+            results.append({"module": name, "error": error[0], "passed": False})
+
+    header = f"{'module':<10}{'lazy ms':>9}{'eager ms':>10}{'saved':>8}{'saved %':>9}{'budget':>8}  {'status':<7}heavy packages loaded"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if "error" in r:
+            print(f"{r['module']:<10}{'-':>9}{'-':>10}{'-':>8}{'-':>9}{'-':>8}  {'ERROR':<7}-")
+            continue
+        status = "ok" if r["passed"] else "FAIL"
+        budget = f"{r['budget_ms']:.0f}"
+        print(f"{r['module']:<10}{r['lazy_ms']:>9.1f}{r['eager_ms']:>10.1f}{r['saved_ms']:>8.1f}{r['saved_percent']:>8.0f}%"
+              f"{budget:>8}  {status:<7}{', '.join(r['heavy_loaded']) or '-'}")
+    for r in results:
+        if "error" in r:
+            continue
+        if r["deferred_loaded"]:
+            print(f"\n{r['module']}: deferred packages loaded at import: {', '.join(r['deferred_loaded'])}")
+        print(f"\n{r['module']} breakdown (cumulative ms, median, lazy)")
+        for package, ms in list(r["breakdown_ms"].items())[:args.top]:
+            print(f"  {package:<28}{ms:>8.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.check and not all(r["passed"] for r in results):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""get-log.py エンドツーエンド スループットベンチマーク
+
+ローカルのparamiko SFTPサーバーと moto(S3/SSM) を使い、
+process_servers_logs をダウンロード→ZIP→S3アップロードまで実行して計測する。
+
+計測項目:
+    wall time / MB/s / peak RSS / /tmp 使用量の最大値
+
+使い方:
+    python benchmarks/bench_get_log.py
+    python benchmarks/bench_get_log.py --scenario many_small_files --scale 0.1
+    python benchmarks/bench_get_log.py --json bench_output.json
+
+各シナリオは別プロセスで実行するため、peak RSS はシナリオ単位の値になる。
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import paramiko
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DOMAIN = "bench.invalid"
+BENCH_PASSWORD = "bench-password"
+BUCKET_NAME = "get-log-bench"
+
+# シナリオ定義: servers x files_per_server x file_size_kb
+SCENARIOS = {
+    "many_small_files": {"servers": 1, "files_per_server": 500, "file_size_kb": 16},
+    "few_huge_files": {"servers": 1, "files_per_server": 2, "file_size_kb": 128 * 1024},
+    "many_servers": {"servers": 20, "files_per_server": 20, "file_size_kb": 1024},
+}
+
+# ========== ローカルSFTPサーバー ==========
+
+class BenchSFTPHandle(paramiko.SFTPHandle):
+    """読み取り専用ファイルハンドル"""
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+class BenchSFTPServer(paramiko.SFTPServerInterface):
+    """ユーザー名ごとのディレクトリをルートとして公開するSFTPサーバー"""
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = server.root
+
+    def _local_path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local_path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            handle = BenchSFTPHandle(flags)
+            handle.readfile = open(self._local_path(path), 'rb')
+            handle.filename = self._local_path(path)
+            return handle
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+class BenchSSHServer(paramiko.ServerInterface):
+    """パスワード認証のみ受け付けるSSHサーバー"""
+    def __init__(self, tree_root: str):
+        self.tree_root = tree_root
+        self.root = tree_root
+
+    def check_auth_password(self, username, password):
+        if password != BENCH_PASSWORD:
+            return paramiko.AUTH_FAILED
+        self.root = os.path.join(self.tree_root, username)
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED if kind == "session" else paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+def start_sftp_server(tree_root: str) -> int:
+    """SFTPサーバーをバックグラウンドスレッドで起動し、待受ポートを返す"""
+    host_key = paramiko.RSAKey.generate(2048)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(100)
+
+    def serve_connection(conn):
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler("sftp", paramiko.SFTPServer, BenchSFTPServer)
+        transport.start_server(server=BenchSSHServer(tree_root))
+        while transport.is_active():
+            time.sleep(0.5)
+
+    def accept_loop():
+        while True:
+            conn, _ = listener.accept()
+            threading.Thread(target=serve_connection, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return listener.getsockname()[1]
+
+# ========== ログツリー生成 ==========
+
+def generate_log_tree(tree_root: str, name: str, scenario: dict, scale: float) -> dict:
+    """サーバーごとのログファイルを生成し、get-logのservers設定を返す"""
+    files_per_server = max(1, int(scenario["files_per_server"] * scale))
+    file_size = max(1024, int(scenario["file_size_kb"] * 1024 * scale))
+    # 圧縮率が実ログに近くなるよう、行単位でタイムスタンプと連番を変える
+    line_template = "2024-01-01T00:00:00.000 INFO [worker-{:04d}] request completed status=200 elapsed={}ms\n"
+
+    servers = {}
+    for server_index in range(scenario["servers"]):
+        # SFTPサーバーはユーザー名(=ホスト名)のディレクトリをルートにする
+        hostname = f"{name}-srv{server_index:03d}"
+        log_paths = []
+        for file_index in range(files_per_server):
+            remote_path = f"/var/log/app/app-{file_index:04d}.log"
+            local_path = os.path.join(tree_root, hostname, remote_path.lstrip('/'))
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "w") as f:
+                written = 0
+                line_number = 0
+                while written < file_size:
+                    line = line_template.format(line_number % 10000, line_number % 997)
+                    f.write(line)
+                    written += len(line)
+                    line_number += 1
+            log_paths.append(remote_path)
+        servers[hostname] = {"log_paths": log_paths}
+    return servers
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+# ========== シナリオ実行（子プロセス） ==========
+
+def run_scenario(name: str, servers: dict, port: int, config: dict, result_queue) -> None:
+    """moto環境でprocess_servers_logsを実行して計測結果を返す"""
+    from moto import mock_s3, mock_ssm
+
+    os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+    os.environ.update({
+        "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing",
+        "BUCKET_NAME": BUCKET_NAME, "STORAGE_GATEWAY_SHARE_PATH": "\\\\bench\\share",
+        "INTERNAL_DOMAIN": BENCH_DOMAIN,
+    })
+
+    # *.bench.invalid をローカルSFTPサーバーに向ける
+    original_getaddrinfo = socket.getaddrinfo
+    def bench_getaddrinfo(host, *args, **kwargs):
+        if isinstance(host, str) and host.endswith(f".{BENCH_DOMAIN}"):
+            host = "127.0.0.1"
+        return original_getaddrinfo(host, *args, **kwargs)
+    socket.getaddrinfo = bench_getaddrinfo
+
+    with mock_s3(), mock_ssm():
+        sys.path.insert(0, REPO_ROOT)
+        spec = importlib.util.spec_from_file_location("get_log", os.path.join(REPO_ROOT, "get-log.py"))
+        get_log = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(get_log)
+
+        from emf_metrics import LocalMetricsSink, set_metrics_sink
+        metrics_sink = LocalMetricsSink()
+        set_metrics_sink(metrics_sink)
+
+        get_log.s3.create_bucket(Bucket=BUCKET_NAME, CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+        for hostname, server_info in servers.items():
+            server_info["port"] = port
+            get_log.ssm.put_parameter(
+                Name=f"/get-log-api/credentials/{hostname}", Type="SecureString",
+                Value=json.dumps({"username": hostname, "password": BENCH_PASSWORD})
+            )
+
+        # /tmp 使用量の最大値をサンプリング
+        tmp_baseline = directory_size("/tmp")
+        tmp_peak = [0]
+        sampling = threading.Event()
+        def sample_tmp():
+            while not sampling.is_set():
+                tmp_peak[0] = max(tmp_peak[0], directory_size("/tmp") - tmp_baseline)
+                sampling.wait(0.2)
+        sampler = threading.Thread(target=sample_tmp, daemon=True)
+        sampler.start()
+
+        started = time.perf_counter()
+        storage_paths, _ = get_log.process_servers_logs(
+            servers, datetime(2024, 1, 1), datetime(2024, 1, 1), f"bench_{name}",
+            global_max_bytes_per_sec=config.get("global_max_bytes_per_sec"),
+            max_concurrent_servers=config.get("max_concurrent_servers", 1)
+        )
+        wall_seconds = time.perf_counter() - started
+        sampling.set()
+        sampler.join()
+
+        uploaded = get_log.s3.list_objects_v2(Bucket=BUCKET_NAME).get("Contents", [])
+        downloaded_bytes = sum(metrics_sink.values("DownloadBytes"))
+        result_queue.put({
+            "scenario": name,
+            "servers": len(servers),
+            "files": sum(len(s["log_paths"]) for s in servers.values()),
+            "downloaded_mb": downloaded_bytes / 1024 / 1024,
+            "wall_seconds": wall_seconds,
+            "mb_per_sec": downloaded_bytes / 1024 / 1024 / wall_seconds if wall_seconds else 0.0,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "tmp_peak_mb": tmp_peak[0] / 1024 / 1024,
+            "zip_parts": len(storage_paths),
+            "uploaded_objects": len(uploaded),
+        })
+
+# ========== エントリーポイント ==========
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="get-log.py end-to-end throughput benchmark")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="run only the given scenario (repeatable)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply file count and size by this factor")
+    parser.add_argument("--max-concurrent-servers", type=int, default=1)
+    parser.add_argument("--global-max-bytes-per-sec", type=int, default=None)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # クライアント切断時のサーバー側ソケット例外ログを抑止
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+
+    config = {
+        "max_concurrent_servers": args.max_concurrent_servers,
+        "global_max_bytes_per_sec": args.global_max_bytes_per_sec,
+    }
+    tree_root = tempfile.mkdtemp(prefix="get-log-bench-tree-", dir=os.environ.get("BENCH_TREE_DIR"))
+    results = []
+    try:
+        port = start_sftp_server(tree_root)
+        context = multiprocessing.get_context("spawn")
+        for name in args.scenario or list(SCENARIOS):
+            servers = generate_log_tree(tree_root, name.replace("_", "-"), SCENARIOS[name], args.scale)
+            queue = context.Queue()
+            process = context.Process(target=run_scenario, args=(name, servers, port, config, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{name}: failed (exit code {process.exitcode})", file=sys.stderr)
+                continue
+            results.append(queue.get())
+    finally:
+        shutil.rmtree(tree_root, ignore_errors=True)
+
+    header = f"{'scenario':<18}{'servers':>8}{'files':>7}{'MB':>9}{'wall s':>9}{'MB/s':>9}{'RSS MB':>9}{'/tmp MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<18}{r['servers']:>8}{r['files']:>7}{r['downloaded_mb']:>9.1f}"
+              f"{r['wall_seconds']:>9.2f}{r['mb_per_sec']:>9.1f}{r['peak_rss_mb']:>9.1f}{r['tmp_peak_mb']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if len(results) == len(args.scenario or SCENARIOS) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
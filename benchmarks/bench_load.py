@@ -0,0 +1,226 @@
+"""teamsapi.py 負荷試験ドライバー
+
+疑似Graphサーバー（fake_graph.py）を起動し、teamsapi.lambda_handler を
+指定したリクエストレート（open loop）で mode 1（DM）/ 2（チャンネル）/ 3（トークン更新）の混在で実行する。
+
+Lambdaと同様に1プロセス1呼び出しずつ処理するワーカープロセスを --concurrency 個起動し、
+リクエスト i を開始予定時刻 i / rps にいずれかのワーカーへ割り当てる。SSMはワーカーごとのmotoで代替する。
+
+計測項目:
+    達成rps / レイテンシ p50・p99（予定時刻から完了まで。ワーカーの処理待ちを含む）/ 処理時間 p50
+    Graph呼び出し数/メッセージ（GRAPH_TIMELINE_DEBUG のタイムラインから集計。$batch は1回と数える）
+    疑似サーバー側のエンドポイント別呼び出し数・注入した429の件数
+
+使い方:
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --rps 50 --duration 20 --concurrency 8 --mix 1=6,2=3,3=1
+    python benchmarks/bench_load.py --latency-ms 50 --throttle-rate 0.05 --page-size 5 --cold-caches
+    python benchmarks/bench_load.py --json bench_load.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_graph import FakeGraphConfig, base_urls, start_fake_graph  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import時に参照される環境変数のダミー値
+IMPORT_ENV = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "TENANT_ID": "bench-tenant",
+    "CLIENT_ID": "bench-client",
+    "CLIENT_SECRET": "bench-secret",
+    "REFRESH_TOKEN_PARAM_NAME": "/bench/refresh_token",
+    "GRAPH_TIMELINE_DEBUG": "true",
+}
+
+# ========== リクエスト ==========
+
+def build_event(mode: int, index: int, recipients: int, user_pool: int) -> tuple:
+    """mode別のAPI Gatewayイベントと送信メッセージ数"""
+    if mode == 1:
+        emails = [f"user{(index * recipients + j) % user_pool}@example.com" for j in range(recipients)]
+        body = {"mode": 1, "email_addresses": emails, "message_text": f"負荷試験 DM {index}"}
+        return {"body": json.dumps(body, ensure_ascii=False)}, len(emails)
+    if mode == 2:
+        body = {"mode": 2, "team_name": "開発チーム", "channel_name": "一般", "message_text": f"負荷試験 {index}"}
+        return {"body": json.dumps(body, ensure_ascii=False)}, 1
+    return {"body": json.dumps({"mode": 3})}, 0
+
+def build_schedule(rps: float, duration: float, mix: dict, seed: int) -> list:
+    """(リクエスト番号, 開始予定オフセット秒, mode) の一覧"""
+    rng = random.Random(seed)
+    modes, weights = zip(*sorted(mix.items()))
+    count = max(1, int(rps * duration))
+    return [(i, i / rps, rng.choices(modes, weights)[0]) for i in range(count)]
+
+# ========== ワーカープロセス ==========
+
+def run_worker(jobs: list, env: dict, options: dict, ready, go, start_at, results) -> None:
+    """1プロセスで lambda_handler を順に実行（Lambdaの1実行環境に相当）"""
+    os.environ.update(env)
+    os.environ.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    sys.path.insert(0, REPO_ROOT)
+    logging.disable(logging.CRITICAL)
+
+    import boto3
+    from moto import mock_ssm
+    with mock_ssm():
+        boto3.client("ssm").put_parameter(Name=env["REFRESH_TOKEN_PARAM_NAME"], Value="bench-refresh", Type="SecureString")
+        import teamsapi
+        from emf_metrics import set_metrics_sink
+        set_metrics_sink(lambda record: None)
+
+        ready.put(True)
+        go.wait()
+        started = start_at.value
+        samples = []
+        for index, offset, mode in jobs:
+            if options["cold_caches"]:
+                # ID・ユーザー解決キャッシュのみ破棄（アクセストークンは再利用する）
+                for cache in [teamsapi.team_id_cache, teamsapi.channel_id_cache, teamsapi.chat_id_cache, teamsapi.user_directory_cache]:
+                    cache.clear()
+            event, messages = build_event(mode, index, options["recipients"], options["user_pool"])
+            scheduled = started + offset
+            time.sleep(max(0.0, scheduled - time.time()))
+            began = time.time()
+            response = teamsapi.lambda_handler(event, SimpleNamespace(aws_request_id=f"bench-{index}"))
+            finished = time.time()
+            body = json.loads(response["body"])
+            samples.append({
+                "mode": mode,
+                "status": response["statusCode"],
+                "messages": messages,
+                # HTTP往復の回数（$batchのサブリクエストは含めない）
+                "graph_calls": len([c for c in body.get("debug", {}).get("graph_calls", []) if not c.get("batched")]),
+                "latency_ms": (finished - scheduled) * 1000,
+                "service_ms": (finished - began) * 1000,
+                "finished": finished,
+            })
+    results.put(samples)
+
+# ========== 集計 ==========
+
+def percentile(values: list, pct: float) -> float:
+    """nearest-rank 法のパーセンタイル"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))]
+
+def summarize(samples: list, label: str) -> dict:
+    ok = [s for s in samples if s["status"] < 400]
+    messages = sum(s["messages"] for s in ok)
+    return {
+        "mode": label,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "p50_ms": percentile([s["latency_ms"] for s in samples], 50),
+        "p99_ms": percentile([s["latency_ms"] for s in samples], 99),
+        "service_p50_ms": percentile([s["service_ms"] for s in samples], 50),
+        "graph_calls_per_message": sum(s["graph_calls"] for s in ok if s["messages"]) / messages if messages else None,
+    }
+
+def run_load(args) -> dict:
+    config = FakeGraphConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_latency_ms=args.token_latency_ms,
+                             throttle_rate=args.throttle_rate, page_size=args.page_size, seed=args.seed)
+    server, state = start_fake_graph(config)
+    env = {**IMPORT_ENV, **base_urls(server)}
+    options = {"cold_caches": args.cold_caches, "recipients": args.recipients, "user_pool": args.user_pool}
+    schedule = build_schedule(args.rps, args.duration, args.mix, args.seed)
+
+    context = multiprocessing.get_context("spawn")
+    ready, results, go = context.Queue(), context.Queue(), context.Event()
+    start_at = context.Value("d", 0.0)
+    workers = [
+        context.Process(target=run_worker, args=(schedule[w::args.concurrency], env, options, ready, go, start_at, results))
+        for w in range(args.concurrency)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.get(timeout=120)
+        start_at.value = time.time() + 0.2
+        go.set()
+        samples = [sample for _ in workers for sample in results.get()]
+        for worker in workers:
+            worker.join()
+    finally:
+        server.shutdown()
+
+    elapsed = max(s["finished"] for s in samples) - start_at.value
+    return {
+        "offered_rps": args.rps,
+        "achieved_rps": len(samples) / elapsed if elapsed > 0 else 0.0,
+        "concurrency": args.concurrency,
+        "results": [summarize(samples, "all")] + [
+            summarize([s for s in samples if s["mode"] == mode], str(mode)) for mode in sorted(args.mix)
+        ],
+        "server": state.snapshot(),
+    }
+
+# ========== エントリーポイント ==========
+
+def parse_mix(value: str) -> dict:
+    """"1=6,2=3,3=1" 形式の mode 別比率"""
+    mix = {}
+    for item in value.split(","):
+        mode, weight = item.split("=")
+        if int(mode) not in (1, 2, 3):
+            raise argparse.ArgumentTypeError(f"unsupported mode: {mode}")
+        mix[int(mode)] = float(weight)
+    return mix
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="teamsapi load test against a fake Microsoft Graph")
+    parser.add_argument("--rps", type=float, default=20.0, help="offered requests per second")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of offered load")
+    parser.add_argument("--concurrency", type=int, default=4, help="worker processes (concurrent Lambda environments)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("1=5,2=4,3=1"), help="mode weights, e.g. 1=5,2=4,3=1")
+    parser.add_argument("--recipients", type=int, default=3, help="recipients per mode 1 request")
+    parser.add_argument("--user-pool", type=int, default=50, help="distinct recipient addresses")
+    parser.add_argument("--cold-caches", action="store_true", help="clear ID/user caches before every request")
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--token-latency-ms", type=float, default=80.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="probability of an injected 429")
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+    args.concurrency = max(1, args.concurrency)
+
+    report = run_load(args)
+
+    print(f"offered {report['offered_rps']:.1f} rps / achieved {report['achieved_rps']:.1f} rps "
+          f"(concurrency {report['concurrency']})")
+    header = f"{'mode':<6}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}{'svc p50':>9}{'graph/msg':>11}"
+    print(header)
+    print("-" * len(header))
+    for r in report["results"]:
+        per_message = f"{r['graph_calls_per_message']:.2f}" if r["graph_calls_per_message"] is not None else "-"
+        print(f"{r['mode']:<6}{r['requests']:>9}{r['errors']:>8}{r['p50_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+              f"{r['service_p50_ms']:>9.1f}{per_message:>11}")
+    print(f"\nfake Graph calls (injected 429: {report['server']['throttled']})")
+    for endpoint, count in sorted(report["server"]["counts"].items(), key=lambda item: item[1], reverse=True):
+        print(f"  {endpoint:<48}{count:>8}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+"""teamsapi.py リクエスト解析 マイクロベンチマーク
+
+判別共用体の TypeAdapter（REQUEST_ADAPTER）でJSON文字列を直接検証する現行の経路と、
+従来の json.loads → mode による分岐 → モデル生成 の経路を同じペイロードで比較する。
+
+計測項目:
+    1件あたりの処理時間 µs（中央値） / 従来経路に対する速度比
+
+シナリオ:
+    単一リクエスト: DM・メンション付きチャンネル・一括送信（20件）・無効mode
+    キュー処理: SQSイベント1回分（既定10件）の解析。従来の queue_worker_handler は
+        グループ化で1回、送信時に json.loads → json.dumps → 再解析でもう1回、計2回解析していた
+
+使い方:
+    python benchmarks/bench_request_parsing.py
+    python benchmarks/bench_request_parsing.py --number 2000 --repeat 7 --queue-batch 10
+    python benchmarks/bench_request_parsing.py --json bench_request_parsing.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# import時に参照される環境変数のダミー値
+IMPORT_ENV = {
+    "AWS_DEFAULT_REGION": "ap-northeast-1",
+    "TENANT_ID": "bench-tenant",
+    "CLIENT_ID": "bench-client",
+    "CLIENT_SECRET": "bench-secret",
+    "REFRESH_TOKEN_PARAM_NAME": "/bench/refresh_token",
+}
+
+def load_teamsapi():
+    for key, value in IMPORT_ENV.items():
+        os.environ.setdefault(key, value)
+    # Lambda環境と誤認させない（初期化時の接続事前確立などを行わない）
+    os.environ.pop("AWS_LAMBDA_FUNCTION_NAME", None)
+    sys.path.insert(0, REPO_ROOT)
+    import teamsapi
+    return teamsapi
+
+# ========== ペイロード ==========
+
+DM_REQUEST = {
+    "mode": 1,
+    "email_addresses": ["user1@example.com", "user2@example.com"],
+    "message_text": "承認依頼が届いています。内容を確認してください。",
+}
+
+CHANNEL_REQUEST = {
+    "mode": 2,
+    "team_name": "開発チーム",
+    "channel_name": "一般",
+    "subject": "定期メンテナンスのお知らせ",
+    "message_text": "<p>本日22時からメンテナンスを実施します。</p>" * 20,
+    "content_type": "html",
+    "mentions": [{"email_address": f"member{i}@example.com"} for i in range(5)],
+}
+
+def build_payloads(batch_size: int) -> dict:
+    messages = [DM_REQUEST if i % 2 else CHANNEL_REQUEST for i in range(batch_size)]
+    return {
+        "dm": json.dumps(DM_REQUEST, ensure_ascii=False),
+        "channel_mentions": json.dumps(CHANNEL_REQUEST, ensure_ascii=False),
+        f"batch_{batch_size}": json.dumps({"mode": 4, "messages": messages}, ensure_ascii=False),
+        "invalid_mode": json.dumps({"mode": 9}),
+    }
+
+def build_queue_records(count: int) -> list:
+    return [
+        {
+            "messageId": f"m{i}",
+            "body": json.dumps({"request_id": f"r{i}", "enqueued_at": 1700000000.0 + i, "request": CHANNEL_REQUEST},
+                               ensure_ascii=False),
+        }
+        for i in range(count)
+    ]
+
+# ========== 従来の経路 ==========
+
+def legacy_validate(teamsapi, body_json: str):
+    """json.loads → mode による分岐 → モデル生成（変更前の validate_and_parse_request と同等）"""
+    try:
+        body = json.loads(body_json)
+    except json.JSONDecodeError as e:
+        raise teamsapi.APIException(400, f"Invalid JSON format: {str(e)}")
+    try:
+        mode = body.get("mode")
+        models = {
+            1: teamsapi.DMRequestModel,
+            2: teamsapi.ChannelRequestModel,
+            3: teamsapi.RefreshTokenRequestModel,
+            4: teamsapi.BatchRequestModel,
+        }
+        if mode not in models:
+            raise teamsapi.APIException(400, f"Invalid mode: {mode}")
+        return models[mode](**body)
+    except teamsapi.ValidationError as e:
+        raise teamsapi.APIException(400, f"Validation failed: {str(e)}")
+
+def legacy_queue_parse(teamsapi, records: list) -> None:
+    """変更前の queue_worker_handler の解析（グループ化で1回・送信時に再解析で1回）"""
+    for record in records:
+        envelope = json.loads(record["body"])
+        teamsapi.ChannelRequestModel(**envelope["request"])
+    for record in records:
+        envelope = json.loads(record["body"])
+        legacy_validate(teamsapi, json.dumps(envelope["request"], ensure_ascii=False))
+
+# ========== 計測 ==========
+
+def time_us(func, number: int, repeat: int) -> float:
+    """1回あたりの処理時間（µs、repeat 回の中央値）"""
+    samples = timeit.repeat(func, number=number, repeat=repeat)
+    return statistics.median(samples) / number * 1_000_000
+
+def swallow(func):
+    """無効なペイロード用（例外送出までの時間を計測する）"""
+    def run():
+        try:
+            func()
+        except Exception:
+            pass
+    return run
+
+def run_benchmarks(number: int, repeat: int, batch_size: int, queue_batch: int) -> list:
+    teamsapi = load_teamsapi()
+    results = []
+    for name, payload in build_payloads(batch_size).items():
+        legacy = swallow(lambda: legacy_validate(teamsapi, payload))
+        current = swallow(lambda: teamsapi.validate_and_parse_request(payload))
+        results.append({"scenario": name, "legacy_us": time_us(legacy, number, repeat),
+                        "adapter_us": time_us(current, number, repeat)})
+
+    records = build_queue_records(queue_batch)
+    queue_number = max(1, number // queue_batch)
+    results.append({
+        "scenario": f"queue_drain_{queue_batch}",
+        "legacy_us": time_us(lambda: legacy_queue_parse(teamsapi, records), queue_number, repeat),
+        "adapter_us": time_us(lambda: teamsapi.parse_queued_records(records), queue_number, repeat),
+    })
+    for r in results:
+        r["speedup"] = r["legacy_us"] / r["adapter_us"] if r["adapter_us"] else 0.0
+    return results
+
+# ========== エントリーポイント ==========
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="teamsapi request parsing micro-benchmark")
+    parser.add_argument("--number", type=int, default=2000, help="calls per timing sample")
+    parser.add_argument("--repeat", type=int, default=5, help="timing samples per scenario")
+    parser.add_argument("--batch-size", type=int, default=20, help="messages in the mode 4 payload")
+    parser.add_argument("--queue-batch", type=int, default=10, help="records per simulated SQS event")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmarks(max(1, args.number), max(1, args.repeat), args.batch_size, max(1, args.queue_batch))
+
+    header = f"{'scenario':<20}{'legacy µs':>12}{'adapter µs':>12}{'speedup':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<20}{r['legacy_us']:>12.1f}{r['adapter_us']:>12.1f}{r['speedup']:>8.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+"""Microsoft Graph / トークンエンドポイントの疑似サーバー（負荷試験・ローカル検証用）
+
+teamsapi.py が呼び出すエンドポイントのみを最小限に実装する。
+GRAPH_API_BASE_URL=http://127.0.0.1:<port>/v1.0 と LOGIN_BASE_URL=http://127.0.0.1:<port> を
+設定した teamsapi から利用する。
+
+実装するエンドポイント:
+    POST /{tenant}/oauth2/v2.0/token      リフレッシュトークンでのトークン発行
+    GET  /v1.0/me                          呼び出し元ユーザー
+    GET  /v1.0/users/{email}               ユーザー解決（MISSING_DOMAIN のアドレスは404）
+    GET  /v1.0/me/joinedTeams              参加チーム一覧（ページング）
+    GET  /v1.0/teams/{id}/channels         チャンネル一覧（ページング）
+    GET  /v1.0/me/chats                    チャット一覧（常に空・ページング）
+    POST /v1.0/chats                       1対1チャット作成
+    POST /v1.0/chats/{id}/messages         DM送信
+    POST /v1.0/teams/{id}/channels/{id}/messages  チャンネル投稿
+    POST /v1.0/$batch                      JSONバッチ（サブリクエストにも429を注入）
+
+設定（FakeGraphConfig）:
+    latency_ms / jitter_ms      Graph応答までの待機時間（一様乱数で jitter_ms だけ揺らす）
+    token_latency_ms            トークンエンドポイントの待機時間
+    throttle_rate               429（Retry-After付き）を返す確率
+    page_size                   一覧系の1ページ件数（超える分は @odata.nextLink で返す）
+    filler_teams / filler_channels  一致しないチーム・チャンネルの件数（ページ数の調整用）
+
+単体でも起動できる:
+    python benchmarks/fake_graph.py --port 8080 --latency-ms 30 --throttle-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from call_metrics import endpoint_template  # noqa: E402
+
+MISSING_DOMAIN = "missing.invalid"
+DISPLAY_NAME_FILTER = re.compile(r"^displayName eq '((?:[^']|'')*)'$")
+
+@dataclass
+class FakeGraphConfig:
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    token_latency_ms: float = 80.0
+    throttle_rate: float = 0.0
+    retry_after_seconds: int = 1
+    page_size: int = 20
+    team_names: Tuple[str, ...] = ("開発チーム",)
+    channel_names: Tuple[str, ...] = ("一般",)
+    filler_teams: int = 30
+    filler_channels: int = 10
+    seed: int = 0
+
+class FakeGraphState:
+    """疑似サーバーのデータ・呼び出し回数（スレッド間で共有）"""
+    def __init__(self, config: FakeGraphConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        self.random = random.Random(config.seed)
+        self.counts: Dict[str, int] = {}
+        self.throttled = 0
+        self.sequence = 0
+        # 一致しないものを先に並べ、目的のチーム・チャンネルが後ろのページにあるようにする
+        self.teams = [{"id": f"team-filler-{i}", "displayName": f"Filler Team {i}"} for i in range(config.filler_teams)]
+        self.teams += [{"id": f"team-{i}", "displayName": name} for i, name in enumerate(config.team_names)]
+        self.channels = [{"id": f"19:filler{i}@thread.tacv2", "displayName": f"filler-{i}"} for i in range(config.filler_channels)]
+        self.channels += [{"id": f"19:channel{i}@thread.tacv2", "displayName": name} for i, name in enumerate(config.channel_names)]
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def should_throttle(self) -> bool:
+        with self.lock:
+            throttled = self.random.random() < self.config.throttle_rate
+            self.throttled += int(throttled)
+        return throttled
+
+    def delay(self, base_ms: float) -> None:
+        with self.lock:
+            jitter = self.random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def next_id(self) -> str:
+        with self.lock:
+            self.sequence += 1
+            return str(self.sequence)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"counts": dict(self.counts), "throttled": self.throttled}
+
+# ========== ルーティング ==========
+
+def user_id_for(email: str) -> str:
+    return hashlib.sha1(email.strip().lower().encode()).hexdigest()[:32]
+
+def page_of(items: list, base_url: str, path: str, query: dict, page_size: int) -> dict:
+    """$skiptoken（開始位置）で1ページ分を返し、続きがあれば @odata.nextLink を付与する"""
+    size = min(page_size, int(query.get("$top", page_size)))
+    start = int(query.get("$skiptoken", 0))
+    page = {"value": items[start:start + size]}
+    if start + size < len(items):
+        next_query = {**query, "$skiptoken": str(start + size)}
+        page["@odata.nextLink"] = f"{base_url}{path}?{urllib.parse.urlencode(next_query)}"
+    return page
+
+def route_graph(state: FakeGraphState, method: str, url: str, body: Optional[dict], base_url: str) -> Tuple[int, dict, dict]:
+    """Graphリクエスト1件の処理（戻り値: ステータス, ヘッダー, 本文）"""
+    parsed = urllib.parse.urlsplit(url)
+    path = urllib.parse.unquote(parsed.path)
+    query = dict(urllib.parse.parse_qsl(parsed.query))
+    segments = path.strip("/").split("/")
+
+    if state.should_throttle():
+        retry_after = {"Retry-After": str(state.config.retry_after_seconds)}
+        return 429, retry_after, {"error": {"code": "TooManyRequests", "message": "Injected throttling"}}
+
+    if method == "GET" and path == "/me":
+        return 200, {}, {"id": "caller-user"}
+    if method == "GET" and len(segments) == 2 and segments[0] == "users":
+        email = segments[1]
+        if email.lower().endswith(f"@{MISSING_DOMAIN}"):
+            return 404, {}, {"error": {"code": "Request_ResourceNotFound", "message": f"User {email} not found"}}
+        return 200, {}, {"id": user_id_for(email), "displayName": email.split("@")[0], "mail": email}
+    if method == "GET" and path == "/me/joinedTeams":
+        return 200, {}, page_of(state.teams, base_url, path, query, state.config.page_size)
+    if method == "GET" and len(segments) == 3 and segments[0] == "teams" and segments[2] == "channels":
+        channels = state.channels
+        match = DISPLAY_NAME_FILTER.match(query.get("$filter", ""))
+        if match:
+            channels = [c for c in channels if c["displayName"] == match.group(1).replace("''", "'")]
+        return 200, {}, page_of(channels, base_url, path, query, state.config.page_size)
+    if method == "GET" and path == "/me/chats":
+        return 200, {}, page_of([], base_url, path, query, state.config.page_size)
+    if method == "POST" and path == "/chats":
+        members = sorted(m.get("user@odata.bind", "").rsplit("/", 1)[-1].strip("')") for m in (body or {}).get("members", []))
+        return 201, {}, {"id": f"19:{'_'.join(members)}@unq.gbl.spaces", "chatType": "oneOnOne"}
+    if method == "POST" and segments[-1] == "messages" and segments[0] in ["chats", "teams"]:
+        return 201, {}, {"id": state.next_id()}
+    return 404, {}, {"error": {"code": "NotFound", "message": f"Fake Graph has no route for {method} {path}"}}
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeGraphState = None
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def do_HEAD(self):
+        self.send_json(200, {}, None)
+
+    def handle_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        path = urllib.parse.urlsplit(self.path).path
+
+        if path.endswith("/oauth2/v2.0/token"):
+            self.state.count("POST /oauth2/v2.0/token")
+            self.state.delay(self.state.config.token_latency_ms)
+            form = dict(urllib.parse.parse_qsl(raw.decode()))
+            if not form.get("refresh_token"):
+                self.send_json(400, {}, {"error": "invalid_grant"})
+                return
+            self.send_json(200, {}, {
+                "token_type": "Bearer",
+                "expires_in": 3600,
+                "access_token": f"fake-access-{self.state.next_id()}",
+                "refresh_token": f"fake-refresh-{self.state.next_id()}"
+            })
+            return
+
+        if not path.startswith("/v1.0/"):
+            self.send_json(404, {}, {"error": {"code": "NotFound", "message": path}})
+            return
+
+        base_url = f"http://{self.headers.get('Host')}/v1.0"
+        graph_url = self.path[len("/v1.0"):]
+        body = json.loads(raw) if raw else None
+        self.state.count(f"{self.command} {endpoint_template(urllib.parse.unquote(urllib.parse.urlsplit(graph_url).path))}")
+        self.state.delay(self.state.config.latency_ms)
+
+        if self.command == "POST" and graph_url == "/$batch":
+            responses = []
+            for sub in (body or {}).get("requests", []):
+                status, headers, sub_body = route_graph(self.state, sub["method"], sub["url"], sub.get("body"), base_url)
+                responses.append({"id": sub["id"], "status": status, "headers": headers, "body": sub_body})
+            self.send_json(200, {}, {"responses": responses})
+            return
+
+        status, headers, response_body = route_graph(self.state, self.command, graph_url, body, base_url)
+        self.send_json(status, headers, response_body)
+
+    def send_json(self, status: int, headers: dict, body: Optional[dict]):
+        data = json.dumps(body, ensure_ascii=False).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_graph(config: FakeGraphConfig, host: str = "127.0.0.1", port: int = 0) -> Tuple[ThreadingHTTPServer, FakeGraphState]:
+    """バックグラウンドスレッドで起動（server.shutdown() で停止）"""
+    state = FakeGraphState(config)
+    handler = type("BoundFakeGraphHandler", (FakeGraphHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+def base_urls(server: ThreadingHTTPServer) -> Dict[str, str]:
+    """teamsapi に設定する環境変数（GRAPH_API_BASE_URL / LOGIN_BASE_URL）"""
+    host, port = server.server_address[:2]
+    return {"GRAPH_API_BASE_URL": f"http://{host}:{port}/v1.0", "LOGIN_BASE_URL": f"http://{host}:{port}"}
+
+# ========== エントリーポイント ==========
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Fake Microsoft Graph and token endpoint")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--token-latency-ms", type=float, default=80.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+
+    config = FakeGraphConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, token_latency_ms=args.token_latency_ms,
+                             throttle_rate=args.throttle_rate, page_size=args.page_size)
+    server, state = start_fake_graph(config, args.host, args.port)
+    for name, value in base_urls(server).items():
+        print(f"{name}={value}")
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        print(json.dumps(state.snapshot(), ensure_ascii=False, indent=2))
+    finally:
+        server.shutdown()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import re
+import threading
+import time
+from typing import Dict, List
+
+from emf_metrics import emit_metrics
+
+# ========== 外部API呼び出しの記録・集計 ==========
+# 1呼び出し（Lambda invocation）内の外部API呼び出しを、IDを {id} に置き換えた
+# エンドポイントテンプレート単位で記録し、終了時にEMFメトリクスとしてまとめて出力する。
+#   call_log = CallLog()
+#   call_log.start()
+#   call_log.record("GET", "/users/a@example.com", 200, attempts=1, duration_ms=42.0, response_bytes=512)
+# JSONバッチのサブリクエストは batched=True で記録する（HTTP往復は送信したバッチ側で記録される）。
+#   emit_call_metrics("TeamsApi", "Graph", call_log.end(), request_id)
+# 記録は start〜end の間のみ行う（ハンドラー外からの直接呼び出しは記録しない）。
+# ===============================
+
+# EMF仕様上の1メトリクスあたりの値の上限（超える分は別レコードに分けて出力）
+MAX_VALUES_PER_METRIC = 100
+
+# 英字・ドットのみのセグメント（users, messages, $batch 等）以外はIDとみなす
+_LITERAL_SEGMENT = re.compile(r"^\$?[A-Za-z][A-Za-z.]*$")
+
+def endpoint_template(endpoint: str) -> str:
+    """エンドポイントのID部分を {id} に置き換え、クエリ文字列を除いたテンプレートを返す
+
+    例: /chats/19:abc@thread.v2/messages → /chats/{id}/messages
+    """
+    path = endpoint.split("?", 1)[0]
+    segments = [
+        segment if not segment or _LITERAL_SEGMENT.match(segment) else "{id}"
+        for segment in path.split("/")
+    ]
+    return "/".join(segments) or "/"
+
+class CallLog:
+    """1呼び出し内の外部API呼び出しの記録（スレッド間で共有）"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = False
+        self._started = 0.0
+        self._calls: List[dict] = []
+
+    def start(self) -> None:
+        with self._lock:
+            self._active = True
+            self._started = time.perf_counter()
+            self._calls = []
+
+    def record(self, method: str, endpoint: str, status: int, attempts: int,
+               duration_ms: float, response_bytes: int, batched: bool = False) -> None:
+        """1回の呼び出し（再試行を含む）を記録（start 前・end 後は何もしない）"""
+        finished = time.perf_counter()
+        with self._lock:
+            if not self._active:
+                return
+            self._calls.append({
+                "method": method,
+                "endpoint": endpoint_template(endpoint),
+                "status": status,
+                "attempts": attempts,
+                "started_ms": round(max(0.0, (finished - self._started) * 1000 - duration_ms), 1),
+                "duration_ms": round(duration_ms, 1),
+                "response_bytes": response_bytes,
+                "batched": batched
+            })
+
+    def end(self) -> List[dict]:
+        """記録を終了し、呼び出し一覧（開始順）を返す"""
+        with self._lock:
+            self._active = False
+            calls, self._calls = self._calls, []
+        return sorted(calls, key=lambda call: call["started_ms"])
+
+def summarize_calls(calls: List[dict]) -> Dict[str, dict]:
+    """"METHOD テンプレート" 単位で呼び出し数・エラー数・再試行数・所要時間/サイズの分布を集計"""
+    summary: Dict[str, dict] = {}
+    for call in calls:
+        key = f"{call['method']} {call['endpoint']}"
+        item = summary.setdefault(key, {"calls": 0, "errors": 0, "retries": 0, "latency_ms": [], "response_bytes": []})
+        item["calls"] += 1
+        item["errors"] += int(not 200 <= call["status"] < 300)
+        item["retries"] += max(0, call["attempts"] - 1)
+        item["latency_ms"].append(call["duration_ms"])
+        item["response_bytes"].append(call["response_bytes"])
+    return summary
+
+def emit_call_metrics(namespace: str, api: str, calls: List[dict], request_id: str) -> None:
+    """集計結果をエンドポイント単位のEMFレコードとして出力
+
+    所要時間・レスポンスサイズは値のリストとして出力し、CloudWatch側で分布
+    （p50/p99等のパーセンタイル）として集計させる。
+    """
+    for endpoint, item in summarize_calls(calls).items():
+        dimensions = {"Api": api, "Endpoint": endpoint}
+        for offset in range(0, item["calls"], MAX_VALUES_PER_METRIC):
+            metrics = {
+                "CallLatency": (item["latency_ms"][offset:offset + MAX_VALUES_PER_METRIC], "Milliseconds"),
+                "CallResponseBytes": (item["response_bytes"][offset:offset + MAX_VALUES_PER_METRIC], "Bytes")
+            }
+            if offset == 0:
+                metrics.update({
+                    "Calls": (item["calls"], "Count"),
+                    "CallErrors": (item["errors"], "Count"),
+                    "CallRetries": (item["retries"], "Count")
+                })
+            emit_metrics(namespace, dimensions, metrics, properties={"RequestId": request_id})
@@ -0,0 +1,14 @@
+import sys
+import pytest
+
+@pytest.fixture(autouse=True)
+def reset_teamsapi_caches():
+    """teamsapiのモジュール内キャッシュをテスト間で共有しない
+
+    teamsapiはウォームコンテナ向けにトークン等をモジュール変数で保持するため、
+    各テストの前に破棄して呼び出し回数の検証が他テストの影響を受けないようにします。
+    """
+    teamsapi = sys.modules.get("teamsapi")
+    if teamsapi is not None:
+        teamsapi.reset_caches()
+    yield
@@ -0,0 +1,89 @@
+import json
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+# ========== CloudWatch Embedded Metric Format ==========
+# 標準出力にEMF形式のJSONを1行で出力すると、CloudWatch Logsが
+# 自動でメトリクスとして取り込むため、PutMetricData等のAPI呼び出しは不要。
+# テスト時は set_metrics_sink(LocalMetricsSink()) で出力先を差し替える。
+# ===============================
+
+# EMF仕様上の1レコードあたりのメトリクス上限
+MAX_METRICS_PER_RECORD = 100
+
+MetricValue = Union[int, float, List[float]]
+
+_sink_lock = threading.Lock()
+
+def stdout_sink(record: dict) -> None:
+    """EMFレコードを標準出力へ1行JSONとして出力"""
+    line = json.dumps(record, ensure_ascii=False)
+    with _sink_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+class LocalMetricsSink:
+    """EMFレコードをメモリに保持するシンク（テスト・ローカル実行用）"""
+    def __init__(self):
+        self.records: List[dict] = []
+        self.lock = threading.Lock()
+
+    def __call__(self, record: dict) -> None:
+        with self.lock:
+            self.records.append(record)
+
+    def values(self, metric_name: str, **dimensions) -> List[MetricValue]:
+        """指定メトリクスの値一覧（ディメンションで絞り込み可能）"""
+        return [
+            record[metric_name]
+            for record in self.records
+            if metric_name in record and all(record.get(k) == v for k, v in dimensions.items())
+        ]
+
+_sink: Callable[[dict], None] = stdout_sink
+
+def set_metrics_sink(sink: Optional[Callable[[dict], None]]) -> Callable[[dict], None]:
+    """出力先を差し替え、直前のシンクを返す（Noneで標準出力に戻す）"""
+    global _sink
+    previous = _sink
+    _sink = sink or stdout_sink
+    return previous
+
+def build_emf_record(namespace: str, dimensions: Dict[str, str], metrics: Dict[str, tuple],
+                     properties: Optional[dict] = None, timestamp_ms: Optional[int] = None) -> dict:
+    """EMFレコード作成
+
+    Args:
+        namespace: CloudWatchメトリクス名前空間
+        dimensions: ディメンション名と値
+        metrics: メトリクス名 -> (値, 単位)。値はリストも可（分布として集計される）
+        properties: メトリクス化しない検索用プロパティ（request_id等）
+    """
+    if len(metrics) > MAX_METRICS_PER_RECORD:
+        raise ValueError(f"Too many metrics in one record: {len(metrics)}")
+
+    record = dict(properties or {})
+    record.update({name: str(value) for name, value in dimensions.items()})
+    metric_definitions = []
+    for name, (value, unit) in metrics.items():
+        record[name] = value
+        metric_definitions.append({"Name": name, "Unit": unit})
+
+    record["_aws"] = {
+        "Timestamp": timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+        "CloudWatchMetrics": [{
+            "Namespace": namespace,
+            "Dimensions": [list(dimensions.keys())],
+            "Metrics": metric_definitions
+        }]
+    }
+    return record
+
+def emit_metrics(namespace: str, dimensions: Dict[str, str], metrics: Dict[str, tuple],
+                 properties: Optional[dict] = None) -> dict:
+    """EMFレコードを作成して現在のシンクへ出力"""
+    record = build_emf_record(namespace, dimensions, metrics, properties)
+    _sink(record)
+    return record
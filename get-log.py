@@ -1,12 +1,9 @@
-import boto3
 import json
 import os
 import tempfile
-import paramiko
 import concurrent.futures
 import threading
 import uuid
-import pyzipper
 import urllib3
 import logging
 import re
@@ -16,9 +13,11 @@ from email.parser import BytesParser
 from io import StringIO
 import base64
 import traceback
-from boto3.s3.transfer import TransferConfig
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any
 import time  # 追加
+from emf_metrics import emit_metrics
+from lambda_profiler import profile_handler
+from lazy_clients import LazyClient
 
 # ログ設定
 logger = logging.getLogger(__name__)
@@ -27,9 +26,10 @@ logger.setLevel(logging.INFO)
 # urllib3設定（タイムアウト付き）
 http = urllib3.PoolManager(timeout=urllib3.Timeout(30))
 
-# AWS クライアント設定
-ssm = boto3.client('ssm', region_name=os.environ.get('REGION'))
-s3 = boto3.client('s3')
+# AWS クライアント設定（boto3のimport・クライアント作成は初回のAPI呼び出しまで遅延）
+# paramiko・pyzipper も使用する関数内でimportし、入力エラー等の経路では読み込まない
+ssm = LazyClient('ssm', region_name=os.environ.get('REGION'))
+s3 = LazyClient('s3')
 
 # 環境変数
 BUCKET_NAME = os.environ.get('BUCKET_NAME')
@@ -37,18 +37,34 @@ STORAGE_GATEWAY_ROLE_ARN = os.environ.get('STORAGE_GATEWAY_ROLE_ARN')
 FILE_SHARE_ARN = os.environ.get('FILE_SHARE_ARN')
 STORAGE_GATEWAY_SHARE_PATH = os.environ.get('STORAGE_GATEWAY_SHARE_PATH')
 TEAMS_API_URL = os.environ.get('TEAMS_API_URL')
+# trueの場合はTeams APIへ非同期送信（202受付）を依頼し、Graph送信完了を待たない
+TEAMS_ASYNC_DELIVERY = os.environ.get('TEAMS_ASYNC_DELIVERY', 'false').lower() == 'true'
+# trueの場合は申請者DM・チャンネル通知をTeams APIの一括送信（mode 4）で1回の呼び出しにまとめる
+TEAMS_BATCH_DELIVERY = os.environ.get('TEAMS_BATCH_DELIVERY', 'false').lower() == 'true'
 ERROR_NOTIFICATION_TEAM_NAME = os.environ.get('ERROR_NOTIFICATION_TEAM_NAME')
 ERROR_NOTIFICATION_CHANNEL_NAME = os.environ.get('ERROR_NOTIFICATION_CHANNEL_NAME')
 INTERNAL_DOMAIN = os.environ.get('INTERNAL_DOMAIN', 'intra.sbilife.co.jp')
 SD_TEAM_EMAIL = os.environ.get('SD_TEAM_EMAIL', 'sd-team@example.com')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'GetLogApi')
 
-# S3転送設定
-transfer_config = TransferConfig(
-    multipart_threshold=1024 * 25,
-    max_concurrency=2,
-    multipart_chunksize=1024 * 25,
-    use_threads=True
-)
+# メトリクス共通情報（リクエスト単位で lambda_handler が設定）
+metrics_context = {}
+
+# S3転送設定（TransferConfig は boto3 の読み込み後に get_transfer_config で作成）
+TRANSFER_CONFIG_OPTIONS = {
+    "multipart_threshold": 1024 * 25,
+    "max_concurrency": 2,
+    "multipart_chunksize": 1024 * 25,
+    "use_threads": True
+}
+_transfer_config = None
+
+# SFTP帯域制御時の読み込みチャンクサイズ
+RATE_LIMITED_READ_CHUNK_SIZE = 256 * 1024
+
+# /tmp 使用量の上限（10GBの80%）と、容量待ちのサーバーがいないか確認する間隔
+LAMBDA_STORAGE_LIMIT_BYTES = 8 * 1024 * 1024 * 1024
+STORAGE_WAIT_POLL_SECONDS = 0.5
 
 # ========== 例外クラス ==========
 
@@ -59,8 +75,106 @@ class APIException(Exception):
         self.message = message
         super().__init__(self.message)
 
+# ========== 帯域制御 ==========
+
+class TokenBucket:
+    """トークンバケット方式の帯域制御（スレッドセーフ）
+
+    1秒あたりrate_bytesまで転送を許可する。バケットが空の場合は
+    不足分が補充されるまで呼び出し元スレッドを待機させる。
+    """
+    def __init__(self, rate_bytes: int, capacity_bytes: Optional[int] = None):
+        if rate_bytes <= 0:
+            raise ValueError("rate_bytes must be positive")
+        self.rate_bytes = float(rate_bytes)
+        self.capacity_bytes = float(capacity_bytes or rate_bytes)
+        self.tokens = self.capacity_bytes
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount: int) -> float:
+        """指定バイト数を消費し、必要に応じて待機する（待機秒数を返す）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity_bytes, self.tokens + (now - self.updated_at) * self.rate_bytes)
+            self.updated_at = now
+            # 先に予約して不足分は待機で返済する（後続スレッドも公平に待機する）
+            self.tokens -= amount
+            wait_seconds = -self.tokens / self.rate_bytes if self.tokens < 0 else 0.0
+
+        if wait_seconds > 0:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+def create_token_bucket(rate_bytes: Optional[int]) -> Optional[TokenBucket]:
+    """設定値からトークンバケットを生成（未設定・0以下は制限なし）"""
+    if not rate_bytes or int(rate_bytes) <= 0:
+        return None
+    return TokenBucket(int(rate_bytes))
+
+# ========== /tmp 容量制御 ==========
+
+class StorageBudget:
+    """並列ダウンロードで共有する /tmp 容量の予約（スレッドセーフ）
+
+    各サーバーはダウンロード前に必要バイト数を予約し、空きが出るまで待機する。
+    予約はチケット（サーバー定義順の番号）順にのみ許可するため、先のサーバーが
+    後のサーバーの予約に押し出されて待ち続けることはない。
+    上限を超える予約は上限に切り詰め、他の予約が全て解放されるまで待たせる。
+    """
+    def __init__(self, limit_bytes: int):
+        self.limit_bytes = max(0, int(limit_bytes))
+        self.used_bytes = 0
+        self.reserved = {}
+        self.next_ticket = 0
+        self.waiting = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def reserve(self, ticket: int, amount: int) -> int:
+        """チケットの順番かつ空きがあるまで待機して予約する（予約したバイト数を返す）"""
+        amount = min(max(0, int(amount)), self.limit_bytes)
+        with self.condition:
+            self.waiting += 1
+            try:
+                while not self.closed and (ticket != self.next_ticket or self.used_bytes + amount > self.limit_bytes):
+                    self.condition.wait()
+            finally:
+                self.waiting -= 1
+            if self.closed:
+                raise APIException(500, "ストレージ容量の予約が中断されました")
+            self.reserved[ticket] = amount
+            self.used_bytes += amount
+            self.next_ticket += 1
+            self.condition.notify_all()
+            return amount
+
+    def update(self, ticket: int, amount: int) -> None:
+        """予約量を実際の使用量に置き換える（待機しない）"""
+        with self.condition:
+            self.used_bytes += amount - self.reserved.get(ticket, 0)
+            self.reserved[ticket] = amount
+            self.condition.notify_all()
+
+    def release(self, ticket: int) -> None:
+        """予約の解放"""
+        with self.condition:
+            self.used_bytes -= self.reserved.pop(ticket, 0)
+            self.condition.notify_all()
+
+    def has_waiters(self) -> bool:
+        with self.condition:
+            return self.waiting > 0
+
+    def close(self) -> None:
+        """待機中の予約を全て中断する（処理中断時）"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
 # ========== 1. メインハンドラー ==========
 
+@profile_handler
 def lambda_handler(event, context):
     """AWS Lambda メインハンドラー関数"""
     approver_email = None
@@ -69,6 +183,8 @@ def lambda_handler(event, context):
     
     try:
         logger.info("REQUEST_START")
+        metrics_context.clear()
+        metrics_context['request_id'] = getattr(context, 'aws_request_id', None)
         
         validate_environment_variables()
         
@@ -83,6 +199,7 @@ def lambda_handler(event, context):
         mail_body = get_email_body_from_s3(message_id)
         body = extract_json_from_email(mail_body)
         system = body['system']
+        metrics_context['system'] = system
         applicant_email = body['mail']
         from_date = datetime.strptime(body['from_date'], '%Y-%m-%d')
         to_date = datetime.strptime(body['to_date'], '%Y-%m-%d')
@@ -96,7 +213,9 @@ def lambda_handler(event, context):
         # ログ処理実行（分割対応）
         config = get_ssm_param(f"/get-log-api/config/{system}")
         storage_paths, password = process_servers_logs(
-            config.get("servers", {}), from_date, to_date, folder_name
+            config.get("servers", {}), from_date, to_date, folder_name,
+            global_max_bytes_per_sec=config.get("global_max_bytes_per_sec"),
+            max_concurrent_servers=config.get("max_concurrent_servers", 1)
         )
 
         # 成功通知（複数パス対応）
@@ -139,6 +258,28 @@ def validate_environment_variables():
     
     logger.info("ENV_VALIDATION_SUCCESS")
 
+def record_stage_metrics(stage: str, metrics: Dict[str, tuple], server: Optional[str] = None,
+                         properties: Optional[dict] = None):
+    """処理ステージ別メトリクス出力（CloudWatch EMF形式）"""
+    dimensions = {"System": metrics_context.get('system') or 'unknown', "Stage": stage}
+    if server:
+        dimensions["Server"] = server.replace(f'.{INTERNAL_DOMAIN}', '')
+
+    record_properties = {"RequestId": metrics_context.get('request_id')}
+    record_properties.update(properties or {})
+
+    try:
+        emit_metrics(METRICS_NAMESPACE, dimensions, metrics, record_properties)
+    except Exception as e:
+        # メトリクス出力失敗で本処理は止めない
+        logger.warning(f"METRICS_EMIT_ERROR - {stage}: {str(e)}")
+
+def calculate_mb_per_sec(size_bytes: int, duration_seconds: float) -> float:
+    """転送速度（MB/s）算出"""
+    if duration_seconds <= 0:
+        return 0.0
+    return size_bytes / 1024 / 1024 / duration_seconds
+
 def get_email_body_from_s3(message_id: str) -> str:
     """S3からメール本文取得"""
     try:
@@ -225,6 +366,7 @@ def get_ssh_auth(credentials: dict) -> tuple[str, dict]:
         client_cert_b64 = credentials['client_cert']
         private_key_str = base64.b64decode(client_cert_b64).decode('utf-8')
         private_key_file = StringIO(private_key_str)
+        import paramiko
         
         # PEMファイルの鍵タイプを自動判定
         try:
@@ -257,47 +399,89 @@ def get_ssh_auth(credentials: dict) -> tuple[str, dict]:
     else:
         raise ValueError("サポートされていない認証形式です")
 
-def process_servers_logs(servers: dict, from_date: datetime, to_date: datetime, folder_name: str) -> tuple[List[str], str]:
-    """全サーバーログ処理（分割対応）"""
+def process_servers_logs(servers: dict, from_date: datetime, to_date: datetime, folder_name: str,
+                         global_max_bytes_per_sec: Optional[int] = None,
+                         max_concurrent_servers: int = 1) -> tuple[List[str], str]:
+    """全サーバーログ処理（分割対応・帯域制御対応）
+
+    最大 max_concurrent_servers 台を並列にダウンロードする。各サーバーは書き込み前に
+    /tmp 容量を StorageBudget から予約し、空きが無ければ処理済みファイルを
+    分割ZIPとしてアップロード・削除して容量を空けてから続行する。
+    """
     all_downloaded_files = []
-    lambda_storage_limit = 8 * 1024 * 1024 * 1024  # 8GB（10GBの80%）
+    pending_tickets = []  # all_downloaded_files に含まれるサーバーの予約
     current_storage_usage = 0
     zip_files = []  # 作成されたZIPファイルのパスリスト
     password = str(uuid.uuid4()).replace('-', '')[:10]  # 共通パスワード
     part_number = 1
-    
+
+    # 全サーバー共通の帯域上限と /tmp 容量（前回呼び出しの残りファイル分を除く）
+    global_limiter = create_token_bucket(global_max_bytes_per_sec)
+    storage_budget = StorageBudget(LAMBDA_STORAGE_LIMIT_BYTES - get_actual_tmp_usage())
+    server_items = list(servers.items())
+    max_workers = max(1, int(max_concurrent_servers or 1))
+
+    def flush_part() -> None:
+        """処理済みファイルで分割ZIPを作成・アップロードし、容量を解放"""
+        nonlocal all_downloaded_files, pending_tickets, current_storage_usage, part_number
+        zip_path = create_part_zip(all_downloaded_files, folder_name, part_number, password)
+        storage_path = upload_zip_to_storage_gateway(zip_path, f"{folder_name}_part{part_number}")
+        zip_files.append(storage_path)
+        part_number += 1
+
+        # ストレージクリーンアップ
+        cleanup_temp_files(all_downloaded_files)
+        os.remove(zip_path)
+        all_downloaded_files = []
+        current_storage_usage = 0
+        for ticket in pending_tickets:
+            storage_budget.release(ticket)
+        pending_tickets = []
+
     try:
-        for hostname, server_info in servers.items():
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                (hostname, executor.submit(process_single_server, hostname, server_info, from_date, to_date,
+                                           global_limiter, storage_budget, ticket))
+                for ticket, (hostname, server_info) in enumerate(server_items)
+            ]
+
             try:
-                downloaded_files, storage_used = process_single_server(
-                    hostname, server_info, from_date, to_date
-                )
-                
-                # ストレージ容量チェック
-                if current_storage_usage + storage_used > lambda_storage_limit:
-                    logger.warning(f"LAMBDA_STORAGE_LIMIT_APPROACHING - Creating part {part_number}")
-                    
-                    # 現在のファイルでZIP作成・アップロード
-                    if all_downloaded_files:
-                        zip_path = create_part_zip(all_downloaded_files, folder_name, part_number, password)
-                        storage_path = upload_zip_to_storage_gateway(zip_path, f"{folder_name}_part{part_number}")
-                        zip_files.append(storage_path)
-                        part_number += 1
-                        
-                        # ストレージクリーンアップ
-                        cleanup_temp_files(all_downloaded_files)
-                        os.remove(zip_path)
-                        all_downloaded_files = []
-                        current_storage_usage = get_actual_tmp_usage()
-                
-                # 新しいファイルを追加
-                all_downloaded_files.extend(downloaded_files)
-                current_storage_usage += storage_used
-                logger.info(f"SERVER_PROCESSING_COMPLETE - {hostname}")
-                
-            except Exception as e:
-                logger.error(f"SERVER_PROCESSING_ERROR - {hostname}: {str(e)}")
-                continue
+                # 結果はサーバー定義順に集約する
+                for ticket, (hostname, future) in enumerate(futures):
+                    while True:
+                        try:
+                            downloaded_files, storage_used = future.result(timeout=STORAGE_WAIT_POLL_SECONDS)
+                            break
+                        except concurrent.futures.TimeoutError:
+                            # 容量待ちのサーバーがあれば処理済みファイルを先に送り出す
+                            if storage_budget.has_waiters() and all_downloaded_files:
+                                logger.warning(f"LAMBDA_STORAGE_LIMIT_APPROACHING - Creating part {part_number}")
+                                flush_part()
+                        except Exception as e:
+                            logger.error(f"SERVER_PROCESSING_ERROR - {hostname}: {str(e)}")
+                            storage_budget.release(ticket)
+                            downloaded_files = None
+                            break
+                    if downloaded_files is None:
+                        continue
+
+                    storage_budget.update(ticket, storage_used)
+
+                    # ストレージ容量チェック（予約時の見積もりより増えていた場合）
+                    if all_downloaded_files and current_storage_usage + storage_used > storage_budget.limit_bytes:
+                        logger.warning(f"LAMBDA_STORAGE_LIMIT_APPROACHING - Creating part {part_number}")
+                        flush_part()
+
+                    # 新しいファイルを追加
+                    all_downloaded_files.extend(downloaded_files)
+                    pending_tickets.append(ticket)
+                    current_storage_usage += storage_used
+                    logger.info(f"SERVER_PROCESSING_COMPLETE - {hostname}")
+            except Exception:
+                # 容量待ちのワーカーを解放してから終了を待つ
+                storage_budget.close()
+                raise
 
         # 残りのファイルで最終ZIP作成
         if all_downloaded_files:
@@ -320,17 +504,40 @@ def process_servers_logs(servers: dict, from_date: datetime, to_date: datetime,
         cleanup_temp_files(all_downloaded_files)
         raise
 
-def process_single_server(hostname: str, server_info: dict, from_date: datetime, to_date: datetime) -> tuple[List[dict], int]:
-    """単一サーバーログ処理"""
+def process_single_server(hostname: str, server_info: dict, from_date: datetime, to_date: datetime,
+                          global_limiter: Optional[TokenBucket] = None,
+                          storage_budget: Optional[StorageBudget] = None, ticket: int = 0) -> tuple[List[dict], int]:
+    """単一サーバーログ処理
+
+    storage_budget 指定時は、ダウンロード開始前に対象ファイルの合計サイズを予約する。
+    予約前に失敗した場合も、後続サーバーが予約できるよう0バイトで順番を進める。
+    """
     port = server_info.get('port', 22)
     log_paths = server_info.get('log_paths', [])
 
-    credentials = get_credentials_from_ssm(hostname)
-    username, ssh_auth = get_ssh_auth(credentials)
-    fqdn_hostname = f"{hostname}.{INTERNAL_DOMAIN}"
+    # サーバー単位の帯域上限と全体上限を両方適用
+    rate_limiters = [
+        limiter for limiter in (create_token_bucket(server_info.get('max_bytes_per_sec')), global_limiter)
+        if limiter
+    ]
+
+    reserved = False
+    def reserve_storage(amount: int) -> None:
+        nonlocal reserved
+        if storage_budget is not None and not reserved:
+            reserved = True
+            storage_budget.reserve(ticket, amount)
 
-    expanded_paths = expand_log_paths(log_paths, from_date, to_date)
-    return download_logs_from_server(fqdn_hostname, port, username, ssh_auth, expanded_paths)
+    try:
+        credentials = get_credentials_from_ssm(hostname)
+        username, ssh_auth = get_ssh_auth(credentials)
+        fqdn_hostname = f"{hostname}.{INTERNAL_DOMAIN}"
+
+        expanded_paths = expand_log_paths(log_paths, from_date, to_date)
+        return download_logs_from_server(fqdn_hostname, port, username, ssh_auth, expanded_paths, rate_limiters,
+                                         reserve_storage)
+    finally:
+        reserve_storage(0)
 
 def expand_log_paths(log_paths: List[str], from_date: datetime, to_date: datetime) -> List[str]:
     """ログパス展開"""
@@ -352,8 +559,16 @@ def expand_log_paths(log_paths: List[str], from_date: datetime, to_date: datetim
     
     return expanded_paths
 
-def download_logs_from_server(hostname: str, port: int, username: str, ssh_auth: dict, log_paths: List[str]) -> tuple[List[dict], int]:
-    """サーバーからログダウンロード（リトライ対応）"""
+def download_logs_from_server(hostname: str, port: int, username: str, ssh_auth: dict, log_paths: List[str],
+                              rate_limiters: Optional[List[TokenBucket]] = None,
+                              reserve_storage: Optional[Callable[[int], None]] = None) -> tuple[List[dict], int]:
+    """サーバーからログダウンロード（リトライ対応）
+
+    reserve_storage 指定時は、接続後に対象ファイルの合計サイズを渡して呼び出し、
+    /tmp の容量が確保されるまで待機してからダウンロードする。
+    """
+    import paramiko
+    
     downloaded_files = []
     total_storage_used = 0
     max_retries = 3
@@ -364,6 +579,7 @@ def download_logs_from_server(hostname: str, port: int, username: str, ssh_auth:
             with paramiko.SSHClient() as ssh:
                 ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                 
+                connect_started = time.perf_counter()
                 if 'password' in ssh_auth:
                     ssh.connect(hostname=hostname, port=port, username=username, 
                               password=ssh_auth['password'], timeout=30)
@@ -372,11 +588,20 @@ def download_logs_from_server(hostname: str, port: int, username: str, ssh_auth:
                               pkey=ssh_auth['pkey'], timeout=30)
                 
                 logger.info(f"SSH_CONNECTION_SUCCESS - {hostname} (Attempt {attempt + 1})")
+                record_stage_metrics(
+                    "SshConnect",
+                    {"SshConnectTime": ((time.perf_counter() - connect_started) * 1000, "Milliseconds")},
+                    server=hostname,
+                    properties={"Attempt": attempt + 1}
+                )
                 
+                if reserve_storage:
+                    reserve_storage(get_remote_total_size(ssh, log_paths))
+
                 max_workers = max(1, min(2, len(log_paths)))
                 with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
                     futures = {
-                        executor.submit(download_single_file_with_retry, ssh, hostname, path): path
+                        executor.submit(download_single_file_with_retry, ssh, hostname, path, rate_limiters): path
                         for path in log_paths
                     }
                     
@@ -407,7 +632,19 @@ def download_logs_from_server(hostname: str, port: int, username: str, ssh_auth:
     
     return downloaded_files, total_storage_used
 
-def download_single_file_with_retry(ssh, hostname: str, path: str) -> dict:
+def get_remote_total_size(ssh, log_paths: List[str]) -> int:
+    """ダウンロード対象ファイルの合計サイズ（存在しないファイルは0として数える）"""
+    total_size = 0
+    with ssh.open_sftp() as sftp:
+        for path in log_paths:
+            try:
+                total_size += sftp.stat(path).st_size or 0
+            except IOError:
+                continue
+    return total_size
+
+def download_single_file_with_retry(ssh, hostname: str, path: str,
+                                    rate_limiters: Optional[List[TokenBucket]] = None) -> dict:
     """単一ファイルダウンロード（リトライ対応）"""
     max_retries = 3
     retry_delay = 2  # 秒
@@ -419,8 +656,23 @@ def download_single_file_with_retry(ssh, hostname: str, path: str) -> dict:
         
         try:
             with ssh.open_sftp() as sftp:
-                sftp.get(path, tmp_filename)
+                download_started = time.perf_counter()
+                if rate_limiters:
+                    download_file_with_rate_limit(sftp, path, tmp_filename, rate_limiters)
+                else:
+                    sftp.get(path, tmp_filename)
                 file_size = os.path.getsize(tmp_filename)
+                download_seconds = time.perf_counter() - download_started
+                record_stage_metrics(
+                    "Download",
+                    {
+                        "DownloadBytes": (file_size, "Bytes"),
+                        "DownloadDuration": (download_seconds * 1000, "Milliseconds"),
+                        "DownloadThroughput": (calculate_mb_per_sec(file_size, download_seconds), "Megabytes/Second")
+                    },
+                    server=hostname,
+                    properties={"File": path, "Attempt": attempt + 1, "RateLimited": bool(rate_limiters)}
+                )
                 
                 return {
                     'original_path': path,
@@ -445,13 +697,34 @@ def download_single_file_with_retry(ssh, hostname: str, path: str) -> dict:
     # この行には到達しないはずだが、型チェック用
     raise APIException(500, "予期しないエラー")
 
+def download_file_with_rate_limit(sftp, remote_path: str, local_path: str, rate_limiters: List[TokenBucket]) -> int:
+    """帯域制御付きSFTPダウンロード
+
+    sftp.get()は先読みで帯域を使い切るため、チャンク単位で読み込み
+    各トークンバケットから転送量を消費してから書き込む。
+    """
+    total_bytes = 0
+    with sftp.open(remote_path, 'rb') as remote_file, open(local_path, 'wb') as local_file:
+        while True:
+            chunk = remote_file.read(RATE_LIMITED_READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            for limiter in rate_limiters:
+                limiter.consume(len(chunk))
+            local_file.write(chunk)
+            total_bytes += len(chunk)
+    return total_bytes
+
 def create_part_zip(downloaded_files: List[dict], folder_name: str, part_number: int, password: str) -> str:
     """分割ZIP作成"""
+    import pyzipper
+    
     try:
         zip_name = f"{folder_name}_part{part_number}"
         zip_path = f"/tmp/{zip_name}.zip"
         
         logger.info(f"PART_ZIP_CREATION_START - Part:{part_number} Files:{len(downloaded_files)}")
+        compress_started = time.perf_counter()
         
         with pyzipper.AESZipFile(zip_path, 'w', compression=pyzipper.ZIP_DEFLATED, encryption=pyzipper.WZ_AES) as zf:
             zf.setpassword(password.encode('utf-8'))
@@ -460,6 +733,7 @@ def create_part_zip(downloaded_files: List[dict], folder_name: str, part_number:
         
         zip_size = os.path.getsize(zip_path)
         logger.info(f"PART_ZIP_CREATION_SUCCESS - Part:{part_number} Size:{zip_size/1024/1024:.1f}MB")
+        record_compression_metrics(downloaded_files, zip_size, time.perf_counter() - compress_started, part_number)
         
         return zip_path
         
@@ -469,10 +743,13 @@ def create_part_zip(downloaded_files: List[dict], folder_name: str, part_number:
 
 def create_single_zip(downloaded_files: List[dict], folder_name: str, password: str) -> str:
     """単一ZIP作成"""
+    import pyzipper
+    
     try:
         zip_path = f"/tmp/{folder_name}.zip"
         
         logger.info(f"SINGLE_ZIP_CREATION_START - Files:{len(downloaded_files)}")
+        compress_started = time.perf_counter()
         
         with pyzipper.AESZipFile(zip_path, 'w', compression=pyzipper.ZIP_DEFLATED, encryption=pyzipper.WZ_AES) as zf:
             zf.setpassword(password.encode('utf-8'))
@@ -481,6 +758,7 @@ def create_single_zip(downloaded_files: List[dict], folder_name: str, password:
         
         zip_size = os.path.getsize(zip_path)
         logger.info(f"SINGLE_ZIP_CREATION_SUCCESS - Size:{zip_size/1024/1024:.1f}MB")
+        record_compression_metrics(downloaded_files, zip_size, time.perf_counter() - compress_started)
         
         return zip_path
         
@@ -488,13 +766,48 @@ def create_single_zip(downloaded_files: List[dict], folder_name: str, password:
         logger.error(f"SINGLE_ZIP_CREATION_ERROR - {str(e)}")
         raise APIException(500, f"ZIP作成に失敗しました: {str(e)}")
 
+def record_compression_metrics(downloaded_files: List[dict], zip_size: int, duration_seconds: float,
+                               part_number: Optional[int] = None):
+    """ZIP圧縮メトリクス出力"""
+    source_size = sum(file_info.get('file_size', 0) for file_info in downloaded_files)
+    record_stage_metrics(
+        "Compress",
+        {
+            "CompressionTime": (duration_seconds * 1000, "Milliseconds"),
+            "SourceBytes": (source_size, "Bytes"),
+            "ZipBytes": (zip_size, "Bytes"),
+            "ZipSizeRatio": (zip_size / source_size if source_size else 0.0, "None")
+        },
+        properties={"Files": len(downloaded_files), "Part": part_number}
+    )
+
+def get_transfer_config():
+    """S3転送設定の取得（初回のみ作成）"""
+    global _transfer_config
+    if _transfer_config is None:
+        from boto3.s3.transfer import TransferConfig
+        _transfer_config = TransferConfig(**TRANSFER_CONFIG_OPTIONS)
+    return _transfer_config
+
 def upload_zip_to_storage_gateway(zip_file_path: str, zip_name: str) -> str:
     """ZIPファイルをStorage Gatewayにアップロード"""
     try:
         s3_key = f"logs/{zip_name}.zip"
         logger.info(f"S3_UPLOAD_START - {s3_key}")
         
-        s3.upload_file(zip_file_path, BUCKET_NAME, s3_key, Config=transfer_config)
+        upload_started = time.perf_counter()
+        s3.upload_file(zip_file_path, BUCKET_NAME, s3_key, Config=get_transfer_config())
+        upload_seconds = time.perf_counter() - upload_started
+        upload_size = os.path.getsize(zip_file_path)
+        record_stage_metrics(
+            "Upload",
+            {
+                "UploadBytes": (upload_size, "Bytes"),
+                "UploadDuration": (upload_seconds * 1000, "Milliseconds"),
+                "UploadThroughput": (calculate_mb_per_sec(upload_size, upload_seconds), "Megabytes/Second")
+            },
+            properties={"S3Key": s3_key}
+        )
         
         logger.info(f"S3_UPLOAD_SUCCESS - {s3_key}")
         
@@ -575,24 +888,29 @@ def cleanup_temp_files(downloaded_files: List[dict]):
 def send_success_notifications(request_info: dict, approver_email: str, storage_paths: List[str], password: str):
     """成功通知送信（複数パス対応）"""
     try:
-        send_applicant_dm(request_info['mail'], storage_paths, password, request_info)
-        send_channel_notification(request_info, approver_email)
+        if TEAMS_BATCH_DELIVERY:
+            send_teams_messages_batch([
+                build_applicant_dm_data(request_info['mail'], storage_paths, password, request_info),
+                build_channel_notification_data(request_info, approver_email)
+            ])
+        else:
+            send_applicant_dm(request_info['mail'], storage_paths, password, request_info)
+            send_channel_notification(request_info, approver_email)
         logger.info("SUCCESS_NOTIFICATIONS_SENT")
     except Exception as e:
         logger.error(f"SUCCESS_NOTIFICATION_ERROR - {str(e)}")
         raise APIException(502, f"通知送信に失敗しました: {str(e)}")
 
-def send_applicant_dm(applicant_email: str, storage_paths: List[str], password: str, request_info: dict):
-    """申請者DM送信（複数パス対応）"""
-    try:
-        # ファイルパス部分を動的生成
-        if len(storage_paths) == 1:
-            file_paths_html = f"<tr><td><strong>ファイルパス</strong></td><td>{storage_paths[0]}</td></tr>"
-        else:
-            paths_list = "<br>".join([f"Part {i+1}: {path}" for i, path in enumerate(storage_paths)])
-            file_paths_html = f"<tr><td><strong>ファイルパス<br>（分割ファイル）</strong></td><td>{paths_list}</td></tr>"
-        
-        message_html = f"""
+def build_applicant_dm_data(applicant_email: str, storage_paths: List[str], password: str, request_info: dict) -> dict:
+    """申請者DM（複数パス対応）のTeams APIデータ作成"""
+    # ファイルパス部分を動的生成
+    if len(storage_paths) == 1:
+        file_paths_html = f"<tr><td><strong>ファイルパス</strong></td><td>{storage_paths[0]}</td></tr>"
+    else:
+        paths_list = "<br>".join([f"Part {i+1}: {path}" for i, path in enumerate(storage_paths)])
+        file_paths_html = f"<tr><td><strong>ファイルパス<br>（分割ファイル）</strong></td><td>{paths_list}</td></tr>"
+    
+    message_html = f"""
 <p><strong>ログ取得が完了しました</strong></p>
 <table border="1" style="border-collapse: collapse; width: 100%;">
 <tr><td><strong>申請システム</strong></td><td>{request_info['system']}</td></tr>
@@ -608,14 +926,19 @@ def send_applicant_dm(applicant_email: str, storage_paths: List[str], password:
 {"<li><strong>※ 分割ファイルの場合、すべてのファイルをダウンロードしてください</strong></li>" if len(storage_paths) > 1 else ""}
 </ol>
 """
-        
-        teams_data = {
-            "mode": 1,
-            "email_addresses": [applicant_email],
-            "message_text": message_html,
-            "content_type": "html",
-            "mentions": []
-        }
+    
+    return {
+        "mode": 1,
+        "email_addresses": [applicant_email],
+        "message_text": message_html,
+        "content_type": "html",
+        "mentions": []
+    }
+
+def send_applicant_dm(applicant_email: str, storage_paths: List[str], password: str, request_info: dict):
+    """申請者DM送信（複数パス対応）"""
+    try:
+        teams_data = build_applicant_dm_data(applicant_email, storage_paths, password, request_info)
         
         call_teams_api(teams_data)
         logger.info(f"APPLICANT_DM_SENT - {applicant_email} - Files:{len(storage_paths)}")
@@ -624,10 +947,9 @@ def send_applicant_dm(applicant_email: str, storage_paths: List[str], password:
         logger.error(f"APPLICANT_DM_ERROR - {str(e)}")
         raise
 
-def send_channel_notification(request_info: dict, approver_email: str):
-    """チャンネル通知送信"""
-    try:
-        message_html = f"""
+def build_channel_notification_data(request_info: dict, approver_email: str) -> dict:
+    """チャンネル通知のTeams APIデータ作成"""
+    message_html = f"""
 <p><strong>ログ取得申請が完了しました</strong></p>
 <table border="1" style="border-collapse: collapse; width: 100%;">
 <tr><td><strong>申請者</strong></td><td>{request_info['mail']}</td></tr>
@@ -637,16 +959,21 @@ def send_channel_notification(request_info: dict, approver_email: str):
 <tr><td><strong>承認者</strong></td><td>{approver_email}</td></tr>
 </table>
 """
-        
-        teams_data = {
-            "mode": 2,
-            "team_name": ERROR_NOTIFICATION_TEAM_NAME,
-            "channel_name": ERROR_NOTIFICATION_CHANNEL_NAME,
-            "message_text": message_html,
-            "content_type": "html",
-            "subject": "ログ取得申請完了通知",
-            "mentions": []
-        }
+    
+    return {
+        "mode": 2,
+        "team_name": ERROR_NOTIFICATION_TEAM_NAME,
+        "channel_name": ERROR_NOTIFICATION_CHANNEL_NAME,
+        "message_text": message_html,
+        "content_type": "html",
+        "subject": "ログ取得申請完了通知",
+        "mentions": []
+    }
+
+def send_channel_notification(request_info: dict, approver_email: str):
+    """チャンネル通知送信"""
+    try:
+        teams_data = build_channel_notification_data(request_info, approver_email)
         
         call_teams_api(teams_data)
         logger.info("CHANNEL_NOTIFICATION_SENT")
@@ -694,16 +1021,36 @@ def send_failure_notification(system: str, applicant_email: str, error_message:
     except Exception as e:
         logger.error(f"FAILURE_NOTIFICATION_ERROR - {str(e)}")
 
+def send_teams_messages_batch(messages: List[dict]) -> dict:
+    """複数のTeamsメッセージを一括送信（mode 4）し、1件でも失敗があれば例外"""
+    result = call_teams_api({"mode": 4, "messages": messages})
+    
+    failed = [item for item in result.get("data", {}).get("results", []) if item["status"] >= 400]
+    if failed:
+        details = ", ".join(f"#{item['index']} Status:{item['status']} - {item['message']}" for item in failed)
+        logger.error(f"TEAMS_BATCH_ERROR - {details}")
+        raise APIException(502, f"Teams一括送信に失敗しました: {details}")
+    
+    logger.info(f"TEAMS_BATCH_SUCCESS - Messages:{len(messages)}")
+    return result
+
 def call_teams_api(teams_data: dict) -> dict:
     """Teams API呼び出し"""
+    started = time.perf_counter()
+    status = None
     try:
         headers = {"Content-Type": "application/json"}
+        if TEAMS_ASYNC_DELIVERY:
+            # キュー投入のみで202が返り、送信はteamsapiのワーカーで行われる
+            teams_data = {**teams_data, "async_delivery": True}
         request_body = json.dumps(teams_data, ensure_ascii=False).encode("utf-8")
         
         response = http.request("POST", TEAMS_API_URL, headers=headers, body=request_body)
+        status = response.status
         response_body = response.data.decode() if response.data else ""
         
-        if response.status in [200, 201]:
+        # 207は一括送信の一部失敗（各メッセージの結果は呼び出し元で判定）
+        if response.status in [200, 201, 202, 207]:
             return json.loads(response_body) if response_body else {}
         
         try:
@@ -720,4 +1067,10 @@ def call_teams_api(teams_data: dict) -> dict:
     except APIException:
         raise
     except Exception as e:
-        raise APIException(502, f"Teams API通信エラー: {str(e)}")
\ No newline at end of file
+        raise APIException(502, f"Teams API通信エラー: {str(e)}")
+    finally:
+        record_stage_metrics(
+            "TeamsNotify",
+            {"TeamsApiLatency": ((time.perf_counter() - started) * 1000, "Milliseconds")},
+            properties={"Mode": teams_data.get("mode"), "StatusCode": status}
+        )
\ No newline at end of file
@@ -0,0 +1,105 @@
+import logging
+import socket
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import urllib3
+from urllib3.connection import HTTPConnection
+
+# ========== ホスト別接続プール ==========
+# ウォームコンテナ内で接続（DNS解決・TLSハンドシェイク済み）を使い回すためのPoolManager。
+#   - HostPoolManager: ホストごとにプールサイズを指定できるPoolManager
+#   - prewarm_connections: 初期化フェーズで接続を開いておく（失敗しても処理は継続）
+#   - connection_stats / connection_reuse: プール単位のリクエスト数・新規接続数から再利用率を算出
+# ===============================
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# 呼び出し間のアイドル中に切断された接続を早めに検出する
+# LinuxのTCPキープアライブ既定（7200秒アイドル後に開始）ではLambdaの実行中に発火しないため、
+# Graph・ALBのアイドルタイムアウトより短い間隔で送出する（未対応のOSでは設定しない）
+KEEPALIVE_IDLE_SECONDS = 60
+KEEPALIVE_INTERVAL_SECONDS = 15
+KEEPALIVE_PROBE_COUNT = 4
+
+def build_keepalive_socket_options() -> list:
+    """TCPキープアライブを有効化し、開始までのアイドル秒数・送出間隔・回数を指定するソケットオプション"""
+    options = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE_SECONDS),
+                        ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL_SECONDS),
+                        ("TCP_KEEPCNT", KEEPALIVE_PROBE_COUNT)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+KEEPALIVE_SOCKET_OPTIONS = build_keepalive_socket_options()
+
+class HostPoolManager(urllib3.PoolManager):
+    """ホスト別のプールサイズ（maxsize）を指定できるPoolManager
+
+    Args:
+        host_maxsize: ホスト名 → プールサイズ。指定のないホストは maxsize（既定値）を使う
+    """
+    def __init__(self, host_maxsize: Optional[Dict[str, int]] = None, **kwargs):
+        kwargs.setdefault("socket_options", KEEPALIVE_SOCKET_OPTIONS)
+        super().__init__(**kwargs)
+        self.host_maxsize = dict(host_maxsize or {})
+
+    def connection_from_host(self, host, port=None, scheme="http", pool_kwargs=None):
+        if host in self.host_maxsize:
+            pool_kwargs = {**(pool_kwargs or {}), "maxsize": self.host_maxsize[host]}
+        return super().connection_from_host(host, port=port, scheme=scheme, pool_kwargs=pool_kwargs)
+
+def prewarm_connections(manager: urllib3.PoolManager, urls: List[str], per_host: int = 1,
+                        timeout: float = 2.0) -> int:
+    """各URLのホストへ per_host 本の接続を開き、プールへ戻す（戻り値: 成功数）
+
+    HEADリクエストで接続とTLS証明書検証まで済ませる。応答ステータスは問わない。
+    """
+    def warm(url: str) -> bool:
+        try:
+            manager.request("HEAD", url, retries=False, timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"CONNECTION_PREWARM_ERROR - {urllib.parse.urlsplit(url).hostname} - {str(e)}")
+            return False
+
+    targets = [url for url in urls for _ in range(max(1, per_host))]
+    if not targets:
+        return 0
+    with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+        warmed = sum(executor.map(warm, targets))
+    logger.info(f"CONNECTION_PREWARM - Warmed:{warmed}/{len(targets)}")
+    return warmed
+
+def connection_stats(manager) -> Dict[str, Dict[str, int]]:
+    """ホスト別の累計リクエスト数・新規接続数（PoolManager以外は空）"""
+    if not isinstance(manager, urllib3.PoolManager):
+        return {}
+    stats: Dict[str, Dict[str, int]] = {}
+    for key in manager.pools.keys():
+        pool = manager.pools.get(key)
+        if pool is None:
+            continue
+        host_stats = stats.setdefault(pool.host, {"requests": 0, "connections": 0})
+        host_stats["requests"] += pool.num_requests
+        host_stats["connections"] += pool.num_connections
+    return stats
+
+def connection_reuse(before: Dict[str, Dict[str, int]], after: Dict[str, Dict[str, int]]) -> Dict[str, dict]:
+    """2時点の connection_stats の差分から、ホスト別の接続再利用率（%）を算出"""
+    reuse = {}
+    for host, counts in after.items():
+        previous = before.get(host, {"requests": 0, "connections": 0})
+        requests = counts["requests"] - previous["requests"]
+        if requests <= 0:
+            continue
+        new_connections = max(0, counts["connections"] - previous["connections"])
+        reuse[host] = {
+            "requests": requests,
+            "new_connections": new_connections,
+            "reuse_rate": max(0.0, (requests - new_connections) / requests * 100)
+        }
+    return reuse
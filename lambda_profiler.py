@@ -0,0 +1,127 @@
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Callable, Optional
+
+# ========== オンデマンドプロファイリング ==========
+# 任意のLambdaハンドラーを @profile_handler で包み、以下のいずれかで
+# cProfile + tracemalloc による計測を有効化する。
+#   - 環境変数 LAMBDA_PROFILE_SAMPLE_RATE（0.0〜1.0の割合でサンプリング）
+#   - イベントの "profile": true（直接Invoke時）
+#   - ヘッダー "X-Profile: true"（API Gateway経由時）
+# イベント・ヘッダーによる指定は外部の呼び出し元でも付与できるため、
+# 環境変数 LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER=true の場合のみ有効とする。
+# 計測結果は PROFILE_BUCKET_NAME の {PROFILE_S3_PREFIX}{関数名}/{request_id}/ に保存する。
+# cProfileは呼び出しスレッドのみを計測する点に注意。
+# ===============================
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+PROFILE_SAMPLE_RATE_ENV = 'LAMBDA_PROFILE_SAMPLE_RATE'
+PROFILE_ALLOW_REQUEST_TRIGGER_ENV = 'LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER'
+PROFILE_TOP_N = int(os.environ.get('PROFILE_TOP_N', '40'))
+# tracemalloc のスタック保持数（多いほどオーバーヘッド増）
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get('PROFILE_TRACEMALLOC_FRAMES', '5'))
+
+def should_profile(event) -> bool:
+    """プロファイリング対象の呼び出しか判定"""
+    allow_request_trigger = os.environ.get(PROFILE_ALLOW_REQUEST_TRIGGER_ENV, 'false').lower() == 'true'
+    if allow_request_trigger and isinstance(event, dict):
+        if event.get("profile") is True:
+            return True
+        headers = event.get("headers") or {}
+        if any(k.lower() == "x-profile" and str(v).lower() == "true" for k, v in headers.items()):
+            return True
+
+    try:
+        sample_rate = float(os.environ.get(PROFILE_SAMPLE_RATE_ENV, '0') or 0)
+    except ValueError:
+        logger.warning(f"PROFILE_SAMPLE_RATE_INVALID - {os.environ.get(PROFILE_SAMPLE_RATE_ENV)}")
+        return False
+    return sample_rate > 0 and random.random() < sample_rate
+
+def profile_handler(handler: Callable) -> Callable:
+    """Lambdaハンドラーをオンデマンドプロファイリング対応にするデコレーター"""
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if not should_profile(event):
+            return handler(event, context)
+
+        request_id = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+        function_name = getattr(context, 'function_name', None) or handler.__module__
+        logger.info(f"PROFILE_START - {function_name} - {request_id}")
+
+        # 既にtracemallocが動いている場合は停止しない
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            return handler(event, context)
+        finally:
+            profiler.disable()
+            elapsed_seconds = time.perf_counter() - started
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+            try:
+                reports = build_profile_reports(profiler, snapshot, peak_bytes, elapsed_seconds)
+                upload_profile_reports(reports, function_name, request_id)
+            except Exception as e:
+                # 計測結果の保存失敗で本処理の結果は変えない
+                logger.warning(f"PROFILE_REPORT_ERROR - {str(e)} - {request_id}")
+
+    return wrapper
+
+def build_profile_reports(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                          peak_bytes: int, elapsed_seconds: float) -> dict:
+    """S3保存用のレポート一式を作成（ファイル名 -> bytes）"""
+    # pstats形式（snakeviz等で閲覧可能）
+    with tempfile.NamedTemporaryFile(suffix=".pstats") as f:
+        profiler.dump_stats(f.name)
+        pstats_bytes = f.read()
+
+    stats_text = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stats_text)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+    summary = f"elapsed: {elapsed_seconds * 1000:.1f} ms\n\n{stats_text.getvalue()}"
+
+    allocation_lines = [f"peak traced memory: {peak_bytes / 1024 / 1024:.2f} MiB", ""]
+    for stat in snapshot.statistics('lineno')[:PROFILE_TOP_N]:
+        allocation_lines.append(str(stat))
+
+    return {
+        "profile.pstats": pstats_bytes,
+        "profile.txt": summary.encode("utf-8"),
+        "allocations.txt": "\n".join(allocation_lines).encode("utf-8"),
+    }
+
+def upload_profile_reports(reports: dict, function_name: str, request_id: str) -> Optional[str]:
+    """レポートをS3へアップロードし、保存先プレフィックスを返す"""
+    bucket_name = os.environ.get('PROFILE_BUCKET_NAME')
+    if not bucket_name:
+        logger.warning(f"PROFILE_BUCKET_NOT_CONFIGURED - {request_id}")
+        logger.info(reports["profile.txt"].decode("utf-8"))
+        return None
+
+    import boto3
+    prefix = f"{os.environ.get('PROFILE_S3_PREFIX', 'profiles/')}{function_name}/{request_id}/"
+    s3 = boto3.client('s3')
+    for filename, body in reports.items():
+        s3.put_object(Bucket=bucket_name, Key=f"{prefix}{filename}", Body=body)
+
+    logger.info(f"PROFILE_UPLOADED - s3://{bucket_name}/{prefix} - {request_id}")
+    return prefix
@@ -0,0 +1,33 @@
+import threading
+
+# ========== 遅延作成のboto3クライアント ==========
+# モジュール読み込み時に boto3 のimport・クライアント作成（合わせて100ms超）を行わず、
+# 最初のAPI呼び出し時に作成する。使わない処理経路ではコストが発生しない。
+#   ssm_client = LazyClient('ssm')
+#   ssm_client.get_parameter(...)  # ここで boto3.client('ssm') を作成
+# テストでは従来どおりモジュール変数ごと patch で差し替えられる。
+# ===============================
+
+class LazyClient:
+    """初回の属性アクセス時に boto3.client(service_name, **kwargs) を作成するプロキシ"""
+    def __init__(self, service_name: str, **client_kwargs):
+        self._service_name = service_name
+        self._client_kwargs = client_kwargs
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import boto3
+                    self._client = boto3.client(self._service_name, **self._client_kwargs)
+        return self._client
+
+    def __getattr__(self, name: str):
+        return getattr(self.client, name)
+
+    def __repr__(self) -> str:
+        state = "created" if self._client is not None else "pending"
+        return f"LazyClient({self._service_name!r}, {state})"
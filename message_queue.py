@@ -0,0 +1,64 @@
+import json
+import threading
+import uuid
+from collections import deque
+from typing import List, Optional
+
+# ========== 送信キュー ==========
+# teamsapi の非同期送信（202応答）用キュー。
+#   - SqsQueue: 本番用（SQS。ワーカーLambdaはSQSイベントソースで起動）
+#   - LocalQueue: テスト・ローカル実行用（プロセス内。SQSイベント形式で取り出せる）
+# どちらも send(body) でメッセージIDを返す。
+# ===============================
+
+class SqsQueue:
+    """SQSキュー"""
+    def __init__(self, queue_url: str, sqs_client=None):
+        self.queue_url = queue_url
+        self._sqs_client = sqs_client
+
+    @property
+    def sqs_client(self):
+        if self._sqs_client is None:
+            import boto3
+            self._sqs_client = boto3.client('sqs')
+        return self._sqs_client
+
+    def send(self, body: dict) -> str:
+        response = self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(body, ensure_ascii=False)
+        )
+        return response['MessageId']
+
+class LocalQueue:
+    """プロセス内キュー（SQS互換のイベント形式で取り出し可能）"""
+    def __init__(self):
+        self.messages = deque()
+        self.lock = threading.Lock()
+
+    def send(self, body: dict) -> str:
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.messages.append({"messageId": message_id, "body": json.dumps(body, ensure_ascii=False)})
+        return message_id
+
+    def receive_event(self, max_messages: int = 10) -> dict:
+        """最大 max_messages 件を取り出し、SQSイベント形式で返す"""
+        records: List[dict] = []
+        with self.lock:
+            while self.messages and len(records) < max_messages:
+                records.append(self.messages.popleft())
+        return {"Records": records}
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.messages)
+
+def create_queue(queue_url: Optional[str]):
+    """キューURLからキューを作成（"local" はプロセス内キュー、未設定はNone）"""
+    if not queue_url:
+        return None
+    if queue_url == "local":
+        return LocalQueue()
+    return SqsQueue(queue_url)
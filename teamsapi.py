@@ -1,12 +1,27 @@
 import urllib3
 import urllib.parse
+import functools
+import hashlib
+import html
 import json
 import os
-import boto3
 import logging
+import random
+import sys
+import threading
+import time
 import uuid
-from typing import List, Optional, Literal, Union
-from pydantic import BaseModel, EmailStr, Field, ValidationError
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Annotated, Callable, Iterator, List, Optional, Literal, Union
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter, ValidationError
+from call_metrics import CallLog, emit_call_metrics
+from emf_metrics import emit_metrics
+from http_pools import HostPoolManager, connection_reuse, connection_stats, prewarm_connections
+from lazy_clients import LazyClient
+from lambda_profiler import profile_handler
+from message_queue import create_queue
+from ttl_cache import NOT_FOUND, S3JsonStore, TTLCache
 
 # ========== HTTP Status Code Based Error Handling ==========
 # 400: Bad Request - バリデーション、JSONパースエラー
@@ -22,16 +37,154 @@ from pydantic import BaseModel, EmailStr, Field, ValidationError
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# urllib3設定（タイムアウト付き）
-http = urllib3.PoolManager(timeout=urllib3.Timeout(15))
-ssm_client = boto3.client('ssm')
+# 複数宛先DM・$batch分割送信の最大並列数（接続プールも同じ数だけ保持する）
+DM_MAX_CONCURRENCY = max(1, int(os.environ.get('DM_MAX_CONCURRENCY', '8')))
 
+# 負荷試験・ローカル検証時は疑似サーバー（benchmarks/fake_graph.py）に向けられる
+GRAPH_API_BASE_URL = os.environ.get('GRAPH_API_BASE_URL', "https://graph.microsoft.com/v1.0").rstrip("/")
+LOGIN_BASE_URL = os.environ.get('LOGIN_BASE_URL', "https://login.microsoftonline.com").rstrip("/")
+GRAPH_HOST = urllib.parse.urlsplit(GRAPH_API_BASE_URL).hostname
+LOGIN_HOST = urllib.parse.urlsplit(LOGIN_BASE_URL).hostname
+
+# ホスト別の接続プールサイズ（Graphは並列送信数、トークン取得は直列のため少数）
+GRAPH_POOL_MAXSIZE = max(1, int(os.environ.get('GRAPH_POOL_MAXSIZE', str(DM_MAX_CONCURRENCY))))
+LOGIN_POOL_MAXSIZE = max(1, int(os.environ.get('LOGIN_POOL_MAXSIZE', '2')))
+# Lambda初期化フェーズで各ホストへ接続を開いておく本数（0で無効。Lambda環境外では行わない）
+CONNECTION_PREWARM_PER_HOST = int(os.environ.get('CONNECTION_PREWARM_PER_HOST', '1'))
+
+# urllib3設定（タイムアウト付き。接続はウォームコンテナ内で呼び出しをまたいで再利用する）
+http = HostPoolManager(
+    {GRAPH_HOST: GRAPH_POOL_MAXSIZE, LOGIN_HOST: LOGIN_POOL_MAXSIZE},
+    timeout=urllib3.Timeout(15),
+    maxsize=DM_MAX_CONCURRENCY
+)
+# boto3のimport・クライアント作成は初回のSSM呼び出しまで遅延する
+ssm_client = LazyClient('ssm')
+dynamodb_client = LazyClient('dynamodb')
+
+if CONNECTION_PREWARM_PER_HOST > 0 and os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+    # DNS解決・TLSハンドシェイクを初回リクエストの処理時間から外す
+    prewarm_connections(http, [f"{LOGIN_BASE_URL}/", urllib.parse.urljoin(GRAPH_API_BASE_URL, "/")], per_host=CONNECTION_PREWARM_PER_HOST)
+
+# 一覧取得時の1ページ件数（$top。対応するエンドポイントのみ指定）
+GRAPH_PAGE_SIZE = int(os.environ.get('GRAPH_PAGE_SIZE', '50'))
+# JSONバッチ（$batch）1回あたりのサブリクエスト上限（Graphの仕様上限は20）
+GRAPH_BATCH_MAX_REQUESTS = 20
+# ODataクエリ値のURLエンコードでそのまま残す文字（区切りのカンマ・文字列リテラルのクォート・括弧）
+ODATA_QUERY_SAFE_CHARS = ",'()"
+
+# Graph APIスロットリング時の再試行設定
+# 再試行は lambda_handler の1呼び出し内（start_retry_window〜end_retry_window）でのみ行い、
+# 呼び出し全体で GRAPH_RETRY_BUDGET 回・GRAPH_RETRY_DEADLINE_SECONDS 秒までに制限する
+GRAPH_RETRY_STATUSES = [429, 503, 504]
+# 429はGraphがリクエストを実行していないことを示すため、冪等でないPOSTも再試行する
+GRAPH_THROTTLED_STATUS = 429
+GRAPH_IDEMPOTENT_METHODS = ["GET", "HEAD", "PUT", "DELETE", "OPTIONS"]
+GRAPH_RETRY_MAX_ATTEMPTS = int(os.environ.get('GRAPH_RETRY_MAX_ATTEMPTS', '4'))
+GRAPH_RETRY_BASE_DELAY_SECONDS = float(os.environ.get('GRAPH_RETRY_BASE_DELAY_SECONDS', '0.5'))
+GRAPH_RETRY_MAX_DELAY_SECONDS = float(os.environ.get('GRAPH_RETRY_MAX_DELAY_SECONDS', '8'))
+GRAPH_RETRY_BUDGET = int(os.environ.get('GRAPH_RETRY_BUDGET', '20'))
+# API Gatewayの29秒制限より前に打ち切る
+GRAPH_RETRY_DEADLINE_SECONDS = float(os.environ.get('GRAPH_RETRY_DEADLINE_SECONDS', '25'))
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'TeamsApi')
+# true の場合、レスポンスの debug.graph_calls に1呼び出し内のGraph呼び出しタイムラインを付与する（検証環境向け）
+GRAPH_TIMELINE_DEBUG = os.environ.get('GRAPH_TIMELINE_DEBUG', 'false').lower() == 'true'
 
 TENANT_ID = os.environ['TENANT_ID']
 CLIENT_ID = os.environ['CLIENT_ID']
 CLIENT_SECRET = os.environ['CLIENT_SECRET']
 REFRESH_TOKEN_PARAM_NAME = os.environ['REFRESH_TOKEN_PARAM_NAME']
 
+# アクセストークンキャッシュ設定（期限切れ前マージン秒・expires_in未返却時の既定有効秒）
+ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS = int(os.environ.get('ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS', '300'))
+DEFAULT_ACCESS_TOKEN_LIFETIME_SECONDS = 3600
+
+# 複数インスタンス間のトークンローテーション排他設定
+# ACCESS_TOKEN_PARAM_NAME 設定時のみ有効（共有アクセストークンの保存先）
+ACCESS_TOKEN_PARAM_NAME = os.environ.get('ACCESS_TOKEN_PARAM_NAME')
+# リースはDynamoDBテーブル（パーティションキー lock_name: 文字列）の条件付き書き込みで排他する
+TOKEN_LOCK_TABLE_NAME = os.environ.get('TOKEN_LOCK_TABLE_NAME')
+TOKEN_LOCK_NAME = os.environ.get('TOKEN_LOCK_NAME', f"{REFRESH_TOKEN_PARAM_NAME}-lock")
+TOKEN_LOCK_LEASE_SECONDS = int(os.environ.get('TOKEN_LOCK_LEASE_SECONDS', '30'))
+TOKEN_LOCK_WAIT_SECONDS = float(os.environ.get('TOKEN_LOCK_WAIT_SECONDS', '5'))
+# リース待機のポーリング間隔（base〜直前の間隔×2 のジッター付き、上限あり）
+TOKEN_LOCK_POLL_INTERVAL_SECONDS = 0.25
+TOKEN_LOCK_MAX_POLL_INTERVAL_SECONDS = 1.0
+# スロットリング系のエラーコード（リース未取得として扱い、待機後に再試行する）
+AWS_THROTTLING_ERROR_CODES = ["ThrottlingException", "Throttling", "ProvisionedThroughputExceededException",
+                              "RequestLimitExceeded", "TooManyUpdates"]
+
+# 共有トークンの事前更新設定（ACCESS_TOKEN_PARAM_NAME 設定時のみ有効）
+# token_refresher_handler を TOKEN_REFRESH_AHEAD_SECONDS より短い間隔でスケジュール実行し、
+# 残り有効時間がこの値以下になった共有トークンを期限前に更新・公開する。
+# BACKGROUND_TOKEN_REFRESH=true の場合、送信処理は共有ストアの読み取りのみ行う
+BACKGROUND_TOKEN_REFRESH = os.environ.get('BACKGROUND_TOKEN_REFRESH', 'false').lower() == 'true'
+TOKEN_REFRESH_AHEAD_SECONDS = int(os.environ.get('TOKEN_REFRESH_AHEAD_SECONDS', '1200'))
+# 事前更新時に共有トークンを使い続ける下限の残り秒数（処理中に失効しないための余裕）
+BACKGROUND_TOKEN_MIN_REMAINING_SECONDS = int(os.environ.get('BACKGROUND_TOKEN_MIN_REMAINING_SECONDS', '30'))
+
+# チーム・チャンネルID解決キャッシュ設定
+# ID_CACHE_BUCKET_NAME 設定時はS3にも保存し、コールドスタート後も再利用する
+ID_CACHE_TTL_SECONDS = int(os.environ.get('ID_CACHE_TTL_SECONDS', '21600'))
+ID_CACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get('ID_CACHE_NEGATIVE_TTL_SECONDS', '60'))
+ID_CACHE_MAX_ENTRIES = int(os.environ.get('ID_CACHE_MAX_ENTRIES', '512'))
+ID_CACHE_BUCKET_NAME = os.environ.get('ID_CACHE_BUCKET_NAME')
+ID_CACHE_S3_PREFIX = os.environ.get('ID_CACHE_S3_PREFIX', 'teamsapi-cache/')
+# 1:1チャットIDは削除されない限り変わらないため長期間保持する
+CHAT_ID_CACHE_TTL_SECONDS = int(os.environ.get('CHAT_ID_CACHE_TTL_SECONDS', '2592000'))
+# メールアドレス → ユーザー（id, displayName）の保持期間
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', '86400'))
+
+def create_id_cache(name: str, ttl_seconds: int = ID_CACHE_TTL_SECONDS,
+                    max_entries: int = ID_CACHE_MAX_ENTRIES) -> TTLCache:
+    """名前→ID解決用キャッシュの作成"""
+    store = S3JsonStore(ID_CACHE_BUCKET_NAME, f"{ID_CACHE_S3_PREFIX}{name}/") if ID_CACHE_BUCKET_NAME else None
+    return TTLCache(name, ttl_seconds, ID_CACHE_NEGATIVE_TTL_SECONDS, max_entries, store)
+
+team_id_cache = create_id_cache("team_id")
+channel_id_cache = create_id_cache("channel_id")
+# 宛先ユーザーID → 1:1チャットID（送信者はリフレッシュトークンのユーザー固定）
+chat_id_cache = create_id_cache("chat_id", CHAT_ID_CACHE_TTL_SECONDS)
+# メールアドレス（小文字）→ {"id", "displayName"}。存在しないアドレスは短期間ネガティブキャッシュ
+user_directory_cache = create_id_cache("user_directory", USER_CACHE_TTL_SECONDS)
+
+# 冪等キー → {"fingerprint", "response"}。呼び出し元の再試行による二重送信を防ぐ
+# 再試行が別コンテナに届いた場合も検出するには ID_CACHE_BUCKET_NAME が必要（未設定時は同一コンテナ内のみ有効）。
+# 保持中のキーが他のキーに押し出されないよう、メモリ上は件数上限で破棄しない
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '86400'))
+idempotency_cache = create_id_cache("idempotency", IDEMPOTENCY_TTL_SECONDS, max_entries=sys.maxsize)
+
+# SQSメッセージID → 送信済み宛先（user_cache_key）のリスト。複数宛先DMの再配信時に送信済みの宛先を除く
+# 再配信は別コンテナに届くことが多いため ID_CACHE_BUCKET_NAME 設定時はS3にも保存する。
+# 送信中の記録が他のメッセージに押し出されないよう、メモリ上は件数上限で破棄しない（既定はSQSの保持期間4日）
+DELIVERY_LOG_TTL_SECONDS = int(os.environ.get('DELIVERY_LOG_TTL_SECONDS', '345600'))
+delivery_log_cache = create_id_cache("dm_delivery", DELIVERY_LOG_TTL_SECONDS, max_entries=sys.maxsize)
+
+# 非同期送信キュー（SQSのキューURL。"local" でプロセス内キュー、未設定なら非同期送信は無効）
+TEAMS_QUEUE_URL = os.environ.get('TEAMS_QUEUE_URL')
+QUEUE_WORKER_CONCURRENCY = max(1, int(os.environ.get('QUEUE_WORKER_CONCURRENCY', '4')))
+# 同一チーム・チャンネル宛てのメッセージをまとめる時間幅（秒。0で無効）
+# ワーカーのSQSイベントソースの MaximumBatchingWindowInSeconds 以上に設定すると効果が大きい
+CHANNEL_COALESCE_WINDOW_SECONDS = float(os.environ.get('CHANNEL_COALESCE_WINDOW_SECONDS', '0'))
+# モード4（一括送信）で1リクエストに含められる最大メッセージ数
+BATCH_MAX_MESSAGES = int(os.environ.get('BATCH_MAX_MESSAGES', '20'))
+message_queue = create_queue(TEAMS_QUEUE_URL)
+
+# ウォームコンテナ内で再利用するアクセストークン
+_access_token_cache = {"access_token": None, "expires_at": 0.0}
+_access_token_lock = threading.Lock()
+# 呼び出し元ユーザーID（/me）。アクセストークン単位で保持する
+_caller_identity_cache = {"access_token": None, "user_id": None}
+
+# 1呼び出し内の再試行予算と集計（DM並列送信のスレッド間で共有）
+_retry_window = {"active": False, "budget": 0, "deadline": 0.0, "retries": 0, "throttled": 0, "give_ups": 0}
+_retry_lock = threading.Lock()
+# 同時に送信中のGraphリクエスト数の上限（入れ子の並列処理を含めた全体で接続プールのサイズを超えない）
+_graph_request_slots = threading.BoundedSemaphore(GRAPH_POOL_MAXSIZE)
+
+# 1呼び出し内のGraph呼び出し記録（エンドポイントテンプレート別の所要時間・ステータス・再試行数・サイズ）
+graph_call_log = CallLog()
+
 class APIException(Exception):
     """HTTPステータスコードベースの例外クラス
     
@@ -74,6 +227,15 @@ def create_success_response(request_id: str, data: Optional[dict] = None, messag
         'body': json.dumps(body, ensure_ascii=False)
     }
 
+def create_accepted_response(request_id: str, message_id: Union[str, List[str]]) -> dict:
+    """非同期送信の受付レスポンス作成（一括送信はメッセージIDのリスト）"""
+    data = {"message_ids": message_id} if isinstance(message_id, list) else {"message_id": message_id}
+    body = {"request_id": request_id, "message": "Accepted", "data": data}
+    return {
+        'statusCode': 202,
+        'body': json.dumps(body, ensure_ascii=False)
+    }
+
 # ========== Pydanticモデル定義 ==========
 class MentionModel(BaseModel):
     mention_type: Literal["user"] = "user"
@@ -86,7 +248,8 @@ class BaseRequestModel(BaseModel):
     # 1:DMメッセージ
     # 2:チャンネルメッセージ
     # 3:リフレッシュトークン更新
-    mode: Literal[1, 2, 3]
+    # 4:一括送信（DM・チャンネルメッセージの混在可）
+    mode: Literal[1, 2, 3, 4]
 
 class DMRequestModel(BaseRequestModel):
     mode: Literal[1] = 1
@@ -94,6 +257,10 @@ class DMRequestModel(BaseRequestModel):
     message_text: str = Field(..., min_length=1, max_length=28000)
     content_type: Literal["text", "html"] = "text"
     mentions: List[MentionModel] = Field(default_factory=list, max_items=50)
+    # Trueの場合はキュー投入のみ行い202を返す
+    async_delivery: bool = False
+    # 同じキーでの再送は保存済みの結果を返し、Graphは呼び出さない
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=255)
     
     class Config:
         extra = "forbid"
@@ -106,15 +273,71 @@ class ChannelRequestModel(BaseRequestModel):
     content_type: Literal["text", "html"] = "text"
     subject: str = Field("", max_length=255)
     mentions: List[MentionModel] = Field(default_factory=list, max_items=50)
+    async_delivery: bool = False
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=255)
 
 class RefreshTokenRequestModel(BaseRequestModel):
     mode: Literal[3] = 3
 
+class BatchRequestModel(BaseRequestModel):
+    mode: Literal[4] = 4
+    messages: List[Annotated[Union[DMRequestModel, ChannelRequestModel], Field(discriminator="mode")]] = Field(
+        ..., min_items=1, max_items=BATCH_MAX_MESSAGES)
+    # Trueの場合は各メッセージを個別にキュー投入し202を返す
+    async_delivery: bool = False
+
+    class Config:
+        extra = "forbid"
+
+# mode をタグとした判別共用体。バリデーターはimport時に1度だけ構築し、
+# 受信したJSON文字列（bytes可）を json.loads を経由せず直接検証する
+RequestModel = Annotated[
+    Union[DMRequestModel, ChannelRequestModel, RefreshTokenRequestModel, BatchRequestModel],
+    Field(discriminator="mode")
+]
+REQUEST_ADAPTER = TypeAdapter(RequestModel)
+
+class QueuedMessageModel(BaseModel):
+    """キューメッセージのエンベロープ（send_to_queue で作成）"""
+    request_id: Optional[str] = None
+    enqueued_at: float = 0
+    request: RequestModel
+
 # ========== メインハンドラー ==========
 
+def record_graph_calls(handler: Callable) -> Callable:
+    """ハンドラー1呼び出し内のGraph呼び出しを記録し、終了時にエンドポイント別メトリクスを出力
+
+    GRAPH_TIMELINE_DEBUG 有効時は、API Gateway形式のレスポンス本文に呼び出しタイムラインを付与する。
+    """
+    @functools.wraps(handler)
+    def wrapper(event: dict, context) -> dict:
+        graph_call_log.start()
+        calls = []
+        try:
+            response = handler(event, context)
+        finally:
+            calls = graph_call_log.end()
+            try:
+                emit_call_metrics(METRICS_NAMESPACE, "Graph", calls, context.aws_request_id)
+            except Exception as e:
+                logger.warning(f"METRICS_EMIT_ERROR - {str(e)} - {context.aws_request_id}")
+
+        if GRAPH_TIMELINE_DEBUG and isinstance(response, dict) and isinstance(response.get("body"), str):
+            body = json.loads(response["body"])
+            body["debug"] = {"graph_calls": calls}
+            response = {**response, "body": json.dumps(body, ensure_ascii=False)}
+        return response
+    return wrapper
+
+@profile_handler
+@record_graph_calls
 def lambda_handler(event: dict, context) -> dict:
     """AWS Lambda メインハンドラー関数"""
     request_id = context.aws_request_id
+    start_retry_window()
+    connections_before = connection_stats(http)
+    access_token = None
     
     try:                
         # リクエスト開始ログ
@@ -123,6 +346,19 @@ def lambda_handler(event: dict, context) -> dict:
         # リクエストパラメータのバリデーション
         request_data = validate_and_parse_request(event.get("body", "{}"))
         logger.info(f"REQUEST_VALIDATED - Mode:{request_data.mode} - {request_id}")
+
+        # 非同期送信: キュー投入のみ行い202を返す（トークン取得・Graph呼び出しはワーカーで実行）
+        if getattr(request_data, "async_delivery", False):
+            if request_data.mode == 4:
+                result = enqueue_batch_request(request_data, request_id)
+            else:
+                result = run_idempotent(
+                    request_data, request_id,
+                    lambda: enqueue_message_request(request_data, request_id),
+                    stage="accepted"
+                )
+            logger.info(f"REQUEST_ACCEPTED - Mode:{request_data.mode} - {request_id}")
+            return result
         
         # モード3: リフレッシュトークン更新のみ
         if request_data.mode == 3:
@@ -130,37 +366,172 @@ def lambda_handler(event: dict, context) -> dict:
             logger.info(f"REQUEST_SUCCESS - Mode:3 TokenRefresh - {request_id}")
             return result
         
-        # メッセージ送信前のトークンリフレッシュ実行
-        refresh_token = get_refresh_token_from_ssm(REFRESH_TOKEN_PARAM_NAME)
-        access_token, new_refresh_token = refresh_access_token(refresh_token, request_id)
-
-        if new_refresh_token and new_refresh_token != refresh_token:
-            save_refresh_token_to_ssm(new_refresh_token, REFRESH_TOKEN_PARAM_NAME)
-            logger.info(f"TOKEN_UPDATED - {request_id}")
+        # メッセージ送信前のアクセストークン取得（有効期限内はキャッシュを再利用）
+        access_token = get_access_token(request_id)
 
         # モード1: DM送信処理
         if request_data.mode == 1:
-            result = handle_dm_mode(request_data, access_token, request_id)
+            result = run_idempotent(request_data, request_id, lambda: handle_dm_mode(request_data, access_token, request_id))
             logger.info(f"REQUEST_SUCCESS - Mode:1 DM - {request_id}")
             return result
         
         # モード2: チャンネル送信処理
         elif request_data.mode == 2:
-            result = handle_channel_mode(request_data, access_token, request_id)
+            result = run_idempotent(request_data, request_id, lambda: handle_channel_mode(request_data, access_token, request_id))
             logger.info(f"REQUEST_SUCCESS - Mode:2 Channel - {request_id}")
             return result
 
+        # モード4: 一括送信処理
+        elif request_data.mode == 4:
+            result = handle_batch_mode(request_data, access_token, request_id)
+            logger.info(f"REQUEST_SUCCESS - Mode:4 Batch Status:{result['statusCode']} - {request_id}")
+            return result
+
     except APIException as e:
         logger.error(f"API_ERROR - Status:{e.status_code} Message:{e.message} - {request_id}")
+        if e.status_code == 401:
+            # 失効したトークンを次回呼び出しで使い回さない（トークン取得自体の失敗はキャッシュ破棄のみ）
+            if access_token:
+                replace_rejected_access_token(access_token, request_id)
+            else:
+                invalidate_access_token_cache()
         return create_error_response(request_id, e.status_code, e.message)
     except Exception as e:
         logger.error(f"SYSTEM_ERROR - {str(e)} - {request_id}")
         raise
+    finally:
+        end_retry_window(request_id)
+        emit_connection_metrics(connections_before, request_id)
+
+@profile_handler
+@record_graph_calls
+def queue_worker_handler(event: dict, context) -> dict:
+    """非同期送信ワーカー（SQSイベントソース）
+
+    キューのメッセージを QUEUE_WORKER_CONCURRENCY 並列で送信する。
+    再試行で解決し得る失敗のみ batchItemFailures として返し、SQSに再配信させる。
+    """
+    request_id = context.aws_request_id
+    records = event.get("Records", [])
+    start_retry_window()
+    connections_before = connection_stats(http)
+    logger.info(f"QUEUE_WORKER_START - Messages:{len(records)} - {request_id}")
+
+    try:
+        try:
+            access_token = get_access_token(request_id)
+        except APIException as e:
+            logger.error(f"QUEUE_WORKER_TOKEN_ERROR - Status:{e.status_code} Message:{e.message} - {request_id}")
+            if e.status_code == 401:
+                invalidate_access_token_cache()
+            return {"batchItemFailures": [{"itemIdentifier": record["messageId"]} for record in records]}
+
+        parsed = parse_queued_records(records)
+        groups = coalesce_channel_records(records, request_id, parsed)
+        results = run_concurrently(
+            lambda group: process_queued_group(group, access_token, parsed),
+            groups,
+            max_workers=QUEUE_WORKER_CONCURRENCY
+        )
+        failures = [{"itemIdentifier": message_id} for retry_ids in results for message_id in retry_ids]
+        logger.info(f"QUEUE_WORKER_END - Messages:{len(records)} Failed:{len(failures)} - {request_id}")
+        return {"batchItemFailures": failures}
+    finally:
+        end_retry_window(request_id)
+        emit_connection_metrics(connections_before, request_id)
+
+@profile_handler
+def token_refresher_handler(event: dict, context) -> dict:
+    """共有アクセストークンの事前更新（EventBridgeスケジュール）
+
+    共有トークンの残り有効時間が TOKEN_REFRESH_AHEAD_SECONDS 以下（または未公開）の場合に
+    リフレッシュトークンをローテーションし、新しいアクセストークンを有効期限付きで公開する。
+    イベントに {"force": true} を指定すると残り時間に関係なく更新する。
+    失敗時は例外を送出し、Lambdaの非同期呼び出しの再試行・エラーメトリクスに委ねる。
+    """
+    request_id = context.aws_request_id
+    if not ACCESS_TOKEN_PARAM_NAME:
+        raise APIException(500, "ACCESS_TOKEN_PARAM_NAME is not configured")
+
+    shared = get_shared_access_token_record(request_id)
+    remaining = (shared or {}).get("expires_at", 0) - time.time()
+    force = bool((event or {}).get("force"))
+    logger.info(f"TOKEN_REFRESHER_START - Remaining:{int(remaining)}s Force:{force} - {request_id}")
+
+    refreshed = force or not (shared or {}).get("access_token") or remaining <= TOKEN_REFRESH_AHEAD_SECONDS
+    if refreshed:
+        rotate_tokens_with_lock(request_id, force=True)
+        remaining = (get_shared_access_token_record(request_id) or {}).get("expires_at", 0) - time.time()
+        logger.info(f"TOKEN_REFRESHER_ROTATED - Remaining:{int(remaining)}s - {request_id}")
+    else:
+        logger.info(f"TOKEN_REFRESHER_SKIPPED - {request_id}")
+
+    try:
+        emit_metrics(
+            METRICS_NAMESPACE,
+            {"Api": "Token"},
+            {
+                "SharedTokenRefreshed": (int(refreshed), "Count"),
+                "SharedTokenRemainingSeconds": (max(0, int(remaining)), "Seconds")
+            },
+            properties={"RequestId": request_id}
+        )
+    except Exception as e:
+        logger.warning(f"METRICS_EMIT_ERROR - {str(e)} - {request_id}")
+    return {"refreshed": refreshed, "remaining_seconds": max(0, int(remaining))}
 
 # ========== モード別ハンドラー関数 ==========
 
+def handle_batch_mode(request_data: BatchRequestModel, access_token: str, request_id: str) -> dict:
+    """一括送信モード処理
+
+    宛先・メンションのユーザー解決を$batchで先にまとめて行い（ディレクトリキャッシュを共有）、
+    各メッセージを並列に送信する。結果はメッセージごとのステータスで返し、
+    1件でも失敗があれば207とする。送信順序は保証しない。
+    """
+    emails = [email for message in request_data.messages for email in getattr(message, "email_addresses", [])]
+    emails += [mention.email_address for message in request_data.messages for mention in message.mentions]
+    if len({user_cache_key(email) for email in emails}) > 1:
+        try:
+            find_users_by_email(access_token, emails, request_id)
+        except APIException as e:
+            if e.status_code == 401:
+                raise
+            # 先読みの失敗は各メッセージの送信時に改めて解決・報告する
+            logger.warning(f"BATCH_USER_PREFETCH_ERROR - Status:{e.status_code} Message:{e.message} - {request_id}")
+
+    def deliver(indexed_message) -> dict:
+        index, message = indexed_message
+        try:
+            handler = handle_dm_mode if message.mode == 1 else handle_channel_mode
+            response = run_idempotent(message, request_id, lambda: handler(message, access_token, request_id))
+            return {"index": index, "mode": message.mode, "status": response["statusCode"],
+                    "message": json.loads(response["body"])["message"]}
+        except APIException as e:
+            logger.error(f"BATCH_ITEM_ERROR - Index:{index} Status:{e.status_code} Message:{e.message} - {request_id}")
+            return {"index": index, "mode": message.mode, "status": e.status_code, "message": e.message}
+
+    results = run_concurrently(deliver, list(enumerate(request_data.messages)))
+    failed = [result for result in results if result["status"] >= 400]
+    if any(result["status"] == 401 for result in failed):
+        replace_rejected_access_token(access_token, request_id)
+
+    logger.info(f"BATCH_COMPLETE - Messages:{len(results)} Failed:{len(failed)} - {request_id}")
+    response = create_success_response(
+        request_id, {"results": results},
+        message=f"{len(results) - len(failed)}/{len(results)} messages sent"
+    )
+    if failed:
+        response['statusCode'] = 207
+    return response
+
 def handle_refresh_token_mode(request_id: str) -> dict:
     logger.info(f"TOKEN_REFRESH_START - {request_id}")
+    if ACCESS_TOKEN_PARAM_NAME:
+        # 他インスタンスとの同時ローテーションを避けるためリース取得後に更新
+        rotate_tokens_with_lock(request_id, force=True)
+        return create_success_response(request_id, message="Refresh token updated successfully")
+
     refresh_token = get_refresh_token_from_ssm(REFRESH_TOKEN_PARAM_NAME)
     access_token, new_refresh_token = refresh_access_token(refresh_token, request_id)
 
@@ -170,97 +541,899 @@ def handle_refresh_token_mode(request_id: str) -> dict:
 
     return create_success_response(request_id, message="Refresh token updated successfully")
 
-def handle_dm_mode(request_data: DMRequestModel, access_token: str, request_id: str) -> dict:
-    """モード1: DM送信処理"""
+def handle_dm_mode(request_data: DMRequestModel, access_token: str, request_id: str,
+                   delivery_key: Optional[str] = None) -> dict:
+    """モード1: DM送信処理
+
+    delivery_key を指定すると複数宛先の送信済み宛先を記録し、同じキーでの再実行では
+    未送信の宛先にだけ送信する（キュー再配信時の重複送信防止）。
+    """
     logger.info(f"DM_SEND_START - Recipients:{len(request_data.email_addresses)} - {request_id}")
-    
+
+    # 複数宛先は$batchでユーザー解決・チャット解決・送信をまとめて行う
+    if len(request_data.email_addresses) > 1:
+        send_dms_in_batches(request_data, access_token, request_id, delivery_key)
+        logger.info(f"DM_SEND_SUCCESS - Recipients:{len(request_data.email_addresses)} - {request_id}")
+        return create_success_response(request_id, message=f"Messages sent to {len(request_data.email_addresses)} users")
+
     processed_mentions = process_mentions_by_email(access_token, request_data.mentions, request_id)
     
     # 指定された各ユーザーに個別DM送信
     for email_address in request_data.email_addresses:
         user_info = find_user_by_email(access_token, email_address, request_id)
-        chat_id = find_or_create_chat(access_token, user_info["id"], request_id)
-        post_message_to_chat(
-            access_token,
-            chat_id,
-            request_data.message_text,
-            request_data.content_type,
-            processed_mentions,
-            request_id
-        )
+        chat_id, chat_cached = resolve_chat_id(access_token, user_info["id"], request_id)
+        try:
+            post_message_to_chat(
+                access_token,
+                chat_id,
+                request_data.message_text,
+                request_data.content_type,
+                processed_mentions,
+                request_id
+            )
+        except APIException as e:
+            # キャッシュ済みチャットIDが無効な場合は破棄して1回だけ再検索
+            if e.status_code != 404 or not chat_cached:
+                raise
+            logger.warning(f"CHAT_ID_CACHE_STALE - {email_address} - {request_id}")
+            chat_id_cache.invalidate(user_info["id"])
+            chat_id, _ = resolve_chat_id(access_token, user_info["id"], request_id)
+            post_message_to_chat(
+                access_token,
+                chat_id,
+                request_data.message_text,
+                request_data.content_type,
+                processed_mentions,
+                request_id
+            )
     
     logger.info(f"DM_SEND_SUCCESS - Recipients:{len(request_data.email_addresses)} - {request_id}")
     return create_success_response(request_id, message=f"Messages sent to {len(request_data.email_addresses)} users")
 
+def send_dms_in_batches(request_data: DMRequestModel, access_token: str, request_id: str,
+                        delivery_key: Optional[str] = None) -> None:
+    """複数宛先DMの$batch送信
+
+    依存関係の順に3段階でまとめて実行し、サブレスポンスを宛先ごとの結果に対応付ける。
+      1. ユーザー解決（宛先とメンション対象をまとめて GET /users）
+      2. チャット解決（キャッシュに無い宛先のみ POST /chats）
+      3. メッセージ送信（POST /chats/{id}/messages）
+    失敗した宛先があっても他の宛先には送信し、最後に最初の失敗を例外として返す。
+    delivery_key 指定時は記録済みの宛先に送信せず、送信後に送信済み宛先を delivery_log_cache へ1回だけ保存する。
+    """
+    # 大文字小文字違いのアドレスは同じユーザーになるため1宛先にまとめる（表記は最初のものを使う）
+    unique_recipients = {}
+    for email_address in request_data.email_addresses:
+        unique_recipients.setdefault(user_cache_key(email_address), email_address)
+    recipients = list(unique_recipients.values())
+    failures = {}
+    # 今回送信できた宛先（user_cache_key）。resend のスレッドからも追加する
+    delivered = set()
+
+    def mark_delivered(email_address: str) -> None:
+        delivered.add(user_cache_key(email_address))
+
+    previously_delivered = set()
+    if delivery_key:
+        previously_delivered = set(delivery_log_cache.get(delivery_key) or [])
+        skipped = [e for e in recipients if user_cache_key(e) in previously_delivered]
+        if skipped:
+            logger.info(f"DM_ALREADY_DELIVERED - Skipped:{len(skipped)}/{len(recipients)} Key:{delivery_key} - {request_id}")
+            recipients = [e for e in recipients if e not in skipped]
+        if not recipients:
+            return
+
+    # 1. ユーザー解決（メンション対象も同じバッチで解決）
+    mention_emails = [m.email_address for m in request_data.mentions if m.mention_type == "user" and m.email_address]
+    users = find_users_by_email(access_token, recipients + mention_emails, request_id)
+    processed_mentions = process_mentions_by_email(access_token, request_data.mentions, request_id, resolved_users=users)
+
+    user_ids = {}
+    for email_address in recipients:
+        if isinstance(users[email_address], APIException):
+            failures[email_address] = users[email_address]
+        else:
+            user_ids[email_address] = users[email_address]["id"]
+
+    # 2. チャット解決（キャッシュ済みの宛先は作成APIを呼ばない）
+    chat_ids = {}
+    cached_chats = set()
+    unresolved = []
+    for email_address, user_id in user_ids.items():
+        cached = chat_id_cache.get(user_id)
+        if cached and cached is not NOT_FOUND:
+            chat_ids[email_address] = cached
+            cached_chats.add(email_address)
+        else:
+            unresolved.append(email_address)
+
+    if unresolved:
+        my_user_id = get_caller_user_id(access_token, request_id)
+        responses = execute_graph_batch(
+            [{"method": "POST", "url": "/chats", "body": build_one_on_one_chat_body(my_user_id, user_ids[e]), "retry_safe": True}
+             for e in unresolved],
+            access_token, request_id
+        )
+        fallbacks = []
+        for email_address, response in zip(unresolved, responses):
+            if is_batch_success(response):
+                chat_ids[email_address] = response["body"]["id"]
+                chat_id_cache.set(user_ids[email_address], response["body"]["id"])
+                continue
+            error = batch_response_error(response, "Chat creation failed")
+            if error.status_code == 401:
+                failures[email_address] = error
+            else:
+                fallbacks.append((email_address, error))
+
+        # 直接解決できなかった宛先のみ一覧検索へフォールバック（宛先ごとに並列）
+        def search_chat(item):
+            email_address, error = item
+            try:
+                return find_existing_chat(access_token, user_ids[email_address], request_id) or error
+            except APIException as e:
+                return e
+
+        for (email_address, _), result in zip(fallbacks, run_concurrently(search_chat, fallbacks)):
+            if isinstance(result, APIException):
+                failures[email_address] = result
+            else:
+                chat_ids[email_address] = result
+                chat_id_cache.set(user_ids[email_address], result)
+
+    # 3. メッセージ送信
+    message_body = build_chat_message_body(request_data.message_text, request_data.content_type, processed_mentions)
+    targets = list(chat_ids)
+    responses = execute_graph_batch(
+        [{"method": "POST", "url": f"/chats/{chat_ids[e]}/messages", "body": message_body} for e in targets],
+        access_token, request_id
+    )
+    stale = []
+    for email_address, response in zip(targets, responses):
+        if is_batch_success(response):
+            mark_delivered(email_address)
+            continue
+        error = batch_response_error(response, "Chat message send failed")
+        if error.status_code == 404 and email_address in cached_chats:
+            stale.append(email_address)
+        else:
+            failures[email_address] = error
+
+    # キャッシュ済みチャットIDが無効だった宛先は破棄して個別に再送（宛先ごとに並列）
+    def resend(email_address):
+        logger.warning(f"CHAT_ID_CACHE_STALE - {email_address} - {request_id}")
+        chat_id_cache.invalidate(user_ids[email_address])
+        try:
+            chat_id, _ = resolve_chat_id(access_token, user_ids[email_address], request_id)
+            post_message_to_chat(access_token, chat_id, request_data.message_text,
+                                 request_data.content_type, processed_mentions, request_id)
+            mark_delivered(email_address)
+            return None
+        except APIException as e:
+            return e
+
+    for email_address, error in zip(stale, run_concurrently(resend, stale)):
+        if error:
+            failures[email_address] = error
+
+    if delivery_key and delivered:
+        delivery_log_cache.set(delivery_key, sorted(previously_delivered | delivered))
+
+    if failures:
+        logger.error(f"DM_PARTIAL_FAILURE - Failed:{len(failures)}/{len(recipients)} - {request_id}")
+        # 認証エラーはトークン破棄のため優先して返す
+        unauthorized = [e for e in failures.values() if e.status_code == 401]
+        first_failure = next(failures[e] for e in recipients if e in failures)
+        raise unauthorized[0] if unauthorized else first_failure
+
 def handle_channel_mode(request_data: ChannelRequestModel, access_token: str, request_id: str) -> dict:
     """モード2: チャンネル送信処理"""
     logger.info(f"CHANNEL_SEND_START - Team:{request_data.team_name} Channel:{request_data.channel_name} - {request_id}")
     
-    team_id = find_team_id_by_name(access_token, request_data.team_name, request_id)
-    channel_id = find_channel_id_by_name(access_token, team_id, request_data.channel_name, request_id)
+    team_id, team_cached = resolve_team_id(access_token, request_data.team_name, request_id)
+    channel_id, channel_cached = resolve_channel_id(access_token, team_id, request_data.channel_name, request_id)
     processed_mentions = process_mentions_by_email(access_token, request_data.mentions, request_id)
-    
-    post_message_to_channel(
-        access_token,
-        team_id,
-        channel_id,
-        request_data.message_text,
-        request_data.content_type,
-        request_data.subject,
-        processed_mentions,
-        request_id
-    )
+
+    def post(team_id: str, channel_id: str) -> None:
+        post_message_to_channel(
+            access_token,
+            team_id,
+            channel_id,
+            request_data.message_text,
+            request_data.content_type,
+            request_data.subject,
+            processed_mentions,
+            request_id
+        )
+
+    try:
+        post(team_id, channel_id)
+    except APIException as e:
+        # キャッシュ済みIDが古い（チャンネル削除・再作成等）場合は破棄して1回だけ再解決
+        if e.status_code != 404 or not (team_cached or channel_cached):
+            raise
+        logger.warning(f"CHANNEL_ID_CACHE_STALE - Team:{request_data.team_name} Channel:{request_data.channel_name} - {request_id}")
+        team_id_cache.invalidate(request_data.team_name)
+        channel_id_cache.invalidate(channel_cache_key(team_id, request_data.channel_name))
+        team_id, _ = resolve_team_id(access_token, request_data.team_name, request_id)
+        channel_id, _ = resolve_channel_id(access_token, team_id, request_data.channel_name, request_id)
+        post(team_id, channel_id)
 
     logger.info(f"CHANNEL_SEND_SUCCESS - Team:{request_data.team_name} Channel:{request_data.channel_name} - {request_id}")
     return create_success_response(request_id, message=f"Message posted to {request_data.team_name}/{request_data.channel_name}")
 
 # ========== 共通処理関数 ==========
 
-def validate_and_parse_request(body_json: str) -> Union[DMRequestModel, ChannelRequestModel, RefreshTokenRequestModel]:
-    """リクエストボディのバリデーション・解析"""
+def get_access_token(request_id: str) -> str:
+    """アクセストークン取得（有効期限内はキャッシュ、期限間近のみリフレッシュ）"""
+    cached_token = get_cached_access_token()
+    if cached_token:
+        logger.info(f"TOKEN_CACHE_HIT - {request_id}")
+        return cached_token
+
+    logger.info(f"TOKEN_CACHE_MISS - {request_id}")
+    if ACCESS_TOKEN_PARAM_NAME:
+        if BACKGROUND_TOKEN_REFRESH:
+            # 期限間近でも失効するまでは共有トークンを使い、更新は token_refresher_handler に任せる
+            shared_token = read_shared_access_token(request_id, BACKGROUND_TOKEN_MIN_REMAINING_SECONDS)
+            if shared_token:
+                return shared_token
+            # 事前更新が停止して共有トークンが失効した場合のみ、送信処理側でローテーションする
+            logger.warning(f"SHARED_TOKEN_EXPIRED - Background refresh did not publish a valid token - {request_id}")
+            emit_inline_token_refresh_metric(request_id, "Expired")
+            return rotate_tokens_with_lock(request_id, min_remaining_seconds=BACKGROUND_TOKEN_MIN_REMAINING_SECONDS)
+        return rotate_tokens_with_lock(request_id)
+
+    refresh_token = get_refresh_token_from_ssm(REFRESH_TOKEN_PARAM_NAME)
+    access_token, new_refresh_token = refresh_access_token(refresh_token, request_id)
+
+    if new_refresh_token and new_refresh_token != refresh_token:
+        save_refresh_token_to_ssm(new_refresh_token, REFRESH_TOKEN_PARAM_NAME)
+        logger.info(f"TOKEN_UPDATED - {request_id}")
+
+    return access_token
+
+def emit_inline_token_refresh_metric(request_id: str, reason: str) -> None:
+    """事前更新に任せず送信処理でローテーションしたことをEMFメトリクスとして出力
+
+    reason は Expired（共有トークンの失効）または Rejected（Graph APIの401）。
+    """
     try:
-        body = json.loads(body_json)
-    except json.JSONDecodeError as e:
-        raise APIException(400, f"Invalid JSON format: {str(e)}")
-    
+        emit_metrics(
+            METRICS_NAMESPACE,
+            {"Api": "Token"},
+            {"InlineTokenRefresh": (1, "Count")},
+            properties={"RequestId": request_id, "Reason": reason}
+        )
+    except Exception as e:
+        logger.warning(f"METRICS_EMIT_ERROR - {str(e)} - {request_id}")
+
+def get_cached_access_token() -> Optional[str]:
+    """安全マージンを考慮して有効なキャッシュ済みアクセストークンを返す"""
+    with _access_token_lock:
+        if _access_token_cache["access_token"] and \
+                time.time() < _access_token_cache["expires_at"] - ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS:
+            return _access_token_cache["access_token"]
+    return None
+
+def cache_access_token(access_token: Optional[str], expires_in: Optional[int]) -> None:
+    """アクセストークンを有効期限付きでキャッシュ"""
+    if not access_token:
+        return
     try:
-        mode = body.get("mode")
-        
-        if mode == 1:
-            return DMRequestModel(**body)
-        elif mode == 2:
-            return ChannelRequestModel(**body)
-        elif mode == 3:
-            return RefreshTokenRequestModel(**body)
+        lifetime = int(expires_in) if expires_in else DEFAULT_ACCESS_TOKEN_LIFETIME_SECONDS
+    except (TypeError, ValueError):
+        lifetime = DEFAULT_ACCESS_TOKEN_LIFETIME_SECONDS
+
+    with _access_token_lock:
+        _access_token_cache["access_token"] = access_token
+        _access_token_cache["expires_at"] = time.time() + lifetime
+
+def invalidate_access_token_cache() -> None:
+    """アクセストークンキャッシュの破棄"""
+    with _access_token_lock:
+        _access_token_cache["access_token"] = None
+        _access_token_cache["expires_at"] = 0.0
+        _caller_identity_cache["access_token"] = None
+        _caller_identity_cache["user_id"] = None
+
+def replace_rejected_access_token(access_token: str, request_id: str) -> None:
+    """Graph APIが401で拒否したアクセストークンの破棄
+
+    メモリキャッシュを破棄し、共有ストア利用時は共有トークンが拒否されたトークンのままであれば
+    ローテーションして置き換える（他インスタンスが置き換え済みならその結果を再利用する）。
+    BACKGROUND_TOKEN_REFRESH 有効時も次回の事前更新を待たずにこの場で置き換える。
+    置き換えに失敗しても呼び出し元の応答は変えず、次回呼び出しで改めて取得する。
+    """
+    invalidate_access_token_cache()
+    if not ACCESS_TOKEN_PARAM_NAME:
+        return
+    min_remaining_seconds = ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS
+    if BACKGROUND_TOKEN_REFRESH:
+        logger.warning(f"SHARED_TOKEN_REVOKED - Replacing before the next scheduled refresh - {request_id}")
+        emit_inline_token_refresh_metric(request_id, "Rejected")
+        min_remaining_seconds = BACKGROUND_TOKEN_MIN_REMAINING_SECONDS
+    try:
+        rotate_tokens_with_lock(request_id, rejected_token=access_token, min_remaining_seconds=min_remaining_seconds)
+        logger.info(f"SHARED_TOKEN_REPLACED - {request_id}")
+    except APIException as e:
+        logger.error(f"SHARED_TOKEN_REPLACE_ERROR - Status:{e.status_code} Message:{e.message} - {request_id}")
+
+def rotate_tokens_with_lock(request_id: str, force: bool = False, rejected_token: Optional[str] = None,
+                            min_remaining_seconds: int = ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS) -> str:
+    """共有ストア経由のアクセストークン取得（ローテーションは1インスタンスのみ）
+
+    有効な共有トークンがあればそれを使い、無ければリースを取得した
+    1インスタンスだけがリフレッシュトークンをローテーションする。
+    リースを取れなかったインスタンスは新しいトークンの公開を待って再利用する。
+    rejected_token（Graph APIが401で拒否したトークン）と同じ共有トークンは無効として扱い、
+    残り有効時間が min_remaining_seconds 以下の共有トークンも再利用しない。
+    """
+    deadline = time.time() + TOKEN_LOCK_WAIT_SECONDS
+    poll_interval = 0.0
+    while True:
+        if not force:
+            shared_token = read_shared_access_token(request_id, min_remaining_seconds, rejected_token)
+            if shared_token:
+                return shared_token
+
+        if acquire_token_lock(request_id):
+            try:
+                # リース取得までに他インスタンスが更新済みなら再利用
+                shared_token = None if force else read_shared_access_token(request_id, min_remaining_seconds, rejected_token)
+                return shared_token or rotate_refresh_token(request_id)
+            finally:
+                release_token_lock(request_id)
+
+        if force:
+            # 強制更新中に他インスタンスがローテーション中なら、その結果を待つ
+            force = False
+
+        if time.time() >= deadline:
+            logger.error(f"TOKEN_LOCK_TIMEOUT - {request_id}")
+            raise APIException(503, "Token rotation in progress by another instance")
+
+        # 待機中の全インスタンスが同時に再試行しないようジッターを入れる
+        upper = max(TOKEN_LOCK_POLL_INTERVAL_SECONDS, poll_interval * 2)
+        poll_interval = min(TOKEN_LOCK_MAX_POLL_INTERVAL_SECONDS, random.uniform(TOKEN_LOCK_POLL_INTERVAL_SECONDS, upper))
+        logger.info(f"TOKEN_LOCK_WAIT - Interval:{poll_interval:.2f}s - {request_id}")
+        time.sleep(min(poll_interval, max(0.0, deadline - time.time())))
+
+def rotate_refresh_token(request_id: str) -> str:
+    """リフレッシュトークンのローテーション（バージョン比較付き保存）と共有トークン公開"""
+    refresh_token, version = get_refresh_token_with_version(REFRESH_TOKEN_PARAM_NAME)
+    access_token, new_refresh_token = refresh_access_token(refresh_token, request_id)
+
+    if new_refresh_token and new_refresh_token != refresh_token:
+        if save_refresh_token_if_unchanged(new_refresh_token, REFRESH_TOKEN_PARAM_NAME, version):
+            logger.info(f"TOKEN_UPDATED - Version:{version} - {request_id}")
         else:
-            raise APIException(400, f"Invalid mode: {mode}. Must be 1 (DM), 2 (channel), or 3 (refresh_token)")
-            
-    except ValidationError as e:
-        raise APIException(400, f"Validation failed: {str(e)}")
-    except APIException:
+            logger.warning(f"TOKEN_CAS_CONFLICT - ExpectedVersion:{version} - {request_id}")
+
+    with _access_token_lock:
+        if _access_token_cache["access_token"] == access_token:
+            expires_at = _access_token_cache["expires_at"]
+        else:
+            expires_at = time.time() + DEFAULT_ACCESS_TOKEN_LIFETIME_SECONDS
+    cache_access_token(access_token, int(expires_at - time.time()))
+    publish_shared_access_token(access_token, expires_at, request_id)
+    return access_token
+
+def read_shared_access_token(request_id: str,
+                             min_remaining_seconds: int = ACCESS_TOKEN_EXPIRY_MARGIN_SECONDS,
+                             rejected_token: Optional[str] = None) -> Optional[str]:
+    """共有ストアから残り min_remaining_seconds 秒を超えて有効なアクセストークンを取得しメモリキャッシュへ反映
+
+    rejected_token と同じトークンは有効期限内でも返さない。
+    """
+    shared = get_shared_access_token_record(request_id)
+    if shared is None:
+        return None
+
+    remaining = shared.get("expires_at", 0) - time.time()
+    if not shared.get("access_token") or remaining <= min_remaining_seconds:
+        return None
+    if rejected_token and shared["access_token"] == rejected_token:
+        logger.info(f"SHARED_TOKEN_REJECTED - {request_id}")
+        return None
+
+    logger.info(f"SHARED_TOKEN_HIT - {request_id}")
+    cache_access_token(shared["access_token"], int(remaining))
+    return shared["access_token"]
+
+def get_shared_access_token_record(request_id: str) -> Optional[dict]:
+    """共有ストアの内容（access_token・expires_at）を取得（未公開・形式不正はNone）"""
+    from botocore.exceptions import ClientError
+    try:
+        response = ssm_client.get_parameter(Name=ACCESS_TOKEN_PARAM_NAME, WithDecryption=True)
+        shared = json.loads(response['Parameter']['Value'])
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ParameterNotFound':
+            return None
+        raise APIException(500, f"SSM parameter get failed: {str(e)}")
+    except (ValueError, KeyError, TypeError):
+        logger.warning(f"SHARED_TOKEN_INVALID - {request_id}")
+        return None
+    return shared if isinstance(shared, dict) else None
+
+def publish_shared_access_token(access_token: str, expires_at: float, request_id: str) -> None:
+    """アクセストークンを有効期限付きで共有ストアへ保存"""
+    try:
+        ssm_client.put_parameter(
+            Name=ACCESS_TOKEN_PARAM_NAME,
+            Value=json.dumps({"access_token": access_token, "expires_at": expires_at}),
+            Type="SecureString",
+            Overwrite=True
+        )
+        logger.info(f"SHARED_TOKEN_PUBLISHED - {request_id}")
+    except Exception as e:
+        raise APIException(500, f"SSM parameter save failed: {str(e)}")
+
+def acquire_token_lock(request_id: str) -> bool:
+    """トークンローテーション用リースの取得
+
+    リースが無いか期限切れの場合のみ書き込む条件付き PutItem で排他するため、
+    期限切れリースの奪取も1インスタンスだけが成功する。
+    スロットリング時は取得できなかったものとして扱い、呼び出し側の待機に委ねる。
+    """
+    from botocore.exceptions import ClientError
+    if not TOKEN_LOCK_TABLE_NAME:
+        raise APIException(500, "TOKEN_LOCK_TABLE_NAME is not configured")
+
+    now = time.time()
+    try:
+        dynamodb_client.put_item(
+            TableName=TOKEN_LOCK_TABLE_NAME,
+            Item={
+                "lock_name": {"S": TOKEN_LOCK_NAME},
+                "owner": {"S": request_id},
+                "expires_at": {"N": str(now + TOKEN_LOCK_LEASE_SECONDS)}
+            },
+            ConditionExpression="attribute_not_exists(lock_name) OR expires_at < :now",
+            ExpressionAttributeValues={":now": {"N": str(now)}}
+        )
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        if code == 'ConditionalCheckFailedException':
+            return False
+        if code in AWS_THROTTLING_ERROR_CODES:
+            logger.warning(f"TOKEN_LOCK_THROTTLED - {request_id}")
+            return False
+        raise APIException(500, f"Token lock acquire failed: {str(e)}")
+
+    logger.info(f"TOKEN_LOCK_ACQUIRED - {request_id}")
+    return True
+
+def release_token_lock(request_id: str) -> None:
+    """自身が保持するリースの解放（所有者が一致する場合のみ削除）"""
+    from botocore.exceptions import ClientError
+    try:
+        dynamodb_client.delete_item(
+            TableName=TOKEN_LOCK_TABLE_NAME,
+            Key={"lock_name": {"S": TOKEN_LOCK_NAME}},
+            ConditionExpression="#owner = :owner",
+            ExpressionAttributeNames={"#owner": "owner"},
+            ExpressionAttributeValues={":owner": {"S": request_id}}
+        )
+        logger.info(f"TOKEN_LOCK_RELEASED - {request_id}")
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            # 期限切れ後に他インスタンスが取得したリースは削除しない
+            logger.warning(f"TOKEN_LOCK_NOT_OWNER - {request_id}")
+            return
+        # 解放に失敗してもリース期限切れで回収される
+        logger.warning(f"TOKEN_LOCK_RELEASE_ERROR - {str(e)} - {request_id}")
+
+def run_idempotent(request_data: Union[DMRequestModel, ChannelRequestModel], request_id: str,
+                   send: Callable[[], dict], stage: str = "sent") -> dict:
+    """idempotency_key 付きリクエストの重複実行防止
+
+    同じキー・同じ内容のリクエストが IDEMPOTENCY_TTL_SECONDS 以内に再送された場合は
+    保存済みのレスポンスを返す。キーが同じで内容が異なる場合は422。
+    保存するのは成功（200/202）のみで、失敗したリクエストは再送時に再実行する。
+    stage はキュー受付（accepted）とGraph送信（sent）を区別し、受付済みのメッセージを
+    ワーカーが送信済みと誤認しないようにする。同時に処理中の重複は防がない。
+    ID_CACHE_BUCKET_NAME 未設定時は同一コンテナに届いた再送のみ検出できる。
+    """
+    if not request_data.idempotency_key:
+        return send()
+
+    if not ID_CACHE_BUCKET_NAME:
+        logger.warning(f"IDEMPOTENCY_LOCAL_ONLY - Retries reaching another container are not detected "
+                       f"Key:{request_data.idempotency_key} - {request_id}")
+    stored = idempotency_cache.get(idempotency_record_key(request_data, stage))
+    if stored and stored is not NOT_FOUND:
+        if stored["fingerprint"] != request_fingerprint(request_data):
+            raise APIException(422, f"Idempotency key reused with a different request: {request_data.idempotency_key}")
+        logger.info(f"IDEMPOTENT_REPLAY - Key:{request_data.idempotency_key} Stage:{stage} - {request_id}")
+        return stored["response"]
+
+    response = send()
+    record_idempotent_response(request_data, response, stage)
+    return response
+
+def idempotency_record_key(request_data: Union[DMRequestModel, ChannelRequestModel], stage: str) -> str:
+    return f"{stage}/{request_data.mode}/{request_data.idempotency_key}"
+
+def has_idempotent_record(request_data: Union[DMRequestModel, ChannelRequestModel], stage: str = "sent") -> bool:
+    """冪等キーの記録（同じ内容の成功結果、または内容の異なる使い回し）があるか"""
+    if not request_data.idempotency_key:
+        return False
+    stored = idempotency_cache.get(idempotency_record_key(request_data, stage))
+    return bool(stored) and stored is not NOT_FOUND
+
+def record_idempotent_response(request_data: Union[DMRequestModel, ChannelRequestModel], response: dict,
+                               stage: str = "sent") -> None:
+    """成功（200/202）したレスポンスを冪等キーで保存（キー無しのリクエストは保存しない）"""
+    if request_data.idempotency_key and response["statusCode"] in [200, 202]:
+        idempotency_cache.set(idempotency_record_key(request_data, stage),
+                              {"fingerprint": request_fingerprint(request_data), "response": response})
+
+def request_fingerprint(request_data: Union[DMRequestModel, ChannelRequestModel]) -> str:
+    """冪等キーの使い回し検出用にリクエスト内容をハッシュ化"""
+    payload = request_data.model_dump(mode="json", exclude={"async_delivery", "idempotency_key"})
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def enqueue_message_request(request_data: Union[DMRequestModel, ChannelRequestModel], request_id: str) -> dict:
+    """送信リクエストをキューへ投入し202レスポンスを返す"""
+    return create_accepted_response(request_id, send_to_queue(request_data, request_id))
+
+def enqueue_batch_request(request_data: "BatchRequestModel", request_id: str) -> dict:
+    """一括送信の各メッセージを個別にキューへ投入し202レスポンスを返す
+
+    一部の投入に失敗した場合は、メッセージごとの受付結果（message_id または失敗理由）を
+    207で返し、呼び出し元が失敗したメッセージだけを再送できるようにする。
+    idempotency_key 付きのメッセージは受付済みであれば再投入しない。全件失敗時は例外を送出する。
+    """
+    results = []
+    for index, message in enumerate(request_data.messages):
+        try:
+            response = run_idempotent(message, request_id,
+                                      lambda: enqueue_message_request(message, request_id), stage="accepted")
+            message_id = json.loads(response["body"])["data"]["message_id"]
+            results.append({"index": index, "mode": message.mode, "status": 202, "message_id": message_id})
+        except APIException as e:
+            logger.error(f"BATCH_ENQUEUE_ERROR - Index:{index} Status:{e.status_code} Message:{e.message} - {request_id}")
+            results.append({"index": index, "mode": message.mode, "status": e.status_code, "message": e.message})
+
+    failed = [result for result in results if result["status"] >= 400]
+    if not failed:
+        return create_accepted_response(request_id, [result["message_id"] for result in results])
+    if len(failed) == len(results):
+        # 1件も投入されていないため、呼び出し元はそのまま再送できる
+        raise APIException(failed[0]["status"], failed[0]["message"])
+
+    logger.warning(f"BATCH_PARTIALLY_ACCEPTED - Accepted:{len(results) - len(failed)}/{len(results)} - {request_id}")
+    response = create_success_response(
+        request_id, {"message_ids": [result.get("message_id") for result in results], "results": results},
+        message=f"{len(results) - len(failed)}/{len(results)} messages accepted"
+    )
+    response['statusCode'] = 207
+    return response
+
+def send_to_queue(request_data: Union[DMRequestModel, ChannelRequestModel], request_id: str) -> str:
+    """送信リクエストをキューへ投入しメッセージIDを返す"""
+    if message_queue is None:
+        raise APIException(500, "Async delivery queue not configured")
+
+    envelope = {
+        "request_id": request_id,
+        "enqueued_at": time.time(),
+        "request": request_data.model_dump(mode="json", exclude={"async_delivery"})
+    }
+    try:
+        message_id = message_queue.send(envelope)
+    except Exception as e:
+        raise APIException(500, f"Queue send failed: {str(e)}")
+
+    logger.info(f"MESSAGE_ENQUEUED - MessageId:{message_id} - {request_id}")
+    return message_id
+
+def process_queued_message(record: dict, access_token: str,
+                           envelope: Union[QueuedMessageModel, APIException, None] = None) -> bool:
+    """キューの1メッセージを送信（戻り値: 処理済みならTrue、再配信が必要ならFalse）
+
+    envelope には parse_queued_records で解析済みの結果を渡せる（省略時は本文を解析する）。
+    """
+    message_id = record.get("messageId")
+    request_id = message_id
+    try:
+        if envelope is None:
+            envelope = parse_queued_message(record["body"])
+        if isinstance(envelope, APIException):
+            raise envelope
+        request_id = envelope.request_id or message_id
+        request_data = envelope.request
+
+        if request_data.mode == 1:
+            # 再配信時は前回送信済みの宛先を除く（SQSのメッセージIDは再配信でも変わらない）
+            run_idempotent(request_data, request_id,
+                           lambda: handle_dm_mode(request_data, access_token, request_id, delivery_key=message_id))
+        elif request_data.mode == 2:
+            run_idempotent(request_data, request_id, lambda: handle_channel_mode(request_data, access_token, request_id))
+        else:
+            raise APIException(400, f"Mode {request_data.mode} cannot be queued")
+
+        logger.info(f"QUEUE_MESSAGE_DELIVERED - MessageId:{message_id} - {request_id}")
+        return True
+
+    except APIException as e:
+        if not is_retryable_delivery_error(e):
+            # 再配信しても成功しない失敗（宛先不明・バリデーション等）は破棄する
+            logger.error(f"QUEUE_MESSAGE_DROPPED - MessageId:{message_id} Status:{e.status_code} Message:{e.message} - {request_id}")
+            return True
+        if e.status_code == 401:
+            replace_rejected_access_token(access_token, request_id)
+        logger.warning(f"QUEUE_MESSAGE_RETRY - MessageId:{message_id} Status:{e.status_code} Message:{e.message} - {request_id}")
+        return False
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"QUEUE_MESSAGE_DROPPED - MessageId:{message_id} Invalid message:{str(e)} - {request_id}")
+        return True
+    except Exception as e:
+        logger.error(f"QUEUE_MESSAGE_ERROR - MessageId:{message_id} Error:{str(e)} - {request_id}")
+        return False
+
+def coalesce_channel_records(records: List[dict], request_id: str, parsed: Optional[dict] = None) -> List[List[dict]]:
+    """同一チーム・チャンネル宛てで CHANNEL_COALESCE_WINDOW_SECONDS 以内に投入されたメッセージをグループ化
+
+    チャンネル送信以外・解析できないメッセージは1件ずつのグループとする。
+    まとめた結果が文字数・メンション数の上限を超える場合は新しいグループを始める。
+    parsed には parse_queued_records の結果を渡せる（省略時はここで解析する）。
+    """
+    if CHANNEL_COALESCE_WINDOW_SECONDS <= 0 or len(records) <= 1:
+        return [[record] for record in records]
+
+    if parsed is None:
+        parsed = parse_queued_records(records)
+    groups = []
+    channel_items = {}
+    for record in records:
+        envelope = parsed.get(record.get("messageId"))
+        if not isinstance(envelope, QueuedMessageModel) or envelope.request.mode != 2:
+            groups.append([record])
+            continue
+        request_data = envelope.request
+        key = (request_data.team_name, request_data.channel_name)
+        channel_items.setdefault(key, []).append((envelope.enqueued_at, record, request_data))
+
+    for items in channel_items.values():
+        items.sort(key=lambda item: item[0])
+        group, group_requests, group_started = [], [], None
+        for enqueued_at, record, request_data in items:
+            if group and enqueued_at - group_started <= CHANNEL_COALESCE_WINDOW_SECONDS:
+                try:
+                    merge_channel_requests(group_requests + [request_data])
+                    group.append(record)
+                    group_requests.append(request_data)
+                    continue
+                except ValidationError:
+                    pass
+            if group:
+                groups.append(group)
+            group, group_requests, group_started = [record], [request_data], enqueued_at
+        groups.append(group)
+
+    if len(groups) < len(records):
+        logger.info(f"CHANNEL_COALESCED - Messages:{len(records)} Posts:{len(groups)} - {request_id}")
+    return groups
+
+def merge_channel_requests(requests: List[ChannelRequestModel]) -> ChannelRequestModel:
+    """複数のチャンネル送信リクエストを1投稿にまとめる（本文・メンションは全て保持）"""
+    if len(requests) == 1:
+        return requests[0]
+
+    content_type = "html" if any(r.content_type == "html" for r in requests) else "text"
+    subjects = [r.subject for r in requests]
+    parts = []
+    for r in requests:
+        body = r.message_text
+        if content_type == "html" and r.content_type == "text":
+            body = html.escape(body).replace("\n", "<br>")
+        if r.subject:
+            heading = f"<p><strong>{html.escape(r.subject)}</strong></p>" if content_type == "html" else f"【{r.subject}】\n"
+            body = heading + body
+        parts.append(body)
+
+    mentions = list({m.email_address.lower(): m for r in requests for m in r.mentions}.values())
+    subject = subjects[0] if len(set(subjects)) == 1 else f"{next(s for s in subjects if s)} ほか{len(requests) - 1}件"
+    return ChannelRequestModel(
+        mode=2,
+        team_name=requests[0].team_name,
+        channel_name=requests[0].channel_name,
+        message_text=("<hr>" if content_type == "html" else "\n\n----------\n\n").join(parts),
+        content_type=content_type,
+        subject=subject[:255],
+        mentions=mentions
+    )
+
+def process_queued_group(group: List[dict], access_token: str, parsed: Optional[dict] = None) -> List[str]:
+    """グループ単位で送信（戻り値: 再配信が必要なメッセージID）
+
+    複数件はまとめた1投稿として送信する。まとめた投稿が再試行可能なエラーで失敗した場合は
+    全件を再配信し、それ以外（メンション先不明等）で失敗した場合は1件ずつ送り直して
+    原因のメッセージだけを失敗として扱う。冪等キー付きのメッセージは投稿後に1件ずつ記録し、
+    記録済みのもの（再配信）は投稿に含めない。
+    """
+    if parsed is None:
+        parsed = parse_queued_records(group)
+    if len(group) > 1:
+        # 記録済みの結果の再利用・キー使い回しの検出は1件ずつの処理に任せ、残りをまとめて投稿する
+        replayed = [record for record in group if has_idempotent_record(parsed[record["messageId"]].request)]
+        if replayed:
+            retry_ids = [message_id for record in replayed for message_id in process_queued_group([record], access_token, parsed)]
+            remaining = [record for record in group if record not in replayed]
+            return retry_ids + (process_queued_group(remaining, access_token, parsed) if remaining else [])
+    if len(group) == 1:
+        delivered = process_queued_message(group[0], access_token, parsed.get(group[0].get("messageId")))
+        return [] if delivered else [group[0]["messageId"]]
+
+    message_ids = [record["messageId"] for record in group]
+    envelopes = [parsed[message_id] for message_id in message_ids]
+    merged = merge_channel_requests([envelope.request for envelope in envelopes])
+    request_ids = [envelope.request_id for envelope in envelopes]
+    request_id = request_ids[0] or message_ids[0]
+    logger.info(f"CHANNEL_COALESCED_POST - Messages:{len(group)} RequestIds:{','.join(filter(None, request_ids))}")
+    try:
+        response = handle_channel_mode(merged, access_token, request_id)
+        for envelope in envelopes:
+            record_idempotent_response(envelope.request, response)
+        logger.info(f"QUEUE_MESSAGE_DELIVERED - MessageIds:{','.join(message_ids)} - {request_id}")
+        return []
+    except APIException as e:
+        if is_retryable_delivery_error(e):
+            if e.status_code == 401:
+                replace_rejected_access_token(access_token, request_id)
+            logger.warning(f"QUEUE_MESSAGE_RETRY - MessageIds:{','.join(message_ids)} Status:{e.status_code} Message:{e.message} - {request_id}")
+            return message_ids
+        logger.warning(f"CHANNEL_COALESCED_FALLBACK - Status:{e.status_code} Message:{e.message} - {request_id}")
+    except Exception as e:
+        logger.error(f"QUEUE_MESSAGE_ERROR - MessageIds:{','.join(message_ids)} Error:{str(e)} - {request_id}")
+        return message_ids
+
+    return [
+        message_id for record, message_id in zip(group, message_ids)
+        if not process_queued_message(record, access_token, parsed[message_id])
+    ]
+
+def is_retryable_delivery_error(error: APIException) -> bool:
+    """キュー再配信で解決し得るエラーか（認証・スロットリング・サーバー側エラー）"""
+    return error.status_code in [401, 429] or error.status_code >= 500
+
+def resolve_team_id(access_token: str, team_name: str, request_id: str) -> tuple[str, bool]:
+    """キャッシュ経由でチームIDを解決（戻り値: チームID, キャッシュヒット有無）"""
+    cached = team_id_cache.get(team_name)
+    if cached is NOT_FOUND:
+        logger.info(f"TEAM_ID_CACHE_NEGATIVE_HIT - {team_name} - {request_id}")
+        raise APIException(404, f"Team not found: {team_name}")
+    if cached:
+        logger.info(f"TEAM_ID_CACHE_HIT - {team_name} - {request_id}")
+        return cached, True
+
+    try:
+        team_id = find_team_id_by_name(access_token, team_name, request_id)
+    except APIException as e:
+        if e.status_code == 404:
+            team_id_cache.set_not_found(team_name)
+        raise
+    team_id_cache.set(team_name, team_id)
+    return team_id, False
+
+def resolve_channel_id(access_token: str, team_id: str, channel_name: str, request_id: str) -> tuple[str, bool]:
+    """キャッシュ経由でチャンネルIDを解決（戻り値: チャンネルID, キャッシュヒット有無）"""
+    cache_key = channel_cache_key(team_id, channel_name)
+    cached = channel_id_cache.get(cache_key)
+    if cached is NOT_FOUND:
+        logger.info(f"CHANNEL_ID_CACHE_NEGATIVE_HIT - {channel_name} - {request_id}")
+        raise APIException(404, f"Channel not found: {channel_name}")
+    if cached:
+        logger.info(f"CHANNEL_ID_CACHE_HIT - {channel_name} - {request_id}")
+        return cached, True
+
+    try:
+        channel_id = find_channel_id_by_name(access_token, team_id, channel_name, request_id)
+    except APIException as e:
+        if e.status_code == 404:
+            channel_id_cache.set_not_found(cache_key)
         raise
+    channel_id_cache.set(cache_key, channel_id)
+    return channel_id, False
+
+def resolve_chat_id(access_token: str, target_user_id: str, request_id: str) -> tuple[str, bool]:
+    """キャッシュ経由で1:1チャットIDを解決（戻り値: チャットID, キャッシュヒット有無）"""
+    cached = chat_id_cache.get(target_user_id)
+    if cached and cached is not NOT_FOUND:
+        logger.info(f"CHAT_ID_CACHE_HIT - {request_id}")
+        return cached, True
+
+    chat_id = find_or_create_chat(access_token, target_user_id, request_id)
+    chat_id_cache.set(target_user_id, chat_id)
+    return chat_id, False
+
+def channel_cache_key(team_id: str, channel_name: str) -> str:
+    """チャンネルIDキャッシュのキー（チャンネル名はチーム内でのみ一意）"""
+    return f"{team_id}/{channel_name}"
+
+def reset_caches() -> None:
+    """モジュール内キャッシュの全破棄（テスト・障害復旧用）"""
+    invalidate_access_token_cache()
+    team_id_cache.clear()
+    channel_id_cache.clear()
+    chat_id_cache.clear()
+    user_directory_cache.clear()
+    idempotency_cache.clear()
+    delivery_log_cache.clear()
+    with _retry_lock:
+        _retry_window["active"] = False
+
+def validate_and_parse_request(body_json: Union[str, bytes]) -> Union[DMRequestModel, ChannelRequestModel, RefreshTokenRequestModel, BatchRequestModel]:
+    """リクエストボディのバリデーション・解析（JSON解析・mode振り分け・検証を1パスで行う）"""
+    try:
+        return REQUEST_ADAPTER.validate_json(body_json)
+    except ValidationError as e:
+        raise request_validation_error(e)
     except Exception as e:
         raise APIException(400, f"Request validation failed: {str(e)}")
 
+def request_validation_error(error: ValidationError, mode_loc: tuple = ()) -> APIException:
+    """ValidationError を400エラーへ変換（mode_loc: 判別タグ mode を持つオブジェクトの位置）"""
+    first = error.errors(include_url=False)[0]
+    if first["type"] == "json_invalid":
+        return APIException(400, f"Invalid JSON format: {first['ctx']['error']}")
+    if first["type"] in ["union_tag_invalid", "union_tag_not_found"] and tuple(first["loc"]) == mode_loc:
+        mode = (first.get("ctx") or {}).get("tag")
+        return APIException(400, f"Invalid mode: {mode}. Must be 1 (DM), 2 (channel), 3 (refresh_token), or 4 (batch)")
+    return APIException(400, f"Validation failed: {str(error)}")
+
+def parse_queued_message(body: Union[str, bytes]) -> QueuedMessageModel:
+    """キューメッセージ本文（エンベロープ）のバリデーション・解析"""
+    try:
+        return QueuedMessageModel.model_validate_json(body)
+    except ValidationError as e:
+        raise request_validation_error(e, mode_loc=("request",))
+
+def parse_queued_records(records: List[dict]) -> dict:
+    """受信したキューメッセージをまとめて解析（戻り値: messageId → エンベロープ、または APIException）
+
+    1件の不正なメッセージで他のメッセージの処理を止めないよう、失敗は例外を返り値として保持する。
+    """
+    parsed = {}
+    for record in records:
+        message_id = record.get("messageId")
+        try:
+            parsed[message_id] = parse_queued_message(record["body"])
+        except APIException as e:
+            parsed[message_id] = e
+        except (KeyError, TypeError) as e:
+            parsed[message_id] = APIException(400, f"Invalid message: {str(e)}")
+    return parsed
+
 def make_graph_request(method: str, endpoint: str, access_token: str, 
-                      body: Optional[dict] = None, request_id: Optional[str] = None) -> dict:
-    """Microsoft Graph APIリクエスト共通処理"""
+                      body: Optional[dict] = None, request_id: Optional[str] = None,
+                      retry_safe: bool = False) -> dict:
+    """Microsoft Graph APIリクエスト共通処理
+
+    429/503/504・通信エラーは冪等なメソッド、または retry_safe=True の呼び出し
+    （重複実行しても結果が変わらないPOST）のみ再試行する。
+    429は未実行が保証されるため、メッセージ送信等のPOSTも Retry-After に従って再試行する。
+    """
     if request_id is None:
         raise ValueError("request_id is required for logging")
     
-    url = f"https://graph.microsoft.com/v1.0{endpoint}"
+    url = f"{GRAPH_API_BASE_URL}{endpoint}"
     headers = {
         "Authorization": f"Bearer {access_token}",
         "Content-Type": "application/json"
     }
     
     logger.info(f"GRAPH_API_CALL - {method} {endpoint} - {request_id}")
+    retryable = retry_safe or method in GRAPH_IDEMPOTENT_METHODS
+    started = time.perf_counter()
+    status, attempts, response_bytes = 0, 1, 0
     
     try:
-        if body:
-            response = http.request(method, url, headers=headers, body=json.dumps(body, ensure_ascii=False).encode("utf-8"))
-        else:
-            response = http.request(method, url, headers=headers)
+        response, attempts = send_with_retry(method, url, headers, body, retryable, request_id)
+        status = response.status
+        response_bytes = len(response.data) if isinstance(response.data, bytes) else 0
         
         # 外部APIレスポンス解析
         try:
@@ -276,7 +1449,9 @@ def make_graph_request(method: str, endpoint: str, access_token: str,
         elif response.status not in [200, 201]:
             raise ExternalAPIException(502, "External API error", response.status, external_message)
         
-        logger.info(f"GRAPH_API_SUCCESS - Status:{response.status} - {request_id}")
+        duration_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"GRAPH_API_SUCCESS - Status:{response.status} Attempts:{attempts} Duration:{duration_ms:.0f}ms "
+                    f"Bytes:{response_bytes} - {request_id}")
         return json.loads(response.data.decode())
         
     except ExternalAPIException:
@@ -284,6 +1459,360 @@ def make_graph_request(method: str, endpoint: str, access_token: str,
     except Exception as e:
         logger.error(f"GRAPH_API_EXCEPTION - Error:{str(e)} - {request_id}")
         raise APIException(502, f"Graph API request failed: {str(e)}")
+    finally:
+        graph_call_log.record(method, endpoint, status, attempts, (time.perf_counter() - started) * 1000, response_bytes)
+
+def send_with_retry(method: str, url: str, headers: dict, body: Optional[dict], retryable: bool, request_id: str):
+    """HTTPリクエスト送信（429は常に、503/504・通信エラーは再試行可能な呼び出しのみ再試行）
+
+    送信中は _graph_request_slots の枠を保持する（再試行の待機中は保持しない）。
+    戻り値: (最後のレスポンス, 送信回数)
+    """
+    delay = GRAPH_RETRY_BASE_DELAY_SECONDS
+    attempt = 1
+    while True:
+        try:
+            with _graph_request_slots:
+                if body:
+                    response = http.request(method, url, headers=headers, body=json.dumps(body, ensure_ascii=False).encode("utf-8"))
+                else:
+                    response = http.request(method, url, headers=headers)
+        except Exception as e:
+            if not retryable or attempt >= GRAPH_RETRY_MAX_ATTEMPTS:
+                raise
+            delay = next_retry_delay(delay)
+            if not reserve_retry(delay, request_id):
+                raise
+            logger.warning(f"GRAPH_API_RETRY - Error:{type(e).__name__} Attempt:{attempt} Delay:{delay:.2f}s - {request_id}")
+        else:
+            if response.status not in GRAPH_RETRY_STATUSES:
+                return response, attempt
+            record_throttled()
+            if not (retryable or response.status == GRAPH_THROTTLED_STATUS) or attempt >= GRAPH_RETRY_MAX_ATTEMPTS:
+                return response, attempt
+            delay = next_retry_delay(delay, parse_retry_after(response.headers.get("Retry-After")))
+            if not reserve_retry(delay, request_id):
+                return response, attempt
+            logger.warning(f"GRAPH_API_RETRY - Status:{response.status} Attempt:{attempt} Delay:{delay:.2f}s - {request_id}")
+
+        time.sleep(delay)
+        attempt += 1
+
+def next_retry_delay(previous_delay: float, retry_after: Optional[float] = None) -> float:
+    """次の再試行までの待機秒数
+
+    Retry-Afterがあればそれに従い、無ければ decorrelated jitter
+    （base〜直前の待機×3 の一様乱数、上限 GRAPH_RETRY_MAX_DELAY_SECONDS）とする。
+    """
+    if retry_after is not None:
+        return max(0.0, retry_after)
+    upper = max(GRAPH_RETRY_BASE_DELAY_SECONDS, previous_delay * 3)
+    return min(GRAPH_RETRY_MAX_DELAY_SECONDS, random.uniform(GRAPH_RETRY_BASE_DELAY_SECONDS, upper))
+
+def parse_retry_after(value) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数に変換"""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def start_retry_window() -> None:
+    """1呼び出し分の再試行予算と期限を開始"""
+    with _retry_lock:
+        _retry_window.update({
+            "active": True,
+            "budget": GRAPH_RETRY_BUDGET,
+            "deadline": time.monotonic() + GRAPH_RETRY_DEADLINE_SECONDS,
+            "retries": 0,
+            "throttled": 0,
+            "give_ups": 0
+        })
+
+def reserve_retry(delay: float, request_id: str) -> bool:
+    """再試行予算を1回分確保（予算切れ・期限超過ならFalse）"""
+    with _retry_lock:
+        if not _retry_window["active"]:
+            return False
+        if _retry_window["budget"] <= 0:
+            _retry_window["give_ups"] += 1
+            logger.warning(f"GRAPH_RETRY_BUDGET_EXHAUSTED - {request_id}")
+            return False
+        if time.monotonic() + delay > _retry_window["deadline"]:
+            _retry_window["give_ups"] += 1
+            logger.warning(f"GRAPH_RETRY_DEADLINE_EXCEEDED - Delay:{delay:.2f}s - {request_id}")
+            return False
+        _retry_window["budget"] -= 1
+        _retry_window["retries"] += 1
+        return True
+
+def record_throttled() -> None:
+    """スロットリング応答（429/503/504）の件数を集計"""
+    with _retry_lock:
+        _retry_window["throttled"] += 1
+
+def end_retry_window(request_id: str) -> None:
+    """再試行回数をEMFメトリクスとして出力し、再試行予算を閉じる"""
+    with _retry_lock:
+        if not _retry_window["active"]:
+            return
+        _retry_window["active"] = False
+        counts = dict(_retry_window)
+
+    try:
+        emit_metrics(
+            METRICS_NAMESPACE,
+            {"Api": "Graph"},
+            {
+                "GraphRetries": (counts["retries"], "Count"),
+                "GraphThrottled": (counts["throttled"], "Count"),
+                "GraphRetryGiveUps": (counts["give_ups"], "Count")
+            },
+            properties={"RequestId": request_id}
+        )
+    except Exception as e:
+        logger.warning(f"METRICS_EMIT_ERROR - {str(e)} - {request_id}")
+
+def emit_connection_metrics(connections_before: dict, request_id: str) -> None:
+    """1呼び出し内のホスト別リクエスト数・新規接続数・接続再利用率をEMFメトリクスとして出力"""
+    try:
+        for host, reuse in connection_reuse(connections_before, connection_stats(http)).items():
+            emit_metrics(
+                METRICS_NAMESPACE,
+                {"Host": host},
+                {
+                    "HttpRequests": (reuse["requests"], "Count"),
+                    "NewConnections": (reuse["new_connections"], "Count"),
+                    "ConnectionReuseRate": (reuse["reuse_rate"], "Percent")
+                },
+                properties={"RequestId": request_id}
+            )
+    except Exception as e:
+        logger.warning(f"METRICS_EMIT_ERROR - {str(e)} - {request_id}")
+
+def build_graph_query(endpoint: str, filter: Optional[str] = None, select: Optional[List[str]] = None,
+                      expand: Optional[List[str]] = None, top: Optional[int] = None) -> str:
+    """ODataクエリ（$filter/$select/$expand/$top）付きエンドポイントの組み立て
+
+    絞り込みと取得項目の指定をGraph側で行い、レスポンスサイズを抑える。
+    値はURLエンコードし、既存のクエリ文字列があれば&で連結する。
+    """
+    params = []
+    if filter:
+        params.append(("$filter", filter))
+    if select:
+        params.append(("$select", ",".join(select)))
+    if expand:
+        params.append(("$expand", ",".join(expand)))
+    if top:
+        params.append(("$top", str(top)))
+    if not params:
+        return endpoint
+
+    query = "&".join(f"{name}={urllib.parse.quote(value, safe=ODATA_QUERY_SAFE_CHARS)}" for name, value in params)
+    separator = "&" if "?" in endpoint else "?"
+    return f"{endpoint}{separator}{query}"
+
+def odata_string(value: str) -> str:
+    """$filter用の文字列リテラル（シングルクォートは二重化してエスケープ）"""
+    return "'" + value.replace("'", "''") + "'"
+
+def iterate_graph_collection(endpoint: str, access_token: str, request_id: str,
+                             page_size: Optional[int] = None) -> Iterator[dict]:
+    """Graph APIコレクションを1件ずつ返すジェネレーター
+
+    @odata.nextLink を辿って次ページを必要になった時点で取得するため、
+    呼び出し側が途中でループを抜ければ以降のページは取得しない。
+    page_size は $top に対応するエンドポイントでのみ指定する。
+    """
+    endpoint = build_graph_query(endpoint, top=page_size)
+
+    page_count = 0
+    while endpoint:
+        page = make_graph_request("GET", endpoint, access_token, request_id=request_id)
+        page_count += 1
+        yield from page.get("value", [])
+
+        next_link = page.get("@odata.nextLink")
+        if not next_link:
+            break
+        if not next_link.startswith(GRAPH_API_BASE_URL):
+            raise APIException(502, f"Unexpected nextLink: {next_link}")
+        endpoint = next_link[len(GRAPH_API_BASE_URL):]
+        logger.info(f"GRAPH_NEXT_PAGE - Page:{page_count + 1} - {request_id}")
+
+def execute_graph_batch(sub_requests: List[dict], access_token: str, request_id: str) -> List[dict]:
+    """Graph JSONバッチ（$batch）の実行
+
+    sub_requests は {"method", "url"(バージョン無しの相対パス), "body"(任意), "retry_safe"(任意)} のリスト。
+    GRAPH_BATCH_MAX_REQUESTS件ずつPOST /$batchし、入力と同じ順序で
+    {"status", "headers", "body"} のリストを返す。サブリクエストの失敗は例外にしない。
+    429のサブリクエストは全て、503/504のサブリクエストは再試行可能なものだけを再送する。
+    呼び出し記録には POST /$batch に加え、各サブリクエストを自身のエンドポイント・最終ステータス・送信回数で残す。
+    """
+    def is_retryable(sub_request: dict) -> bool:
+        return sub_request.get("retry_safe") or sub_request["method"] in GRAPH_IDEMPOTENT_METHODS
+
+    def send_once(chunk: List[dict]) -> List[dict]:
+        batch_requests = []
+        for index, sub_request in enumerate(chunk):
+            batch_request = {"id": str(index), "method": sub_request["method"], "url": sub_request["url"]}
+            if sub_request.get("body") is not None:
+                batch_request["headers"] = {"Content-Type": "application/json"}
+                batch_request["body"] = sub_request["body"]
+            batch_requests.append(batch_request)
+
+        batch_data = make_graph_request("POST", "/$batch", access_token, {"requests": batch_requests}, request_id=request_id,
+                                        retry_safe=all(is_retryable(r) for r in chunk))
+        responses = {response.get("id"): response for response in batch_data.get("responses", [])}
+        chunk_results = []
+        for index in range(len(chunk)):
+            response = responses.get(str(index), {})
+            chunk_results.append({
+                "status": int(response.get("status", 502)),
+                "headers": response.get("headers") or {},
+                "body": response.get("body") or {}
+            })
+        return chunk_results
+
+    def send_chunk(chunk: List[dict]) -> List[dict]:
+        started = time.perf_counter()
+        chunk_results = [None] * len(chunk)
+        attempts = [0] * len(chunk)
+        durations_ms = [0.0] * len(chunk)
+
+        def send_pending(indexes: List[int]) -> None:
+            for i, result in zip(indexes, send_once([chunk[i] for i in indexes])):
+                chunk_results[i] = result
+                attempts[i] += 1
+                durations_ms[i] = (time.perf_counter() - started) * 1000
+
+        try:
+            send_pending(list(range(len(chunk))))
+            delay = GRAPH_RETRY_BASE_DELAY_SECONDS
+            for attempt in range(1, GRAPH_RETRY_MAX_ATTEMPTS):
+                throttled = [i for i, result in enumerate(chunk_results) if result["status"] in GRAPH_RETRY_STATUSES]
+                for _ in throttled:
+                    record_throttled()
+                pending = [i for i in throttled
+                           if chunk_results[i]["status"] == GRAPH_THROTTLED_STATUS or is_retryable(chunk[i])]
+                if not pending:
+                    break
+                retry_after = [parse_retry_after(chunk_results[i]["headers"].get("Retry-After")) for i in pending]
+                retry_after = [value for value in retry_after if value is not None]
+                delay = next_retry_delay(delay, max(retry_after) if retry_after else None)
+                if not reserve_retry(delay, request_id):
+                    break
+                logger.warning(f"GRAPH_BATCH_RETRY - Throttled:{len(pending)} Attempt:{attempt} Delay:{delay:.2f}s - {request_id}")
+                time.sleep(delay)
+                send_pending(pending)
+            return chunk_results
+        finally:
+            # 応答を受け取れたサブリクエストのみ記録する（$batch自体の失敗は POST /$batch として記録済み）
+            for sub_request, result, attempt_count, duration_ms in zip(chunk, chunk_results, attempts, durations_ms):
+                if result is not None:
+                    response_bytes = len(json.dumps(result["body"], ensure_ascii=False).encode("utf-8")) if result["body"] else 0
+                    graph_call_log.record(sub_request["method"], sub_request["url"], result["status"],
+                                          attempt_count, duration_ms, response_bytes, batched=True)
+
+    # 分割したバッチは並列に送信し、結果は分割前の順序に戻す
+    chunks = [sub_requests[i:i + GRAPH_BATCH_MAX_REQUESTS] for i in range(0, len(sub_requests), GRAPH_BATCH_MAX_REQUESTS)]
+    results = [result for chunk_results in run_concurrently(send_chunk, chunks) for result in chunk_results]
+
+    logger.info(f"GRAPH_BATCH - Requests:{len(sub_requests)} Calls:{len(chunks)} - {request_id}")
+    return results
+
+def run_concurrently(func: Callable, items: list, max_workers: Optional[int] = None) -> list:
+    """最大 DM_MAX_CONCURRENCY 並列で func を適用し、入力と同じ順序で結果を返す
+
+    入れ子で呼び出してもGraphへの同時リクエスト数は send_with_retry で GRAPH_POOL_MAXSIZE に制限される。
+    例外は最初に発生したものを呼び出し元へ送出する。宛先ごとの失敗を
+    継続したい場合は func 側で例外を戻り値として返すこと。
+    """
+    max_workers = min(max_workers or DM_MAX_CONCURRENCY, len(items))
+    if max_workers <= 1:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, items))
+
+def is_batch_success(response: dict) -> bool:
+    """$batchサブレスポンスの成否判定"""
+    return response["status"] in [200, 201, 204]
+
+def batch_response_error(response: dict, message: str) -> APIException:
+    """$batchサブレスポンスのエラーをmake_graph_requestと同じ基準で例外に変換"""
+    error = response["body"].get("error", {}) if isinstance(response["body"], dict) else {}
+    external_message = error.get("message", "Unknown error")
+    if response["status"] == 401:
+        return ExternalAPIException(401, "Unauthorized access", response["status"], external_message)
+    if response["status"] == 404:
+        return ExternalAPIException(404, "Resource not found", response["status"], external_message)
+    return ExternalAPIException(502, message, response["status"], external_message)
+
+def find_users_by_email(access_token: str, email_addresses: List[str], request_id: str) -> dict:
+    """複数メールアドレスのユーザー解決（メールアドレス -> ユーザー情報 または APIException）
+
+    大文字小文字違いを含む重複アドレスは1回だけ解決し、ディレクトリキャッシュに
+    無いものが2件以上あれば$batchでまとめて取得する。
+    """
+    emails_by_key = {}
+    for email_address in email_addresses:
+        emails_by_key.setdefault(user_cache_key(email_address), []).append(email_address)
+
+    resolved = {}
+    pending = []
+    for key, emails in emails_by_key.items():
+        cached = user_directory_cache.get(key)
+        if cached is NOT_FOUND:
+            resolved[key] = APIException(404, f"User not found: {emails[0]}")
+        elif cached:
+            resolved[key] = cached
+        else:
+            pending.append(key)
+
+    if len(pending) == 1:
+        key = pending[0]
+        try:
+            resolved[key] = find_user_by_email(access_token, emails_by_key[key][0], request_id)
+        except APIException as e:
+            resolved[key] = e
+    elif pending:
+        responses = execute_graph_batch(
+            [{"method": "GET", "url": build_graph_query(f"/users/{emails_by_key[k][0]}", select=["id", "displayName", "mail"])}
+             for k in pending],
+            access_token, request_id
+        )
+        for key, response in zip(pending, responses):
+            email_address = emails_by_key[key][0]
+            if is_batch_success(response):
+                resolved[key] = response["body"]
+                cache_user(email_address, response["body"])
+            elif response["status"] == 404:
+                logger.warning(f"USER_NOT_FOUND - {email_address} - {request_id}")
+                user_directory_cache.set_not_found(key)
+                resolved[key] = APIException(404, f"User not found: {email_address}")
+            else:
+                resolved[key] = batch_response_error(response, "User lookup failed")
+
+    if len(pending) < len(emails_by_key):
+        logger.info(f"USER_CACHE_HIT - Count:{len(emails_by_key) - len(pending)} - {request_id}")
+    return {email_address: resolved[key] for key, emails in emails_by_key.items() for email_address in emails}
+
+def user_cache_key(email_address: str) -> str:
+    """ディレクトリキャッシュのキー（メールアドレスは大文字小文字を区別しない）"""
+    return email_address.strip().lower()
+
+def cache_user(email_address: str, user_data: dict) -> None:
+    """ユーザー情報のうちメンション・チャット解決に必要な項目のみキャッシュ"""
+    if user_data.get("id"):
+        user_directory_cache.set(user_cache_key(email_address), {
+            "id": user_data["id"],
+            "displayName": user_data.get("displayName")
+        })
 
 def build_mentions_for_message(mentions_param: List[dict], message_text: str) -> tuple[List[dict], str]:
     """メンション付きメッセージの構築"""
@@ -306,14 +1835,23 @@ def build_mentions_for_message(mentions_param: List[dict], message_text: str) ->
     
     return mentions, mention_text_in_body
 
-def process_mentions_by_email(access_token: str, mentions_param: List[MentionModel], request_id: Optional[str] = None) -> List[dict]:
-    """メールアドレスベースのメンション処理"""
+def process_mentions_by_email(access_token: str, mentions_param: List[MentionModel], request_id: Optional[str] = None,
+                              resolved_users: Optional[dict] = None) -> List[dict]:
+    """メールアドレスベースのメンション処理
+
+    resolved_users に解決済みユーザー（find_users_by_email の結果）があれば再取得しない。
+    """
     try:
         processed_mentions = []
-        
+        mention_emails = [m.email_address for m in mentions_param if m.mention_type == "user" and m.email_address]
+        if resolved_users is None:
+            resolved_users = find_users_by_email(access_token, mention_emails, request_id) if mention_emails else {}
+
         for mention in mentions_param:
             if mention.mention_type == "user" and mention.email_address:
-                user_info = find_user_by_email(access_token, mention.email_address, request_id)
+                user_info = resolved_users[mention.email_address]
+                if isinstance(user_info, APIException):
+                    raise user_info
                 
                 processed_mentions.append({
                     "mention_type": "user",
@@ -339,7 +1877,7 @@ def refresh_access_token(refresh_token: str, request_id: Optional[str] = None) -
     logger.info(f"TOKEN_API_CALL - POST /oauth2/v2.0/token - {request_id}")
     
     try:
-        token_url = f"https://login.microsoftonline.com/{TENANT_ID}/oauth2/v2.0/token"
+        token_url = f"{LOGIN_BASE_URL}/{TENANT_ID}/oauth2/v2.0/token"
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {
             "client_id": CLIENT_ID,
@@ -371,6 +1909,8 @@ def refresh_access_token(refresh_token: str, request_id: Optional[str] = None) -
             logger.error(f"TOKEN_API_PARSE_ERROR - {request_id}")
             raise APIException(500, f"Failed to parse token response: {str(e)}")
             
+        # 取得したアクセストークンは有効期限までウォームコンテナで再利用する
+        cache_access_token(token_response.get("access_token"), token_response.get("expires_in"))
         return token_response.get("access_token"), token_response.get("refresh_token")
 
     except APIException:
@@ -380,22 +1920,34 @@ def refresh_access_token(refresh_token: str, request_id: Optional[str] = None) -
         raise APIException(502, f"Token refresh process failed: {str(e)}")
 
 def find_user_by_email(access_token: str, email_address: str, request_id: Optional[str] = None) -> dict:
-    """メールアドレスからユーザー情報を取得"""
+    """メールアドレスからユーザー情報を取得（ディレクトリキャッシュ優先）"""
+    cached = user_directory_cache.get(user_cache_key(email_address))
+    if cached is NOT_FOUND:
+        logger.info(f"USER_CACHE_NEGATIVE_HIT - {email_address} - {request_id}")
+        raise APIException(404, f"User not found: {email_address}")
+    if cached:
+        logger.info(f"USER_CACHE_HIT - {email_address} - {request_id}")
+        return cached
+
     try:
-        user_data = make_graph_request("GET", f"/users/{email_address}", access_token, request_id=request_id)
+        endpoint = build_graph_query(f"/users/{email_address}", select=["id", "displayName", "mail"])
+        user_data = make_graph_request("GET", endpoint, access_token, request_id=request_id)
         logger.info(f"USER_FOUND - {email_address} - {request_id}")
+        cache_user(email_address, user_data)
         return user_data
     except APIException as e:
         if e.status_code == 404:
             logger.warning(f"USER_NOT_FOUND - {email_address} - {request_id}")
+            user_directory_cache.set_not_found(user_cache_key(email_address))
             raise APIException(404, f"User not found: {email_address}")
         raise
 
 def find_team_id_by_name(access_token: str, team_name: str, request_id: Optional[str] = None) -> str:
-    """チーム名からチームIDを取得"""
-    teams_data = make_graph_request("GET", "/me/joinedTeams", access_token, request_id=request_id)
-    
-    for team in teams_data.get("value", []):
+    """チーム名からチームIDを取得
+
+    /me/joinedTeams はODataクエリ非対応のため、名前の照合はクライアント側で行う。
+    """
+    for team in iterate_graph_collection("/me/joinedTeams", access_token, request_id):
         if team.get("displayName") == team_name:
             logger.info(f"TEAM_FOUND - {team_name} - {request_id}")
             return team["id"]
@@ -405,9 +1957,12 @@ def find_team_id_by_name(access_token: str, team_name: str, request_id: Optional
 
 def find_channel_id_by_name(access_token: str, team_id: str, channel_name: str, request_id: Optional[str] = None) -> str:
     """チャンネル名からチャンネルIDを取得"""
-    channels_data = make_graph_request("GET", f"/teams/{team_id}/channels", access_token, request_id=request_id)
-    
-    for channel in channels_data.get("value", []):
+    endpoint = build_graph_query(
+        f"/teams/{team_id}/channels",
+        filter=f"displayName eq {odata_string(channel_name)}",
+        select=["id", "displayName"]
+    )
+    for channel in iterate_graph_collection(endpoint, access_token, request_id):
         if channel.get("displayName") == channel_name:
             logger.info(f"CHANNEL_FOUND - {channel_name} - {request_id}")
             return channel["id"]
@@ -416,57 +1971,74 @@ def find_channel_id_by_name(access_token: str, team_id: str, channel_name: str,
     raise APIException(404, f"Channel not found: {channel_name}")
 
 def find_or_create_chat(access_token: str, target_user_id: str, request_id: str) -> str:
-    """1対1チャットの検索または作成"""
+    """1対1チャットの解決
+
+    1対1チャットのPOST /chatsは既存チャットがあればそれを返すため、まず作成APIで
+    直接解決する。失敗した場合のみチャット一覧を検索する。
+    """
     try:
-        chats_data = make_graph_request("GET", "/me/chats", access_token, request_id=request_id)
-        
-        # 既存の1:1チャットを検索
-        for chat in chats_data.get("value", []):
+        chat_id = create_new_chat(access_token, target_user_id, request_id)
+        logger.info(f"CHAT_RESOLVED - Direct - {request_id}")
+        return chat_id
+    except APIException as e:
+        if e.status_code == 401:
+            raise
+        logger.warning(f"CHAT_DIRECT_RESOLVE_FAILED - Status:{e.status_code} - {request_id}")
+        direct_error = e
+
+    chat_id = find_existing_chat(access_token, target_user_id, request_id)
+    if chat_id:
+        return chat_id
+    raise direct_error
+
+def find_existing_chat(access_token: str, target_user_id: str, request_id: str) -> Optional[str]:
+    """既存の1対1チャットを一覧から検索（見つからなければNone）"""
+    try:
+        # 1:1チャットのみをメンバー展開付きで取得し、メンバー確認を1回の呼び出しで行う
+        endpoint = build_graph_query("/me/chats", filter="chatType eq 'oneOnOne'", expand=["members"])
+        # 見つかった時点で以降のページは取得しない
+        for chat in iterate_graph_collection(endpoint, access_token, request_id, page_size=GRAPH_PAGE_SIZE):
             if chat.get("chatType") == "oneOnOne":
                 members = chat.get("members", [])
                 if len(members) == 2:
                     for member in members:
-                        user_info = member.get("user", {})
-                        if user_info.get("id") == target_user_id:
+                        # $expandのメンバーはuserIdを持つ（user.idは旧形式）
+                        member_user_id = member.get("userId") or member.get("user", {}).get("id")
+                        if member_user_id == target_user_id:
                             logger.info(f"CHAT_FOUND - Existing chat - {request_id}")
                             return chat["id"]
-        
-        # 既存チャットが見つからない場合のみ新規作成
-        chat_id = create_new_chat(access_token, target_user_id, request_id)
-        logger.info(f"CHAT_CREATED - New chat - {request_id}")
-        return chat_id
-        
+
+        logger.info(f"CHAT_NOT_FOUND - {request_id}")
+        return None
+
     except APIException:
         raise
     except Exception as e:
         logger.error(f"CHAT_SEARCH_ERROR - {str(e)} - {request_id}")
         raise APIException(502, f"Chat search failed: {str(e)}")
 
+def get_caller_user_id(access_token: str, request_id: Optional[str] = None) -> str:
+    """呼び出し元ユーザーIDの取得（同一アクセストークンの間はキャッシュ）"""
+    with _access_token_lock:
+        if _caller_identity_cache["access_token"] == access_token and _caller_identity_cache["user_id"]:
+            return _caller_identity_cache["user_id"]
+
+    me = make_graph_request("GET", build_graph_query("/me", select=["id"]), access_token, request_id=request_id)
+    with _access_token_lock:
+        _caller_identity_cache["access_token"] = access_token
+        _caller_identity_cache["user_id"] = me["id"]
+    return me["id"]
+
 def create_new_chat(access_token: str, target_user_id: str, request_id: Optional[str] = None) -> str:
-    """新規1対1チャットの作成"""
+    """1対1チャットの作成（既存チャットがあればそのIDを返す）"""
     try:
         # 自分のユーザーID取得
-        me = make_graph_request("GET", "/me", access_token, request_id=request_id)
-        my_user_id = me["id"]
+        my_user_id = get_caller_user_id(access_token, request_id)
 
         # 新規チャット作成
-        body = {
-            "chatType": "oneOnOne",
-            "members": [
-                {
-                    "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                    "roles": ["owner"],
-                    "user@odata.bind": f"https://graph.microsoft.com/v1.0/users/{my_user_id}"
-                },
-                {
-                    "@odata.type": "#microsoft.graph.aadUserConversationMember",
-                    "roles": ["owner"],
-                    "user@odata.bind": f"https://graph.microsoft.com/v1.0/users/{target_user_id}"
-                }
-            ]
-        }
-        
-        chat_data = make_graph_request("POST", "/chats", access_token, body, request_id=request_id)
+        body = build_one_on_one_chat_body(my_user_id, target_user_id)
+        # 1対1チャット作成は既存チャットを返すため重複実行しても安全
+        chat_data = make_graph_request("POST", "/chats", access_token, body, request_id=request_id, retry_safe=True)
         return chat_data["id"]
         
     except APIException:
@@ -474,22 +2046,44 @@ def create_new_chat(access_token: str, target_user_id: str, request_id: Optional
     except Exception as e:
         raise APIException(502, f"Chat creation failed: {str(e)}")
 
+def build_one_on_one_chat_body(my_user_id: str, target_user_id: str) -> dict:
+    """1対1チャット作成リクエストボディ"""
+    return {
+        "chatType": "oneOnOne",
+        "members": [
+            {
+                "@odata.type": "#microsoft.graph.aadUserConversationMember",
+                "roles": ["owner"],
+                "user@odata.bind": f"https://graph.microsoft.com/v1.0/users/{my_user_id}"
+            },
+            {
+                "@odata.type": "#microsoft.graph.aadUserConversationMember",
+                "roles": ["owner"],
+                "user@odata.bind": f"https://graph.microsoft.com/v1.0/users/{target_user_id}"
+            }
+        ]
+    }
+
+def build_chat_message_body(message_text: str, content_type: str, mentions_param: List[dict]) -> dict:
+    """チャットメッセージ送信リクエストボディ"""
+    mentions, mention_text_in_body = build_mentions_for_message(mentions_param, message_text)
+
+    body = {
+        "body": {
+            "contentType": content_type,
+            "content": mention_text_in_body
+        }
+    }
+
+    if mentions:
+        body["mentions"] = mentions
+    return body
+
 def post_message_to_chat(access_token: str, chat_id: str, message_text: str, 
                         content_type: str, mentions_param: List[dict], request_id: Optional[str] = None) -> None:
     """チャットへのメッセージ送信"""
     try:
-        mentions, mention_text_in_body = build_mentions_for_message(mentions_param, message_text)
-        
-        body = {
-            "body": {
-                "contentType": content_type,
-                "content": mention_text_in_body
-            }
-        }
-        
-        if mentions:
-            body["mentions"] = mentions
-
+        body = build_chat_message_body(message_text, content_type, mentions_param)
         make_graph_request("POST", f"/chats/{chat_id}/messages", access_token, body, request_id=request_id)
         
     except APIException:
@@ -531,6 +2125,34 @@ def get_refresh_token_from_ssm(param_name: str) -> str:
     except Exception as e:
         raise APIException(500, f"SSM parameter get failed: {str(e)}")
 
+def get_refresh_token_with_version(param_name: str) -> tuple[str, int]:
+    """SSMパラメータストアからリフレッシュトークンとバージョンを取得"""
+    try:
+        response = ssm_client.get_parameter(Name=param_name, WithDecryption=True)
+        return response['Parameter']['Value'], response['Parameter']['Version']
+    except Exception as e:
+        raise APIException(500, f"SSM parameter get failed: {str(e)}")
+
+def save_refresh_token_if_unchanged(refresh_token: str, param_name: str, expected_version: int) -> bool:
+    """読み込み時からバージョンが変わっていない場合のみリフレッシュトークンを保存
+
+    SSMには条件付き書き込みが無いため、リース保持中に直前のバージョンを
+    再確認してから上書きする。他インスタンスが更新済みなら保存しない。
+    """
+    try:
+        current_version = ssm_client.get_parameter(Name=param_name, WithDecryption=True)['Parameter']['Version']
+        if current_version != expected_version:
+            return False
+        ssm_client.put_parameter(
+            Name=param_name,
+            Value=refresh_token,
+            Type="SecureString",
+            Overwrite=True
+        )
+        return True
+    except Exception as e:
+        raise APIException(500, f"SSM parameter save failed: {str(e)}")
+
 def save_refresh_token_to_ssm(refresh_token: str, param_name: str) -> None:
     """SSMパラメータストアにリフレッシュトークンを保存"""
     try:
@@ -18,7 +18,7 @@ from approve import (
     create_correction_request_message, create_system_error_message,
     create_mailto_link, send_teams_approval_message,
     send_teams_acceptance_notification, send_error_notification,
-    call_teams_api
+    call_teams_api, send_teams_messages_batch
 )
 
 
@@ -1527,6 +1527,102 @@ class TestLambdaHandler(unittest.TestCase):
         self.assertIn("必要な環境変数が設定されていません", body["message"])
 
 
+class TestCallTeamsApiAsyncDelivery(unittest.TestCase):
+    """Teams API非同期送信（202受付）のテスト"""
+
+    def test_normal_async_delivery_accepted(self):
+        """正常系: TEAMS_ASYNC_DELIVERY有効時はasync_deliveryを付与し202を成功として扱う"""
+        mock_response = Mock()
+        mock_response.status = 202
+        mock_response.data = b'{"message": "Accepted", "data": {"message_id": "msg-1"}}'
+        mock_http = Mock()
+        mock_http.request.return_value = mock_response
+
+        teams_data = {"mode": 2, "team_name": "Test Team"}
+        with patch('approve.http', mock_http), patch('approve.TEAMS_ASYNC_DELIVERY', True):
+            result = call_teams_api(teams_data)
+
+        self.assertEqual(result["data"]["message_id"], "msg-1")
+        sent = json.loads(mock_http.request.call_args[1]["body"])
+        self.assertTrue(sent["async_delivery"])
+        self.assertNotIn("async_delivery", teams_data)
+
+    def test_normal_sync_delivery_default(self):
+        """正常系: 既定では同期送信（async_deliveryを付与しない）"""
+        mock_response = Mock()
+        mock_response.status = 200
+        mock_response.data = b'{}'
+        mock_http = Mock()
+        mock_http.request.return_value = mock_response
+
+        with patch('approve.http', mock_http), patch('approve.TEAMS_ASYNC_DELIVERY', False):
+            call_teams_api({"mode": 2, "team_name": "Test Team"})
+
+        sent = json.loads(mock_http.request.call_args[1]["body"])
+        self.assertNotIn("async_delivery", sent)
+
+class TestTeamsBatchDelivery(unittest.TestCase):
+    """Teams API一括送信（mode 4）のテスト"""
+
+    def setUp(self):
+        self.approval_data = ApprovalData(
+            mail="test@example.com",
+            content="テスト申請",
+            system="テストシステム",
+            from_date=date(2024, 1, 1),
+            to_date=date(2024, 1, 2)
+        )
+
+    @patch('approve.call_teams_api')
+    def test_normal_batch_single_call(self, mock_call_teams_api):
+        """正常系: 承認依頼と受付通知を1回の呼び出しで送信"""
+        mock_call_teams_api.return_value = {"data": {"results": [
+            {"index": 0, "mode": 2, "status": 200, "message": "ok"},
+            {"index": 1, "mode": 2, "status": 200, "message": "ok"}
+        ]}}
+
+        with patch('approve.TEAMS_BATCH_DELIVERY', True), \
+             patch('approve.get_email_body_from_s3', return_value="body"), \
+             patch('approve.extract_and_validate_approval_data', return_value=self.approval_data), \
+             patch('approve.validate_environment_variables'), \
+             patch('approve.create_mailto_link', return_value="mailto:approver@example.com"):
+            event = {"Records": [{"ses": {"mail": {
+                "messageId": "test-message-id", "source": "test@example.com",
+                "commonHeaders": {"subject": "テストシステム"}}}}]}
+            result = lambda_handler(event, Mock())
+
+        self.assertEqual(result["statusCode"], 200)
+        mock_call_teams_api.assert_called_once()
+        sent = mock_call_teams_api.call_args[0][0]
+        self.assertEqual(sent["mode"], 4)
+        self.assertEqual([m["subject"] for m in sent["messages"]],
+                         ["ログ取得の申請：API承認依頼", "ログ取得の申請：受付完了"])
+
+    @patch('approve.call_teams_api')
+    def test_error_batch_partial_failure(self, mock_call_teams_api):
+        """異常系: 一部メッセージの失敗（207）は例外として扱う"""
+        mock_call_teams_api.return_value = {"data": {"results": [
+            {"index": 0, "mode": 2, "status": 200, "message": "ok"},
+            {"index": 1, "mode": 2, "status": 404, "message": "User not found: test@example.com"}
+        ]}}
+
+        with self.assertRaises(APIException) as context:
+            send_teams_messages_batch([{"mode": 2}, {"mode": 2}])
+
+        self.assertEqual(context.exception.status_code, 502)
+        self.assertIn("#1 Status:404", context.exception.message)
+
+    def test_normal_call_teams_api_multi_status(self):
+        """正常系: 207は呼び出し元で結果を判定するため例外にしない"""
+        mock_http = Mock()
+        mock_http.request.return_value = Mock(status=207, data=b'{"data": {"results": []}}')
+
+        with patch('approve.http', mock_http):
+            result = call_teams_api({"mode": 4, "messages": []})
+
+        self.assertEqual(result, {"data": {"results": []}})
+
+
 # テスト実行用のメイン関数
 if __name__ == '__main__':
     # 特定のテストクラスのみ実行する場合
@@ -0,0 +1,107 @@
+import pytest
+
+from call_metrics import (
+    CallLog,
+    emit_call_metrics,
+    endpoint_template,
+    summarize_calls,
+    MAX_VALUES_PER_METRIC
+)
+from emf_metrics import LocalMetricsSink, set_metrics_sink
+
+"""
+=============================================================================
+外部API呼び出し記録・集計モジュール テストスイート
+=============================================================================
+"""
+
+@pytest.fixture
+def local_sink():
+    """ローカルシンクに差し替え、テスト後に元へ戻す"""
+    sink = LocalMetricsSink()
+    previous = set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(previous)
+
+def make_call(endpoint, status=200, attempts=1, duration_ms=10.0, response_bytes=100, method="GET"):
+    return {"method": method, "endpoint": endpoint, "status": status, "attempts": attempts,
+            "started_ms": 0.0, "duration_ms": duration_ms, "response_bytes": response_bytes}
+
+class TestEndpointTemplate:
+    """endpoint_template関数のテスト"""
+
+    @pytest.mark.parametrize("endpoint, expected", [
+        ("/users/yamada@example.com?$select=id,mail", "/users/{id}"),
+        ("/chats/19:abc_def@thread.v2/messages", "/chats/{id}/messages"),
+        ("/teams/0b1c2d3e-4f50-6789-abcd-ef0123456789/channels/19:x@thread.tacv2/messages",
+         "/teams/{id}/channels/{id}/messages"),
+        ("/teams?$filter=displayName eq 'A'&$top=50", "/teams"),
+        ("/$batch", "/$batch"),
+        ("/me", "/me"),
+    ])
+    def test_成功ケース_IDをプレースホルダーに置換(self, endpoint, expected):
+        """成功ケース: ID・クエリ文字列を除いたテンプレートになる"""
+        assert endpoint_template(endpoint) == expected
+
+class TestCallLog:
+    """CallLogクラスのテスト"""
+
+    def test_成功ケース_開始から終了までの呼び出しを記録(self):
+        """成功ケース: テンプレート化したエンドポイントで記録し、終了時に返して破棄する"""
+        log = CallLog()
+        log.start()
+        log.record("POST", "/chats/19:a@thread.v2/messages", 201, attempts=2, duration_ms=35.25, response_bytes=512)
+
+        calls = log.end()
+
+        assert len(calls) == 1
+        assert calls[0]["endpoint"] == "/chats/{id}/messages"
+        assert calls[0]["attempts"] == 2
+        assert calls[0]["duration_ms"] == 35.2
+        assert calls[0]["batched"] is False
+        assert log.end() == []
+
+    def test_失敗ケース_開始前は記録しない(self):
+        """失敗ケース: ハンドラー外（start前・end後）の呼び出しは記録しない"""
+        log = CallLog()
+        log.record("GET", "/me", 200, attempts=1, duration_ms=1.0, response_bytes=10)
+        log.start()
+        log.end()
+        log.record("GET", "/me", 200, attempts=1, duration_ms=1.0, response_bytes=10)
+
+        assert log.end() == []
+
+class TestEmitCallMetrics:
+    """summarize_calls / emit_call_metrics関数のテスト"""
+
+    def test_成功ケース_エンドポイント別に集計(self, local_sink):
+        """成功ケース: 呼び出し数・エラー数・再試行数と所要時間の分布をエンドポイント単位で出力"""
+        calls = [
+            make_call("/users/{id}", duration_ms=12.0),
+            make_call("/users/{id}", status=429, attempts=3, duration_ms=40.0),
+            make_call("/chats/{id}/messages", method="POST", status=201, duration_ms=80.0),
+        ]
+
+        emit_call_metrics("TeamsApi", "Graph", calls, "req-1")
+
+        assert local_sink.values("Calls", Endpoint="GET /users/{id}") == [2]
+        assert local_sink.values("CallErrors", Endpoint="GET /users/{id}") == [1]
+        assert local_sink.values("CallRetries", Endpoint="GET /users/{id}") == [2]
+        assert local_sink.values("CallLatency", Endpoint="GET /users/{id}") == [[12.0, 40.0]]
+        assert local_sink.values("CallErrors", Endpoint="POST /chats/{id}/messages") == [0]
+
+    def test_成功ケース_値の上限を超える分は別レコード(self, local_sink):
+        """成功ケース: 分布の値は1レコード MAX_VALUES_PER_METRIC 件までに分割し、件数は1回だけ出力"""
+        calls = [make_call("/me") for _ in range(MAX_VALUES_PER_METRIC + 5)]
+
+        emit_call_metrics("TeamsApi", "Graph", calls, "req-1")
+
+        assert [len(v) for v in local_sink.values("CallLatency", Endpoint="GET /me")] == [MAX_VALUES_PER_METRIC, 5]
+        assert local_sink.values("Calls", Endpoint="GET /me") == [MAX_VALUES_PER_METRIC + 5]
+
+    def test_失敗ケース_呼び出し無しは出力しない(self, local_sink):
+        """失敗ケース: Graphを呼ばなかった呼び出し（キュー投入のみ等）ではレコードを出力しない"""
+        emit_call_metrics("TeamsApi", "Graph", [], "req-1")
+
+        assert summarize_calls([]) == {}
+        assert local_sink.records == []
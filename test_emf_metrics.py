@@ -0,0 +1,80 @@
+import pytest
+import json
+from unittest.mock import patch
+
+from emf_metrics import (
+    build_emf_record,
+    emit_metrics,
+    set_metrics_sink,
+    stdout_sink,
+    LocalMetricsSink,
+    MAX_METRICS_PER_RECORD
+)
+
+"""
+=============================================================================
+CloudWatch Embedded Metric Format 出力モジュール テストスイート
+=============================================================================
+"""
+
+@pytest.fixture
+def local_sink():
+    """ローカルシンクに差し替え、テスト後に元へ戻す"""
+    sink = LocalMetricsSink()
+    previous = set_metrics_sink(sink)
+    yield sink
+    set_metrics_sink(previous)
+
+class TestBuildEmfRecord:
+    """build_emf_record関数のテスト"""
+
+    def test_成功ケース_EMF構造(self):
+        """成功ケース: ディメンション・メトリクス定義・プロパティが正しく設定される"""
+        record = build_emf_record(
+            "GetLogApi",
+            {"System": "会計システム", "Stage": "Download"},
+            {"DownloadBytes": (1024, "Bytes"), "DownloadDuration": (12.5, "Milliseconds")},
+            properties={"RequestId": "req-123"},
+            timestamp_ms=1700000000000
+        )
+
+        assert record["System"] == "会計システム"
+        assert record["DownloadBytes"] == 1024
+        assert record["RequestId"] == "req-123"
+        directive = record["_aws"]["CloudWatchMetrics"][0]
+        assert record["_aws"]["Timestamp"] == 1700000000000
+        assert directive["Namespace"] == "GetLogApi"
+        assert directive["Dimensions"] == [["System", "Stage"]]
+        assert {"Name": "DownloadBytes", "Unit": "Bytes"} in directive["Metrics"]
+
+    def test_失敗ケース_メトリクス数上限超過(self):
+        """失敗ケース: 1レコードのメトリクス数上限を超えるとValueError"""
+        metrics = {f"Metric{i}": (i, "Count") for i in range(MAX_METRICS_PER_RECORD + 1)}
+
+        with pytest.raises(ValueError):
+            build_emf_record("GetLogApi", {}, metrics)
+
+class TestEmitMetrics:
+    """emit_metrics関数とシンクのテスト"""
+
+    def test_成功ケース_ローカルシンクで取得(self, local_sink):
+        """成功ケース: ローカルシンクに出力されたレコードをディメンションで検索できる"""
+        emit_metrics("GetLogApi", {"Stage": "Upload"}, {"UploadBytes": (10, "Bytes")})
+        emit_metrics("GetLogApi", {"Stage": "Download"}, {"DownloadBytes": (20, "Bytes")})
+
+        assert len(local_sink.records) == 2
+        assert local_sink.values("UploadBytes", Stage="Upload") == [10]
+        assert local_sink.values("DownloadBytes", Stage="Upload") == []
+
+    def test_成功ケース_標準出力は1行JSON(self, capsys):
+        """成功ケース: 標準出力シンクは日本語をエスケープせず1行JSONを出力する"""
+        stdout_sink({"System": "会計システム"})
+
+        output = capsys.readouterr().out
+        assert output.count("\n") == 1
+        assert json.loads(output) == {"System": "会計システム"}
+        assert "\\u" not in output
+
+# 実行設定
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,337 @@
+import pytest
+import os
+import sys
+import importlib.util
+from datetime import datetime
+from unittest.mock import Mock, patch, MagicMock
+
+# 環境変数をモック化（get-logインポート前に設定）
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+os.environ.setdefault('BUCKET_NAME', 'test-bucket')
+
+# ファイル名にハイフンを含むためimportlibで読み込む
+_spec = importlib.util.spec_from_file_location(
+    "get_log", os.path.join(os.path.dirname(os.path.abspath(__file__)), "get-log.py")
+)
+get_log = importlib.util.module_from_spec(_spec)
+sys.modules["get_log"] = get_log
+_spec.loader.exec_module(get_log)
+
+from emf_metrics import LocalMetricsSink, set_metrics_sink
+
+"""
+=============================================================================
+ログ取得 Lambda Function テストスイート
+
+get-log.py のログ取得処理をテストします。
+外部接続（SSH/SFTP・S3・Teams API）はすべてモック化します。
+=============================================================================
+"""
+
+# =============================================================================
+# 帯域制御テスト
+#
+# TokenBucket と download_file_with_rate_limit をテストします。
+# =============================================================================
+
+class TestTokenBucket:
+    """TokenBucketクラスのテスト
+
+    帯域上限に応じて待機時間が計算されることを確認します。
+    """
+
+    @patch('get_log.time.sleep')
+    def test_成功ケース_容量内は待機なし(self, mock_sleep):
+        """成功ケース: バケット容量内の消費では待機しない"""
+        bucket = get_log.TokenBucket(1000)
+
+        waited = bucket.consume(500)
+
+        assert waited == 0.0
+        mock_sleep.assert_not_called()
+
+    @patch('get_log.time.sleep')
+    def test_成功ケース_容量超過で待機(self, mock_sleep):
+        """成功ケース: 容量を超えた分は転送レートに応じて待機する
+
+        1000B/sのバケットで合計3000B消費すると、超過2000B分の待機が発生します。
+        """
+        bucket = get_log.TokenBucket(1000)
+
+        bucket.consume(1000)
+        waited = bucket.consume(2000)
+
+        assert waited == pytest.approx(2.0, abs=0.05)
+        mock_sleep.assert_called_once()
+
+    def test_失敗ケース_不正なレート(self):
+        """失敗ケース: 0以下のレートはValueError"""
+        with pytest.raises(ValueError):
+            get_log.TokenBucket(0)
+
+    def test_成功ケース_未設定は制限なし(self):
+        """成功ケース: 帯域設定が未設定・0の場合はバケットを生成しない"""
+        assert get_log.create_token_bucket(None) is None
+        assert get_log.create_token_bucket(0) is None
+        assert isinstance(get_log.create_token_bucket(1024), get_log.TokenBucket)
+
+class TestDownloadFileWithRateLimit:
+    """download_file_with_rate_limit関数のテスト"""
+
+    def test_成功ケース_全リミッターで消費(self, tmp_path):
+        """成功ケース: 読み込んだバイト数をすべてのリミッターから消費する"""
+        remote_file = MagicMock()
+        remote_file.__enter__.return_value = remote_file
+        remote_file.read.side_effect = [b"a" * 100, b"b" * 50, b""]
+        sftp = Mock()
+        sftp.open.return_value = remote_file
+        host_limiter = Mock()
+        global_limiter = Mock()
+        local_path = tmp_path / "downloaded.log"
+
+        total = get_log.download_file_with_rate_limit(sftp, "/var/log/app.log", str(local_path), [host_limiter, global_limiter])
+
+        assert total == 150
+        assert local_path.read_bytes() == b"a" * 100 + b"b" * 50
+        assert [c.args[0] for c in host_limiter.consume.call_args_list] == [100, 50]
+        assert [c.args[0] for c in global_limiter.consume.call_args_list] == [100, 50]
+
+class TestProcessServersLogs:
+    """process_servers_logs関数の帯域制御・並列処理テスト"""
+
+    @patch('get_log.create_single_zip')
+    @patch('get_log.upload_zip_to_storage_gateway')
+    @patch('get_log.cleanup_temp_files')
+    @patch('get_log.os.remove')
+    @patch('get_log.process_single_server')
+    def test_成功ケース_並列処理でもサーバー定義順(self, mock_process, mock_remove, mock_cleanup, mock_upload, mock_zip):
+        """成功ケース: 並列ダウンロードでもファイルはサーバー定義順に集約される
+
+        全体上限のリミッターが各サーバー処理に共有されることも確認します。
+        """
+        mock_process.side_effect = lambda hostname, *args: ([{"local_path": f"/tmp/{hostname}", "relative_path": hostname}], 10)
+        mock_zip.return_value = "/tmp/archive.zip"
+        mock_upload.return_value = "\\\\share\\archive.zip"
+        servers = {"srv1": {}, "srv2": {}, "srv3": {}}
+
+        paths, password = get_log.process_servers_logs(
+            servers, datetime(2024, 1, 1), datetime(2024, 1, 1), "archive",
+            global_max_bytes_per_sec=1024, max_concurrent_servers=2
+        )
+
+        assert paths == ["\\\\share\\archive.zip"]
+        zipped_files = mock_zip.call_args[0][0]
+        assert [f["relative_path"] for f in zipped_files] == ["srv1", "srv2", "srv3"]
+        limiters = {id(c.args[4]) for c in mock_process.call_args_list}
+        assert len(limiters) == 1
+
+    @patch('get_log.create_single_zip')
+    @patch('get_log.upload_zip_to_storage_gateway')
+    @patch('get_log.cleanup_temp_files')
+    @patch('get_log.os.remove')
+    @patch('get_log.process_single_server')
+    def test_失敗ケース_一部サーバー失敗は継続(self, mock_process, mock_remove, mock_cleanup, mock_upload, mock_zip):
+        """失敗ケース: 一部サーバーのダウンロード失敗は他サーバーの処理を止めない"""
+        def process(hostname, *args):
+            if hostname == "srv2":
+                raise get_log.APIException(500, "SSH接続に失敗しました")
+            return [{"local_path": f"/tmp/{hostname}", "relative_path": hostname}], 10
+        mock_process.side_effect = process
+        mock_zip.return_value = "/tmp/archive.zip"
+        mock_upload.return_value = "\\\\share\\archive.zip"
+
+        get_log.process_servers_logs(
+            {"srv1": {}, "srv2": {}, "srv3": {}}, datetime(2024, 1, 1), datetime(2024, 1, 1), "archive",
+            max_concurrent_servers=3
+        )
+
+        zipped_files = mock_zip.call_args[0][0]
+        assert [f["relative_path"] for f in zipped_files] == ["srv1", "srv3"]
+
+    @patch('get_log.STORAGE_WAIT_POLL_SECONDS', 0.01)
+    @patch('get_log.LAMBDA_STORAGE_LIMIT_BYTES', 10)
+    @patch('get_log.get_actual_tmp_usage', return_value=0)
+    @patch('get_log.create_part_zip')
+    @patch('get_log.upload_zip_to_storage_gateway')
+    @patch('get_log.cleanup_temp_files')
+    @patch('get_log.os.remove')
+    @patch('get_log.process_single_server')
+    def test_成功ケース_容量待ちがあれば途中で分割ZIP(self, mock_process, mock_remove, mock_cleanup, mock_upload,
+                                         mock_zip, mock_usage):
+        """成功ケース: 並列処理中に容量待ちのサーバーがあれば、処理済みファイルを先に分割ZIPにする"""
+        def process(hostname, server_info, from_date, to_date, global_limiter, storage_budget, ticket):
+            storage_budget.reserve(ticket, 6)
+            return [{"local_path": f"/tmp/{hostname}", "relative_path": hostname}], 6
+        mock_process.side_effect = process
+        mock_zip.side_effect = lambda files, folder, part, password: f"/tmp/part{part}.zip"
+        mock_upload.side_effect = lambda path, name: name
+
+        paths, _ = get_log.process_servers_logs(
+            {"srv1": {}, "srv2": {}, "srv3": {}}, datetime(2024, 1, 1), datetime(2024, 1, 1), "archive",
+            max_concurrent_servers=3
+        )
+
+        assert paths == ["archive_part1", "archive_part2", "archive_part3"]
+        assert [[f["relative_path"] for f in c.args[0]] for c in mock_zip.call_args_list] == [["srv1"], ["srv2"], ["srv3"]]
+
+class TestStorageBudget:
+    """StorageBudgetの予約順序・待機テスト"""
+
+    def test_成功ケース_チケット順に予約(self):
+        """成功ケース: 後のチケットは先のチケットが予約するまで待機する"""
+        import threading
+        budget = get_log.StorageBudget(10)
+        order = []
+        later = threading.Thread(target=lambda: order.append(("srv2", budget.reserve(1, 3))))
+        later.start()
+        later.join(0.05)
+        assert order == []
+
+        order.append(("srv1", budget.reserve(0, 5)))
+        later.join(1)
+
+        assert order == [("srv1", 5), ("srv2", 3)]
+        assert budget.used_bytes == 8
+
+    def test_成功ケース_上限超過は切り詰め(self):
+        """成功ケース: 上限を超える予約は上限までに切り詰める"""
+        budget = get_log.StorageBudget(10)
+
+        assert budget.reserve(0, 50) == 10
+        budget.release(0)
+        assert budget.used_bytes == 0
+
+    def test_失敗ケース_中断で待機を解除(self):
+        """失敗ケース: close() で容量待ちの予約は例外になる"""
+        import threading
+        budget = get_log.StorageBudget(10)
+        budget.reserve(0, 10)
+        errors = []
+        def wait():
+            try:
+                budget.reserve(1, 5)
+            except get_log.APIException as e:
+                errors.append(e.status_code)
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        waiter.join(0.05)
+        assert budget.has_waiters()
+
+        budget.close()
+        waiter.join(1)
+
+        assert errors == [500]
+
+# =============================================================================
+# ステージ別メトリクステスト
+#
+# ダウンロード・圧縮・Teams通知の各ステージでEMFメトリクスが出力されることを確認します。
+# =============================================================================
+
+@pytest.fixture
+def metrics_sink():
+    """メトリクス出力先をローカルシンクに差し替え"""
+    sink = LocalMetricsSink()
+    previous = set_metrics_sink(sink)
+    get_log.metrics_context.update({"request_id": "req-123", "system": "会計システム"})
+    yield sink
+    set_metrics_sink(previous)
+    get_log.metrics_context.clear()
+
+class TestStageMetrics:
+    """record_stage_metrics と各ステージの計測テスト"""
+
+    def test_成功ケース_ダウンロードメトリクス(self, metrics_sink):
+        """成功ケース: ファイル単位でバイト数・所要時間・MB/sが出力される"""
+        sftp = MagicMock()
+        sftp.__enter__.return_value = sftp
+        sftp.get.side_effect = lambda remote, local: open(local, "wb").write(b"x" * 2048)
+        ssh = Mock()
+        ssh.open_sftp.return_value = sftp
+
+        file_info = get_log.download_single_file_with_retry(ssh, f"srv1.{get_log.INTERNAL_DOMAIN}", "/var/log/app.log")
+        os.remove(file_info["local_path"])
+
+        record = metrics_sink.records[0]
+        assert record["Stage"] == "Download"
+        assert record["Server"] == "srv1"
+        assert record["System"] == "会計システム"
+        assert record["RequestId"] == "req-123"
+        assert record["File"] == "/var/log/app.log"
+        assert record["DownloadBytes"] == 2048
+        assert record["DownloadThroughput"] >= 0
+
+    def test_成功ケース_圧縮メトリクス(self, metrics_sink, tmp_path):
+        """成功ケース: ZIP作成時に圧縮時間とサイズ比が出力される"""
+        source = tmp_path / "app.log"
+        source.write_bytes(b"log line\n" * 1000)
+        files = [{"local_path": str(source), "relative_path": "srv1/app.log", "file_size": source.stat().st_size}]
+
+        zip_path = get_log.create_single_zip(files, "metrics_test_archive", "password12")
+        os.remove(zip_path)
+
+        ratio = metrics_sink.values("ZipSizeRatio", Stage="Compress")
+        assert len(ratio) == 1
+        assert 0 < ratio[0] < 1
+        assert metrics_sink.values("SourceBytes", Stage="Compress") == [source.stat().st_size]
+
+    @patch('get_log.http')
+    def test_成功ケース_Teams通知レイテンシ(self, mock_http, metrics_sink):
+        """成功ケース: Teams API呼び出しのレイテンシがステータスと共に出力される"""
+        mock_http.request.return_value = Mock(status=200, data=b'{"message": "ok"}')
+
+        get_log.call_teams_api({"mode": 2, "message_text": "test"})
+
+        record = metrics_sink.records[0]
+        assert record["Stage"] == "TeamsNotify"
+        assert record["StatusCode"] == 200
+        assert record["Mode"] == 2
+        assert "TeamsApiLatency" in record
+
+    def test_失敗ケース_出力失敗でも処理継続(self):
+        """失敗ケース: シンクで例外が発生しても呼び出し元へは伝播しない"""
+        def broken_sink(record):
+            raise IOError("stdout closed")
+        previous = set_metrics_sink(broken_sink)
+        try:
+            get_log.record_stage_metrics("Upload", {"UploadBytes": (1, "Bytes")})
+        finally:
+            set_metrics_sink(previous)
+
+class TestSendSuccessNotifications:
+    """成功通知送信のテスト"""
+
+    REQUEST_INFO = {"mail": "user@example.com", "system": "sys", "content": "調査",
+                    "from_date": "2024-01-01", "to_date": "2024-01-02"}
+
+    @patch('get_log.call_teams_api')
+    def test_成功ケース_一括送信は1回の呼び出し(self, mock_call):
+        """成功ケース: TEAMS_BATCH_DELIVERY有効時は申請者DMとチャンネル通知をmode 4で1回送信"""
+        mock_call.return_value = {"data": {"results": [{"index": 0, "status": 200, "message": "ok"},
+                                                       {"index": 1, "status": 200, "message": "ok"}]}}
+
+        with patch('get_log.TEAMS_BATCH_DELIVERY', True):
+            get_log.send_success_notifications(self.REQUEST_INFO, "approver@example.com", ["/path/a.zip"], "pw")
+
+        mock_call.assert_called_once()
+        sent = mock_call.call_args[0][0]
+        assert sent["mode"] == 4
+        assert [m["mode"] for m in sent["messages"]] == [1, 2]
+        assert sent["messages"][0]["email_addresses"] == ["user@example.com"]
+
+    @patch('get_log.call_teams_api')
+    def test_失敗ケース_一括送信の一部失敗(self, mock_call):
+        """失敗ケース: 一部メッセージが失敗した場合は502"""
+        mock_call.return_value = {"data": {"results": [{"index": 0, "status": 404, "message": "User not found"},
+                                                       {"index": 1, "status": 200, "message": "ok"}]}}
+
+        with patch('get_log.TEAMS_BATCH_DELIVERY', True):
+            with pytest.raises(get_log.APIException) as exc_info:
+                get_log.send_success_notifications(self.REQUEST_INFO, "approver@example.com", ["/path/a.zip"], "pw")
+
+        assert exc_info.value.status_code == 502
+        assert "User not found" in exc_info.value.message
+
+# 実行設定
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
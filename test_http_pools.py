@@ -0,0 +1,105 @@
+import pytest
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from http_pools import (
+    KEEPALIVE_IDLE_SECONDS,
+    KEEPALIVE_INTERVAL_SECONDS,
+    KEEPALIVE_PROBE_COUNT,
+    HostPoolManager,
+    connection_reuse,
+    connection_stats,
+    prewarm_connections
+)
+
+"""
+=============================================================================
+ホスト別接続プールモジュール テストスイート
+=============================================================================
+"""
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """keep-alive で空の200を返すハンドラー"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def local_server():
+    """ローカルHTTPサーバー（127.0.0.1）"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+class TestHostPoolManager:
+    """HostPoolManagerクラスのテスト"""
+
+    def test_成功ケース_ホスト別プールサイズ(self):
+        """成功ケース: 指定したホストのみプールサイズが変わる"""
+        manager = HostPoolManager({"graph.example.com": 16}, maxsize=2)
+
+        assert manager.connection_from_host("graph.example.com", 443, "https").pool.maxsize == 16
+        assert manager.connection_from_host("other.example.com", 443, "https").pool.maxsize == 2
+
+    def test_成功ケース_接続再利用率(self, local_server):
+        """成功ケース: 2回目以降のリクエストは既存接続を再利用する"""
+        manager = HostPoolManager(maxsize=1)
+        before = connection_stats(manager)
+
+        for _ in range(3):
+            manager.request("GET", f"{local_server}/")
+
+        reuse = connection_reuse(before, connection_stats(manager))
+        assert reuse["127.0.0.1"]["requests"] == 3
+        assert reuse["127.0.0.1"]["new_connections"] == 1
+        assert reuse["127.0.0.1"]["reuse_rate"] == pytest.approx(200 / 3)
+
+    @pytest.mark.skipif(not hasattr(socket, "TCP_KEEPIDLE"), reason="TCP_KEEPIDLE未対応のOS")
+    def test_成功ケース_キープアライブ間隔を短縮(self, local_server):
+        """成功ケース: 接続にTCPキープアライブと既定より短いアイドル秒数・送出間隔が設定される"""
+        manager = HostPoolManager(maxsize=1)
+        manager.request("GET", f"{local_server}/")
+
+        pool = manager.connection_from_url(local_server)
+        conn = pool.pool.get_nowait()
+        sock = conn.sock
+        assert sock.getsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE) == 1
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE) == KEEPALIVE_IDLE_SECONDS
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL) == KEEPALIVE_INTERVAL_SECONDS
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT) == KEEPALIVE_PROBE_COUNT
+        pool.pool.put(conn)
+
+class TestPrewarmConnections:
+    """prewarm_connections関数のテスト"""
+
+    def test_成功ケース_初回リクエストは新規接続不要(self, local_server):
+        """成功ケース: 事前に開いた接続を最初のリクエストで再利用する"""
+        manager = HostPoolManager(maxsize=1)
+
+        assert prewarm_connections(manager, [f"{local_server}/"]) == 1
+        before = connection_stats(manager)
+        manager.request("GET", f"{local_server}/")
+
+        assert connection_reuse(before, connection_stats(manager))["127.0.0.1"]["new_connections"] == 0
+
+    def test_失敗ケース_接続失敗は無視(self):
+        """失敗ケース: 接続できないホストは警告のみで0件"""
+        manager = HostPoolManager(maxsize=1)
+
+        assert prewarm_connections(manager, ["http://127.0.0.1:9/"], timeout=0.5) == 0
+
+    def test_失敗ケース_PoolManager以外は集計しない(self):
+        """失敗ケース: テストでモックに差し替えた場合などは空の集計を返す"""
+        assert connection_stats(object()) == {}
@@ -0,0 +1,134 @@
+import pytest
+import os
+from unittest.mock import Mock, patch
+
+import boto3
+from moto import mock_s3
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'ap-northeast-1')
+
+from lambda_profiler import should_profile, profile_handler, upload_profile_reports
+
+"""
+=============================================================================
+オンデマンドプロファイリング テストスイート
+=============================================================================
+"""
+
+@pytest.fixture
+def mock_context():
+    """Lambda contextのモック"""
+    context = Mock()
+    context.aws_request_id = "test-request-id-123"
+    context.function_name = "teamsapi"
+    return context
+
+class TestShouldProfile:
+    """should_profile関数のテスト"""
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER": "true"})
+    def test_成功ケース_イベントフラグ(self):
+        """成功ケース: 許可時はイベントの profile=true で有効化"""
+        assert should_profile({"profile": True}) is True
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER": "true"})
+    def test_成功ケース_ヘッダーフラグ(self):
+        """成功ケース: 許可時はAPI Gatewayの X-Profile ヘッダーで有効化（大文字小文字を区別しない）"""
+        assert should_profile({"headers": {"x-profile": "TRUE"}}) is True
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_SAMPLE_RATE": "0", "LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER": ""})
+    def test_失敗ケース_未許可のリクエスト指定は無視(self):
+        """失敗ケース: 許可されていなければイベント・ヘッダーの指定では有効化しない"""
+        assert should_profile({"profile": True}) is False
+        assert should_profile({"headers": {"X-Profile": "true"}}) is False
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_SAMPLE_RATE": "0"})
+    def test_成功ケース_既定は無効(self):
+        """成功ケース: フラグなし・サンプリング率0では無効"""
+        assert should_profile({"body": "{}"}) is False
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_SAMPLE_RATE": "0.25"})
+    @patch('lambda_profiler.random.random')
+    def test_成功ケース_サンプリング(self, mock_random):
+        """成功ケース: サンプリング率未満の乱数のときのみ有効"""
+        mock_random.return_value = 0.1
+        assert should_profile({}) is True
+        mock_random.return_value = 0.5
+        assert should_profile({}) is False
+
+    @patch.dict(os.environ, {"LAMBDA_PROFILE_SAMPLE_RATE": "abc"})
+    def test_失敗ケース_不正なサンプリング率(self):
+        """失敗ケース: 数値でないサンプリング率は無効扱い"""
+        assert should_profile({}) is False
+
+@patch.dict(os.environ, {"LAMBDA_PROFILE_ALLOW_REQUEST_TRIGGER": "true"})
+class TestProfileHandler:
+    """profile_handlerデコレーターのテスト"""
+
+    @patch('lambda_profiler.upload_profile_reports')
+    def test_成功ケース_無効時は素通し(self, mock_upload, mock_context):
+        """成功ケース: 対象外の呼び出しは計測・アップロードしない"""
+        handler = profile_handler(lambda event, context: {"statusCode": 200})
+
+        assert handler({}, mock_context) == {"statusCode": 200}
+        mock_upload.assert_not_called()
+
+    @patch('lambda_profiler.upload_profile_reports')
+    def test_成功ケース_レポート作成(self, mock_upload, mock_context):
+        """成功ケース: 計測結果としてpstats・サマリ・割り当て上位が作成される"""
+        def handler(event, context):
+            return {"data": [str(i) for i in range(1000)]}
+
+        result = profile_handler(handler)({"profile": True}, mock_context)
+
+        assert len(result["data"]) == 1000
+        reports, function_name, request_id = mock_upload.call_args[0]
+        assert set(reports) == {"profile.pstats", "profile.txt", "allocations.txt"}
+        assert b"peak traced memory" in reports["allocations.txt"]
+        assert function_name == "teamsapi"
+        assert request_id == "test-request-id-123"
+
+    @patch('lambda_profiler.upload_profile_reports')
+    def test_失敗ケース_ハンドラー例外はそのまま送出(self, mock_upload, mock_context):
+        """失敗ケース: ハンドラーの例外は握りつぶさず、レポートは保存する"""
+        def handler(event, context):
+            raise RuntimeError("処理失敗")
+
+        with pytest.raises(RuntimeError):
+            profile_handler(handler)({"profile": True}, mock_context)
+        mock_upload.assert_called_once()
+
+    @patch('lambda_profiler.upload_profile_reports')
+    def test_失敗ケース_アップロード失敗でも結果を返す(self, mock_upload, mock_context):
+        """失敗ケース: レポート保存失敗はハンドラーの戻り値に影響しない"""
+        mock_upload.side_effect = Exception("AccessDenied")
+
+        result = profile_handler(lambda event, context: "ok")({"profile": True}, mock_context)
+
+        assert result == "ok"
+
+class TestUploadProfileReports:
+    """upload_profile_reports関数のテスト"""
+
+    @mock_s3
+    @patch.dict(os.environ, {"PROFILE_BUCKET_NAME": "profile-bucket", "PROFILE_S3_PREFIX": "profiles/",
+                             "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"})
+    def test_成功ケース_request_id単位で保存(self):
+        """成功ケース: 関数名・request_idをキーにS3へ保存される"""
+        s3 = boto3.client('s3')
+        s3.create_bucket(Bucket="profile-bucket", CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"})
+
+        prefix = upload_profile_reports({"profile.txt": b"summary"}, "teamsapi", "req-123")
+
+        assert prefix == "profiles/teamsapi/req-123/"
+        body = s3.get_object(Bucket="profile-bucket", Key="profiles/teamsapi/req-123/profile.txt")["Body"].read()
+        assert body == b"summary"
+
+    @patch.dict(os.environ, {"PROFILE_BUCKET_NAME": ""})
+    def test_失敗ケース_バケット未設定(self):
+        """失敗ケース: バケット未設定時はログ出力のみでNoneを返す"""
+        assert upload_profile_reports({"profile.txt": b"summary"}, "teamsapi", "req-123") is None
+
+# 実行設定
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import Mock, patch
+
+from lazy_clients import LazyClient
+
+"""
+=============================================================================
+遅延作成boto3クライアント テストスイート
+=============================================================================
+"""
+
+class TestLazyClient:
+    """LazyClientクラスのテスト"""
+
+    def test_成功ケース_初回アクセス時に1回だけ作成(self):
+        """成功ケース: 作成時点ではboto3.clientを呼ばず、最初の属性アクセスで1回だけ作成する"""
+        client = Mock()
+        with patch('boto3.client', return_value=client) as mock_boto3_client:
+            lazy = LazyClient('ssm', region_name="ap-northeast-1")
+            mock_boto3_client.assert_not_called()
+
+            lazy.get_parameter(Name="/a")
+            lazy.put_parameter(Name="/a", Value="v")
+
+        mock_boto3_client.assert_called_once_with('ssm', region_name="ap-northeast-1")
+        client.get_parameter.assert_called_once_with(Name="/a")
+        assert "created" in repr(lazy)
+
+    def test_失敗ケース_作成失敗は次回再試行(self):
+        """失敗ケース: クライアント作成に失敗した場合は次のアクセスで再作成する"""
+        with patch('boto3.client', side_effect=[RuntimeError("no region"), Mock()]) as mock_boto3_client:
+            lazy = LazyClient('s3')
+            with pytest.raises(RuntimeError):
+                lazy.get_object
+            lazy.get_object
+
+        assert mock_boto3_client.call_count == 2
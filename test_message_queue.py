@@ -0,0 +1,56 @@
+import pytest
+import os
+import json
+from unittest.mock import patch
+
+from message_queue import (
+    create_queue,
+    LocalQueue,
+    SqsQueue
+)
+
+"""
+=============================================================================
+送信キューモジュール テストスイート
+=============================================================================
+"""
+
+class TestLocalQueue:
+    """LocalQueueクラスのテスト"""
+
+    def test_成功ケース_SQSイベント形式で取り出し(self):
+        """成功ケース: 投入順にSQSイベント形式で最大件数まで取り出せる"""
+        queue = LocalQueue()
+        message_ids = [queue.send({"n": i}) for i in range(3)]
+
+        event = queue.receive_event(max_messages=2)
+
+        assert [r["messageId"] for r in event["Records"]] == message_ids[:2]
+        assert json.loads(event["Records"][0]["body"]) == {"n": 0}
+        assert len(queue) == 1
+
+class TestCreateQueue:
+    """create_queue関数のテスト"""
+
+    def test_成功ケース_URLに応じたキュー(self):
+        """成功ケース: 未設定はNone、"local"はプロセス内キュー、それ以外はSQS"""
+        assert create_queue(None) is None
+        assert isinstance(create_queue("local"), LocalQueue)
+        assert isinstance(create_queue("https://sqs.ap-northeast-1.amazonaws.com/123/teams"), SqsQueue)
+
+class TestSqsQueue:
+    """SqsQueueクラスのテスト"""
+
+    def test_成功ケース_SQSへ送信(self):
+        """成功ケース: JSON本文で送信しメッセージIDを返す"""
+        import boto3
+        from moto import mock_sqs
+        with mock_sqs(), patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}):
+            sqs = boto3.client('sqs', region_name='ap-northeast-1')
+            queue_url = sqs.create_queue(QueueName='teams-messages')['QueueUrl']
+
+            message_id = SqsQueue(queue_url, sqs_client=sqs).send({"message_text": "テスト"})
+
+            messages = sqs.receive_message(QueueUrl=queue_url)['Messages']
+            assert messages[0]['MessageId'] == message_id
+            assert json.loads(messages[0]['Body']) == {"message_text": "テスト"}
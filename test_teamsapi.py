@@ -358,7 +358,7 @@ class TestUserFunctions:
         assert result["id"] == "user123"
         assert result["displayName"] == "田中太郎"
         mock_graph_request.assert_called_once_with(
-            "GET", "/users/tanaka@example.com", "access_token", request_id="req-123"
+            "GET", "/users/tanaka@example.com?$select=id,displayName,mail", "access_token", request_id="req-123"
         )
     
     @patch('teamsapi.make_graph_request')
@@ -1414,13 +1414,13 @@ class TestExtendedMentionFunctions:
         assert len(mentions) == 0
         assert message_with_mentions == "お疲れ様です"
     
-    @patch('teamsapi.find_user_by_email')
-    def test_process_mentions_by_email_複数メンション(self, mock_find_user):
-        """メンション処理 - 複数メンションテスト"""
-        mock_find_user.side_effect = [
-            {"id": "user1", "displayName": "田中太郎"},
-            {"id": "user2", "displayName": "佐藤花子"}
-        ]
+    @patch('teamsapi.make_graph_request')
+    def test_process_mentions_by_email_複数メンション(self, mock_graph_request):
+        """メンション処理 - 複数メンションテスト（$batchで1回の呼び出し）"""
+        mock_graph_request.return_value = {"responses": [
+            {"id": "1", "status": 200, "body": {"id": "user2", "displayName": "佐藤花子"}},
+            {"id": "0", "status": 200, "body": {"id": "user1", "displayName": "田中太郎"}}
+        ]}
         
         mentions = [
             MentionModel(email_address="tanaka@example.com"),
@@ -1434,6 +1434,8 @@ class TestExtendedMentionFunctions:
         assert result[1]["user_id"] == "user2"
         assert result[0]["email_address"] == "tanaka@example.com"
         assert result[1]["email_address"] == "sato@example.com"
+        mock_graph_request.assert_called_once()
+        assert mock_graph_request.call_args[0][:2] == ("POST", "/$batch")
     
     @patch('teamsapi.find_user_by_email')
     def test_process_mentions_by_email_予期しないエラー(self, mock_find_user):
@@ -1528,16 +1530,17 @@ class TestExtendedHandlerFunctions:
         
         assert exc_info.value.status_code == 401
     
-    @patch('teamsapi.post_message_to_chat')
-    @patch('teamsapi.find_or_create_chat')
-    @patch('teamsapi.find_user_by_email')
-    @patch('teamsapi.process_mentions_by_email')
-    def test_handle_dm_mode_部分失敗(self, mock_process_mentions, mock_find_user, mock_find_chat, mock_post_message):
-        """DMモード - 部分失敗テスト"""
-        mock_process_mentions.return_value = []
-        mock_find_user.side_effect = [
-            {"id": "user1"},  # 1人目成功
-            APIException(404, "User not found")  # 2人目失敗
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_handle_dm_mode_部分失敗(self, mock_graph_request, mock_caller):
+        """DMモード - 部分失敗テスト（失敗した宛先以外には送信する）"""
+        mock_graph_request.side_effect = [
+            {"responses": [
+                {"id": "0", "status": 200, "body": {"id": "user1"}},  # 1人目成功
+                {"id": "1", "status": 404, "body": {"error": {"message": "User not found"}}}  # 2人目失敗
+            ]},
+            {"responses": [{"id": "0", "status": 201, "body": {"id": "chat1"}}]},  # チャット解決
+            {"responses": [{"id": "0", "status": 201, "body": {"id": "message1"}}]}  # 送信
         ]
         
         request_data = DMRequestModel(
@@ -1550,6 +1553,8 @@ class TestExtendedHandlerFunctions:
             handle_dm_mode(request_data, "token", "req-123")
         
         assert exc_info.value.status_code == 404
+        assert "user2@example.com" in exc_info.value.message
+        assert mock_graph_request.call_args[0][3]["requests"][0]["url"] == "/chats/chat1/messages"
     
     @patch('teamsapi.post_message_to_channel')
     @patch('teamsapi.process_mentions_by_email')
@@ -1773,7 +1778,7 @@ class TestValidateAndParseRequestFailure:
         """
         invalid_mode_cases = [
             {"mode": 0},      # 範囲外（小）
-            {"mode": 4},      # 範囲外（大）
+            {"mode": 5},      # 範囲外（大）
             {"mode": "1"},    # 文字列
             {"mode": None},   # null
             {}                # mode不足
@@ -35,6 +35,41 @@ from teamsapi import (
     DMRequestModel,
     ChannelRequestModel,
     RefreshTokenRequestModel,
+    get_access_token,
+    get_cached_access_token,
+    cache_access_token,
+    rotate_tokens_with_lock,
+    replace_rejected_access_token,
+    acquire_token_lock,
+    release_token_lock,
+    save_refresh_token_if_unchanged,
+    handle_channel_mode,
+    resolve_team_id,
+    iterate_graph_collection,
+    build_graph_query,
+    resolve_chat_id,
+    find_existing_chat,
+    get_caller_user_id,
+    execute_graph_batch,
+    find_users_by_email,
+    run_concurrently,
+    start_retry_window,
+    end_retry_window,
+    next_retry_delay,
+    parse_retry_after,
+    queue_worker_handler,
+    coalesce_channel_records,
+    merge_channel_requests,
+    handle_batch_mode,
+    validate_and_parse_request,
+    create_success_response,
+    BatchRequestModel,
+    run_idempotent,
+    emit_connection_metrics,
+    parse_queued_records,
+    parse_queued_message,
+    QueuedMessageModel,
+    token_refresher_handler,
     MentionModel
 )
 
@@ -346,7 +381,7 @@ class TestFindUserByEmailSuccess:
         
         # Graph API呼び出し検証
         mock_graph_request.assert_called_once_with(
-            "GET", "/users/tanaka@example.com", "access_token", request_id="req-123"
+            "GET", "/users/tanaka@example.com?$select=id,displayName,mail", "access_token", request_id="req-123"
         )
 
 class TestFindUserByEmailFailure:
@@ -477,6 +512,1881 @@ class TestFindTeamIdByNameFailure:
         assert exc_info.value.status_code == 404
         assert "Team not found: 任意のチーム" in exc_info.value.message
 
+# =============================================================================
+# アクセストークンキャッシュテスト
+#
+# get_access_token / cache_access_token をテストします。
+# ウォームコンテナではトークンエンドポイントとSSMを呼ばずに再利用します。
+# =============================================================================
+
+class TestAccessTokenCacheSuccess:
+    """アクセストークンキャッシュの成功ケーステスト"""
+
+    @patch('teamsapi.save_refresh_token_to_ssm')
+    @patch('teamsapi.get_refresh_token_from_ssm')
+    @patch('teamsapi.http')
+    def test_成功ケース_2回目はキャッシュ利用(self, mock_http, mock_get_ssm, mock_save_ssm):
+        """成功ケース: 有効期限内の2回目以降はSSM・トークンエンドポイントを呼ばない"""
+        mock_get_ssm.return_value = "old_refresh_token"
+        mock_response = Mock()
+        mock_response.status = 200
+        mock_response.data.decode.return_value = json.dumps({
+            "access_token": "cached_access_token",
+            "refresh_token": "new_refresh_token",
+            "expires_in": 3599
+        })
+        mock_http.request.return_value = mock_response
+
+        first = get_access_token("req-1")
+        second = get_access_token("req-2")
+
+        assert first == second == "cached_access_token"
+        assert mock_http.request.call_count == 1
+        mock_get_ssm.assert_called_once()
+        mock_save_ssm.assert_called_once_with("new_refresh_token", "/test/refresh_token")
+
+    @patch('teamsapi.time.time')
+    def test_成功ケース_安全マージン内は期限切れ扱い(self, mock_time):
+        """成功ケース: 残り有効期間が安全マージン未満のトークンは返さない"""
+        mock_time.return_value = 1000.0
+        cache_access_token("token", 600)
+
+        mock_time.return_value = 1000.0 + 600 - 301
+        assert get_cached_access_token() == "token"
+
+        mock_time.return_value = 1000.0 + 600 - 299
+        assert get_cached_access_token() is None
+
+    def test_成功ケース_expires_in未返却は既定値(self):
+        """成功ケース: expires_inが無い・不正な場合は既定の有効期間でキャッシュ"""
+        cache_access_token("token", None)
+        assert get_cached_access_token() == "token"
+
+        cache_access_token("token2", "invalid")
+        assert get_cached_access_token() == "token2"
+
+class TestAccessTokenCacheFailure:
+    """アクセストークンキャッシュの失敗ケーステスト"""
+
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.validate_and_parse_request')
+    def test_失敗ケース_401でキャッシュ破棄(self, mock_validate, mock_handle_dm):
+        """失敗ケース: Graph APIの401エラー時はキャッシュ済みトークンを破棄する"""
+        cache_access_token("revoked_token", 3600)
+        mock_validate.return_value = DMRequestModel(mode=1, email_addresses=["user@example.com"], message_text="テスト")
+        mock_handle_dm.side_effect = ExternalAPIException(401, "Unauthorized access", 401, "Token revoked")
+        context = Mock()
+        context.aws_request_id = "req-123"
+
+        result = lambda_handler({"body": "{}"}, context)
+
+        assert result["statusCode"] == 401
+        assert get_cached_access_token() is None
+
+    @patch('teamsapi.refresh_access_token')
+    @patch('teamsapi.get_refresh_token_from_ssm')
+    def test_失敗ケース_リフレッシュ失敗はキャッシュしない(self, mock_get_ssm, mock_refresh):
+        """失敗ケース: トークンリフレッシュ失敗時は例外を送出しキャッシュは空のまま"""
+        mock_get_ssm.return_value = "old_refresh_token"
+        mock_refresh.side_effect = APIException(401, "Invalid refresh token")
+
+        with pytest.raises(APIException):
+            get_access_token("req-123")
+
+        assert get_cached_access_token() is None
+
+# =============================================================================
+# リフレッシュトークンローテーション排他テスト
+#
+# DynamoDBの条件付き書き込みによるリースと、SSMパラメータのバージョン比較による
+# 排他制御をmotoでテストします。
+# =============================================================================
+
+@pytest.fixture
+def moto_dynamodb():
+    """moto上にリース用DynamoDBテーブルを作成"""
+    import boto3
+    from moto import mock_dynamodb
+    with mock_dynamodb(), patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}):
+        client = boto3.client('dynamodb', region_name='ap-northeast-1')
+        client.create_table(
+            TableName='test-token-lock',
+            KeySchema=[{"AttributeName": "lock_name", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "lock_name", "AttributeType": "S"}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        with patch('teamsapi.dynamodb_client', client), \
+             patch('teamsapi.TOKEN_LOCK_TABLE_NAME', 'test-token-lock'), \
+             patch('teamsapi.TOKEN_LOCK_NAME', '/test/refresh_token-lock'):
+            yield client
+
+def get_lease(dynamodb_client):
+    """リース用テーブルの現在のアイテム（無ければNone）"""
+    item = dynamodb_client.get_item(TableName='test-token-lock', Key={"lock_name": {"S": '/test/refresh_token-lock'}}).get("Item")
+    if item is None:
+        return None
+    return {"owner": item["owner"]["S"], "expires_at": float(item["expires_at"]["N"])}
+
+@pytest.fixture
+def moto_ssm(moto_dynamodb):
+    """moto上のSSMクライアントに差し替え、共有トークン保存先とリース用テーブルを有効化"""
+    import boto3
+    from moto import mock_ssm
+    with mock_ssm():
+        client = boto3.client('ssm', region_name='ap-northeast-1')
+        client.put_parameter(Name='/test/refresh_token', Value='refresh-v1', Type='SecureString')
+        with patch('teamsapi.ssm_client', client), \
+             patch('teamsapi.ACCESS_TOKEN_PARAM_NAME', '/test/access_token'):
+            yield client
+
+class TestTokenRotationLockSuccess:
+    """トークンローテーション排他の成功ケーステスト"""
+
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_ローテーションと共有トークン公開(self, mock_refresh, moto_ssm, moto_dynamodb):
+        """成功ケース: リース取得後にローテーションし、共有トークンを公開してリースを解放する"""
+        mock_refresh.return_value = ("access-v2", "refresh-v2")
+
+        token = rotate_tokens_with_lock("req-1")
+
+        assert token == "access-v2"
+        assert moto_ssm.get_parameter(Name='/test/refresh_token', WithDecryption=True)['Parameter']['Value'] == 'refresh-v2'
+        shared = json.loads(moto_ssm.get_parameter(Name='/test/access_token', WithDecryption=True)['Parameter']['Value'])
+        assert shared["access_token"] == "access-v2"
+        assert get_lease(moto_dynamodb) is None
+
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_共有トークン再利用(self, mock_refresh, moto_ssm):
+        """成功ケース: 有効な共有トークンがあればトークンエンドポイントを呼ばない"""
+        import time as time_module
+        moto_ssm.put_parameter(
+            Name='/test/access_token', Type='SecureString',
+            Value=json.dumps({"access_token": "shared-token", "expires_at": time_module.time() + 3600})
+        )
+
+        assert rotate_tokens_with_lock("req-1") == "shared-token"
+        mock_refresh.assert_not_called()
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_他インスタンスの更新を待って再利用(self, mock_refresh, mock_sleep, moto_ssm):
+        """成功ケース: リース保持中の他インスタンスが公開したトークンを待機後に再利用する"""
+        import time as time_module
+        assert acquire_token_lock("other-instance")
+
+        def other_instance_publishes(seconds):
+            moto_ssm.put_parameter(
+                Name='/test/access_token', Type='SecureString', Overwrite=True,
+                Value=json.dumps({"access_token": "rotated-by-other", "expires_at": time_module.time() + 3600})
+            )
+        mock_sleep.side_effect = other_instance_publishes
+
+        assert rotate_tokens_with_lock("req-1") == "rotated-by-other"
+        mock_refresh.assert_not_called()
+
+    def test_成功ケース_期限切れリースは奪取(self, moto_dynamodb):
+        """成功ケース: 異常終了したインスタンスの期限切れリースは条件付き書き込みで奪取できる"""
+        moto_dynamodb.put_item(
+            TableName='test-token-lock',
+            Item={"lock_name": {"S": '/test/refresh_token-lock'}, "owner": {"S": "crashed-instance"}, "expires_at": {"N": "0"}}
+        )
+
+        assert acquire_token_lock("req-1") is True
+        assert get_lease(moto_dynamodb)["owner"] == "req-1"
+        assert acquire_token_lock("req-2") is False
+
+class TestTokenRotationLockFailure:
+    """トークンローテーション排他の失敗ケーステスト"""
+
+    def test_失敗ケース_リース取得済み(self, moto_dynamodb):
+        """失敗ケース: 有効なリースがある間は他インスタンスは取得できない"""
+        assert acquire_token_lock("instance-a") is True
+        assert acquire_token_lock("instance-b") is False
+
+    def test_失敗ケース_他者のリースは解放しない(self, moto_dynamodb):
+        """失敗ケース: 所有者以外の解放要求ではリースを削除しない"""
+        acquire_token_lock("instance-a")
+
+        release_token_lock("instance-b")
+
+        assert get_lease(moto_dynamodb)["owner"] == "instance-a"
+
+    def test_失敗ケース_奪取されたリースは解放しない(self, moto_dynamodb):
+        """失敗ケース: 期限切れ後に他インスタンスが取得したリースを元の所有者が削除しない"""
+        moto_dynamodb.put_item(
+            TableName='test-token-lock',
+            Item={"lock_name": {"S": '/test/refresh_token-lock'}, "owner": {"S": "instance-a"}, "expires_at": {"N": "0"}}
+        )
+        assert acquire_token_lock("instance-b") is True
+
+        release_token_lock("instance-a")
+
+        assert get_lease(moto_dynamodb)["owner"] == "instance-b"
+
+    def test_失敗ケース_スロットリングは未取得扱い(self, moto_dynamodb):
+        """失敗ケース: リース書き込みのスロットリングは500にせず未取得として返す"""
+        from botocore.exceptions import ClientError
+        throttled = ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "Rate exceeded"}}, "PutItem")
+
+        with patch.object(moto_dynamodb, 'put_item', side_effect=throttled):
+            assert acquire_token_lock("instance-a") is False
+
+    @patch('teamsapi.TOKEN_LOCK_TABLE_NAME', None)
+    def test_失敗ケース_テーブル未設定(self):
+        """失敗ケース: リース用テーブルが無ければ500"""
+        with pytest.raises(APIException) as exc_info:
+            acquire_token_lock("instance-a")
+
+        assert exc_info.value.status_code == 500
+
+    def test_失敗ケース_バージョン不一致は保存しない(self, moto_ssm):
+        """失敗ケース: 読み込み後に他インスタンスが更新した場合は上書きしない"""
+        moto_ssm.put_parameter(Name='/test/refresh_token', Value='refresh-by-other', Type='SecureString', Overwrite=True)
+
+        assert save_refresh_token_if_unchanged("refresh-stale", "/test/refresh_token", 1) is False
+        assert moto_ssm.get_parameter(Name='/test/refresh_token', WithDecryption=True)['Parameter']['Value'] == 'refresh-by-other'
+
+    @patch('teamsapi.TOKEN_LOCK_WAIT_SECONDS', 0)
+    @patch('teamsapi.refresh_access_token')
+    def test_失敗ケース_待機タイムアウト(self, mock_refresh, moto_ssm):
+        """失敗ケース: 他インスタンスのローテーションが終わらない場合は503"""
+        acquire_token_lock("other-instance")
+
+        with pytest.raises(APIException) as exc_info:
+            rotate_tokens_with_lock("req-1")
+
+        assert exc_info.value.status_code == 503
+        mock_refresh.assert_not_called()
+
+    @patch('teamsapi.refresh_access_token', return_value=("access-v2", "refresh-v2"))
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.validate_and_parse_request')
+    def test_失敗ケース_401で共有トークンを置き換え(self, mock_validate, mock_handle_dm, mock_refresh,
+                                         moto_ssm, moto_dynamodb, mock_context):
+        """失敗ケース: Graph APIが拒否した共有トークンは有効期限内でも置き換え、次回は新しいトークンを使う"""
+        put_shared_token(moto_ssm, "revoked", 3600)
+        mock_validate.return_value = DMRequestModel(mode=1, email_addresses=["user@example.com"], message_text="テスト")
+        mock_handle_dm.side_effect = [
+            ExternalAPIException(401, "Unauthorized access", 401, "Token revoked"),
+            create_success_response("req", message="ok")
+        ]
+
+        first = lambda_handler({"body": "{}"}, mock_context)
+        second = lambda_handler({"body": "{}"}, mock_context)
+
+        assert first["statusCode"] == 401
+        assert second["statusCode"] == 200
+        assert [call[0][1] for call in mock_handle_dm.call_args_list] == ["revoked", "access-v2"]
+        mock_refresh.assert_called_once()
+        shared = json.loads(moto_ssm.get_parameter(Name='/test/access_token', WithDecryption=True)['Parameter']['Value'])
+        assert shared["access_token"] == "access-v2"
+        assert get_lease(moto_dynamodb) is None
+
+    @patch('teamsapi.refresh_access_token', return_value=("access-v2", "refresh-v2"))
+    @patch('teamsapi.handle_dm_mode', side_effect=ExternalAPIException(401, "Unauthorized access", 401, "Token revoked"))
+    def test_失敗ケース_ワーカーの401で共有トークンを置き換え(self, mock_handle_dm, mock_refresh, moto_ssm, moto_dynamodb, mock_context):
+        """失敗ケース: ワーカーは401のメッセージを再配信し、再配信時は置き換え後のトークンで送信する"""
+        put_shared_token(moto_ssm, "revoked", 3600)
+        body = json.dumps({"request_id": "req-dm", "request": {"mode": 1, "email_addresses": ["a@example.com"], "message_text": "DM"}})
+        event = {"Records": [{"messageId": "m1", "body": body}, {"messageId": "m2", "body": body}]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+        mock_refresh.assert_called_once()
+        assert get_access_token("req-2") == "access-v2"
+
+    @patch('teamsapi.refresh_access_token')
+    def test_失敗ケース_置き換え済みの共有トークンは再利用(self, mock_refresh, moto_ssm):
+        """失敗ケース: 他インスタンスが既に置き換えていればローテーションしない"""
+        put_shared_token(moto_ssm, "access-v3", 3600)
+
+        replace_rejected_access_token("revoked", "req-1")
+
+        assert get_cached_access_token() == "access-v3"
+        mock_refresh.assert_not_called()
+
+# =============================================================================
+# チーム・チャンネルID解決キャッシュテスト
+#
+# handle_channel_mode のID解決キャッシュとキャッシュ無効化をテストします。
+# =============================================================================
+
+def make_channel_request():
+    return ChannelRequestModel(
+        mode=2, team_name="開発チーム", channel_name="一般",
+        message_text="テスト", subject="件名"
+    )
+
+class TestChannelIdCacheSuccess:
+    """チーム・チャンネルID解決キャッシュの成功ケーステスト"""
+
+    @patch('teamsapi.post_message_to_channel')
+    @patch('teamsapi.find_channel_id_by_name', return_value="channel-1")
+    @patch('teamsapi.find_team_id_by_name', return_value="team-1")
+    def test_成功ケース_2回目はGraph解決なし(self, mock_team, mock_channel, mock_post):
+        """成功ケース: 2回目以降の送信はチーム・チャンネル一覧を取得しない"""
+        handle_channel_mode(make_channel_request(), "token", "req-1")
+        handle_channel_mode(make_channel_request(), "token", "req-2")
+
+        assert mock_team.call_count == 1
+        assert mock_channel.call_count == 1
+        assert mock_post.call_count == 2
+        assert mock_post.call_args[0][1:3] == ("team-1", "channel-1")
+
+    @patch('teamsapi.post_message_to_channel')
+    @patch('teamsapi.find_channel_id_by_name', side_effect=["channel-old", "channel-new"])
+    @patch('teamsapi.find_team_id_by_name', return_value="team-1")
+    def test_成功ケース_送信404でキャッシュ無効化し再解決(self, mock_team, mock_channel, mock_post):
+        """成功ケース: キャッシュ済みIDで404になった場合は再解決して1回だけ再送する"""
+        handle_channel_mode(make_channel_request(), "token", "req-1")
+        mock_post.side_effect = [APIException(404, "Resource not found"), None]
+
+        result = handle_channel_mode(make_channel_request(), "token", "req-2")
+
+        assert result["statusCode"] == 200
+        assert mock_channel.call_count == 2
+        assert mock_post.call_args[0][2] == "channel-new"
+
+class TestChannelIdCacheFailure:
+    """チーム・チャンネルID解決キャッシュの失敗ケーステスト"""
+
+    @patch('teamsapi.find_team_id_by_name', side_effect=APIException(404, "Team not found: 開発チーム"))
+    def test_失敗ケース_未発見はネガティブキャッシュ(self, mock_team):
+        """失敗ケース: 存在しないチームは短時間Graphへ再問い合わせしない"""
+        for _ in range(2):
+            with pytest.raises(APIException) as exc_info:
+                resolve_team_id("token", "開発チーム", "req-1")
+            assert exc_info.value.status_code == 404
+
+        assert mock_team.call_count == 1
+
+    @patch('teamsapi.post_message_to_channel', side_effect=APIException(404, "Resource not found"))
+    @patch('teamsapi.find_channel_id_by_name', return_value="channel-1")
+    @patch('teamsapi.find_team_id_by_name', return_value="team-1")
+    def test_失敗ケース_未キャッシュ時の404は再送しない(self, mock_team, mock_channel, mock_post):
+        """失敗ケース: その場で解決したIDでの404はそのまま返す"""
+        with pytest.raises(APIException) as exc_info:
+            handle_channel_mode(make_channel_request(), "token", "req-1")
+
+        assert exc_info.value.status_code == 404
+        assert mock_post.call_count == 1
+
+# =============================================================================
+# Graphコレクション ページング テスト
+#
+# iterate_graph_collection と一覧検索関数の @odata.nextLink 追跡をテストします。
+# =============================================================================
+
+class TestIterateGraphCollectionSuccess:
+    """iterate_graph_collection関数の成功ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_nextLinkを辿る(self, mock_graph_request):
+        """成功ケース: nextLinkのベースURLを除いたエンドポイントで次ページを取得する"""
+        mock_graph_request.side_effect = [
+            {"value": [{"id": "1"}], "@odata.nextLink": "https://graph.microsoft.com/v1.0/me/chats?$top=1&$skiptoken=abc"},
+            {"value": [{"id": "2"}]}
+        ]
+
+        items = list(iterate_graph_collection("/me/chats", "token", "req-1", page_size=1))
+
+        assert [item["id"] for item in items] == ["1", "2"]
+        assert mock_graph_request.call_args_list[0][0][1] == "/me/chats?$top=1"
+        assert mock_graph_request.call_args_list[1][0][1] == "/me/chats?$top=1&$skiptoken=abc"
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_途中終了時は次ページを取得しない(self, mock_graph_request):
+        """成功ケース: 呼び出し側がループを抜けたら以降のページは取得しない"""
+        mock_graph_request.return_value = {
+            "value": [{"id": "1"}, {"id": "2"}],
+            "@odata.nextLink": "https://graph.microsoft.com/v1.0/me/chats?$skiptoken=abc"
+        }
+
+        first = next(iterate_graph_collection("/me/chats", "token", "req-1"))
+
+        assert first["id"] == "1"
+        assert mock_graph_request.call_count == 1
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_2ページ目の既存チャットを使用(self, mock_graph_request):
+        """成功ケース: 1ページ目に無い既存チャットも見つける"""
+        other_chat = {"id": "chat-other", "chatType": "oneOnOne",
+                      "members": [{"user": {"id": "me"}}, {"user": {"id": "other"}}]}
+        target_chat = {"id": "chat-target", "chatType": "oneOnOne",
+                       "members": [{"user": {"id": "me"}}, {"user": {"id": "target"}}]}
+        mock_graph_request.side_effect = [
+            {"value": [other_chat], "@odata.nextLink": "https://graph.microsoft.com/v1.0/me/chats?$skiptoken=p2"},
+            {"value": [target_chat], "@odata.nextLink": "https://graph.microsoft.com/v1.0/me/chats?$skiptoken=p3"}
+        ]
+
+        assert find_existing_chat("token", "target", "req-1") == "chat-target"
+        assert mock_graph_request.call_count == 2
+
+class TestIterateGraphCollectionFailure:
+    """iterate_graph_collection関数の失敗ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_失敗ケース_想定外のnextLink(self, mock_graph_request):
+        """失敗ケース: Graph以外を指すnextLinkは辿らず502"""
+        mock_graph_request.return_value = {"value": [], "@odata.nextLink": "https://example.com/steal"}
+
+        with pytest.raises(APIException) as exc_info:
+            list(iterate_graph_collection("/me/chats", "token", "req-1"))
+
+        assert exc_info.value.status_code == 502
+
+# =============================================================================
+# ODataクエリ組み立てテスト
+#
+# build_graph_query と各検索関数のサーバー側絞り込みをテストします。
+# =============================================================================
+
+class TestBuildGraphQuerySuccess:
+    """build_graph_query関数の成功ケーステスト"""
+
+    def test_成功ケース_全パラメータ(self):
+        """成功ケース: $filter/$select/$expand/$topを順に付与し値をURLエンコードする"""
+        endpoint = build_graph_query(
+            "/me/chats", filter="chatType eq 'oneOnOne'", select=["id", "chatType"],
+            expand=["members"], top=50
+        )
+
+        assert endpoint == "/me/chats?$filter=chatType%20eq%20'oneOnOne'&$select=id,chatType&$expand=members&$top=50"
+
+    def test_成功ケース_既存クエリへの連結(self):
+        """成功ケース: 既にクエリ文字列がある場合は&で連結し、指定なしならそのまま返す"""
+        assert build_graph_query("/me/chats?$filter=x", top=10) == "/me/chats?$filter=x&$top=10"
+        assert build_graph_query("/me/joinedTeams") == "/me/joinedTeams"
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_チャンネル名でサーバー側絞り込み(self, mock_graph_request):
+        """成功ケース: チャンネル名のシングルクォートをエスケープして$filterに指定する"""
+        mock_graph_request.return_value = {"value": [{"id": "channel-1", "displayName": "O'Brien"}]}
+
+        assert find_channel_id_by_name("token", "team-1", "O'Brien", "req-1") == "channel-1"
+        assert mock_graph_request.call_args[0][1] == \
+            "/teams/team-1/channels?$filter=displayName%20eq%20'O''Brien'&$select=id,displayName"
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_展開メンバーのuserIdで照合(self, mock_graph_request):
+        """成功ケース: $expand=membersのuserIdで既存の1:1チャットを1回の呼び出しで見つける"""
+        mock_graph_request.return_value = {"value": [{
+            "id": "chat-1", "chatType": "oneOnOne",
+            "members": [{"userId": "me"}, {"userId": "target"}]
+        }]}
+
+        assert find_existing_chat("token", "target", "req-1") == "chat-1"
+        assert mock_graph_request.call_count == 1
+        assert mock_graph_request.call_args[0][1] == \
+            "/me/chats?$filter=chatType%20eq%20'oneOnOne'&$expand=members&$top=50"
+
+# =============================================================================
+# 宛先ユーザー→チャットIDインデックステスト
+#
+# handle_dm_mode のチャットIDキャッシュと無効化をテストします。
+# =============================================================================
+
+def make_dm_request():
+    return DMRequestModel(mode=1, email_addresses=["tanaka@example.com"], message_text="テスト")
+
+class TestChatIdIndexSuccess:
+    """チャットIDインデックスの成功ケーステスト"""
+
+    @patch('teamsapi.post_message_to_chat')
+    @patch('teamsapi.find_or_create_chat', return_value="chat-1")
+    @patch('teamsapi.find_user_by_email', return_value={"id": "user-1", "displayName": "田中太郎"})
+    def test_成功ケース_2回目はチャット検索なし(self, mock_find_user, mock_find_chat, mock_post):
+        """成功ケース: 同じ宛先への2回目以降のDMはチャット検索を行わない"""
+        handle_dm_mode(make_dm_request(), "token", "req-1")
+        handle_dm_mode(make_dm_request(), "token", "req-2")
+
+        assert mock_find_chat.call_count == 1
+        assert [c[0][1] for c in mock_post.call_args_list] == ["chat-1", "chat-1"]
+
+    @patch('teamsapi.post_message_to_chat')
+    @patch('teamsapi.find_or_create_chat', side_effect=["chat-old", "chat-new"])
+    @patch('teamsapi.find_user_by_email', return_value={"id": "user-1", "displayName": "田中太郎"})
+    def test_成功ケース_送信404で無効化し再検索(self, mock_find_user, mock_find_chat, mock_post):
+        """成功ケース: キャッシュ済みチャットIDで404になった場合は再検索して再送する"""
+        handle_dm_mode(make_dm_request(), "token", "req-1")
+        mock_post.side_effect = [APIException(404, "Resource not found"), None]
+
+        result = handle_dm_mode(make_dm_request(), "token", "req-2")
+
+        assert result["statusCode"] == 200
+        assert mock_post.call_args[0][1] == "chat-new"
+        assert resolve_chat_id("token", "user-1", "req-3") == ("chat-new", True)
+
+    @patch('teamsapi.find_or_create_chat', return_value="chat-1")
+    def test_成功ケース_永続ストアから復元(self, mock_find_chat):
+        """成功ケース: メモリが空でも永続ストアのチャットIDを使用する"""
+        from ttl_cache import InMemoryStore
+        import teamsapi
+        with patch.object(teamsapi.chat_id_cache, 'store', InMemoryStore()):
+            resolve_chat_id("token", "user-1", "req-1")
+            teamsapi.chat_id_cache.clear()
+
+            assert resolve_chat_id("token", "user-1", "req-2") == ("chat-1", True)
+        assert mock_find_chat.call_count == 1
+
+class TestChatIdIndexFailure:
+    """チャットIDインデックスの失敗ケーステスト"""
+
+    @patch('teamsapi.post_message_to_chat', side_effect=APIException(404, "Resource not found"))
+    @patch('teamsapi.find_or_create_chat', return_value="chat-1")
+    @patch('teamsapi.find_user_by_email', return_value={"id": "user-1", "displayName": "田中太郎"})
+    def test_失敗ケース_新規解決時の404は再送しない(self, mock_find_user, mock_find_chat, mock_post):
+        """失敗ケース: その場で検索したチャットIDでの404はそのまま返す"""
+        with pytest.raises(APIException) as exc_info:
+            handle_dm_mode(make_dm_request(), "token", "req-1")
+
+        assert exc_info.value.status_code == 404
+        assert mock_post.call_count == 1
+
+# =============================================================================
+# 1対1チャット直接解決テスト
+#
+# find_or_create_chat の作成API直接解決と、呼び出し元ユーザーIDキャッシュをテストします。
+# =============================================================================
+
+class TestDirectChatResolutionSuccess:
+    """1対1チャット直接解決の成功ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_作成APIで直接解決(self, mock_graph_request):
+        """成功ケース: 一覧検索をせず /me と POST /chats の2回で解決する"""
+        mock_graph_request.side_effect = [{"id": "me"}, {"id": "chat-1"}]
+
+        assert find_or_create_chat("token", "target", "req-1") == "chat-1"
+        assert [c[0][:2] for c in mock_graph_request.call_args_list] == [("GET", "/me?$select=id"), ("POST", "/chats")]
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_呼び出し元IDは同一トークンで再利用(self, mock_graph_request):
+        """成功ケース: 同じアクセストークンでは /me を1回だけ呼び、トークンが変われば再取得する"""
+        mock_graph_request.side_effect = [{"id": "me"}, {"id": "chat-1"}, {"id": "chat-2"}, {"id": "me"}]
+
+        find_or_create_chat("token", "target-1", "req-1")
+        find_or_create_chat("token", "target-2", "req-2")
+        get_caller_user_id("new-token", "req-3")
+
+        endpoints = [c[0][1] for c in mock_graph_request.call_args_list]
+        assert endpoints == ["/me?$select=id", "/chats", "/chats", "/me?$select=id"]
+
+    @patch('teamsapi.find_existing_chat', return_value="chat-existing")
+    @patch('teamsapi.create_new_chat', side_effect=APIException(403, "Forbidden"))
+    def test_成功ケース_作成失敗時は一覧検索へフォールバック(self, mock_create, mock_find_existing):
+        """成功ケース: 直接解決が失敗した場合のみ一覧を検索する"""
+        assert find_or_create_chat("token", "target", "req-1") == "chat-existing"
+        mock_find_existing.assert_called_once_with("token", "target", "req-1")
+
+class TestDirectChatResolutionFailure:
+    """1対1チャット直接解決の失敗ケーステスト"""
+
+    @patch('teamsapi.find_existing_chat', return_value=None)
+    @patch('teamsapi.create_new_chat', side_effect=APIException(403, "Forbidden"))
+    def test_失敗ケース_フォールバックでも未発見(self, mock_create, mock_find_existing):
+        """失敗ケース: 一覧にも無い場合は直接解決時のエラーを返す"""
+        with pytest.raises(APIException) as exc_info:
+            find_or_create_chat("token", "target", "req-1")
+
+        assert exc_info.value.status_code == 403
+
+    @patch('teamsapi.find_existing_chat')
+    @patch('teamsapi.create_new_chat', side_effect=APIException(401, "Unauthorized access"))
+    def test_失敗ケース_認証エラーはフォールバックしない(self, mock_create, mock_find_existing):
+        """失敗ケース: 401は一覧検索しても解決しないためそのまま返す"""
+        with pytest.raises(APIException) as exc_info:
+            find_or_create_chat("token", "target", "req-1")
+
+        assert exc_info.value.status_code == 401
+        mock_find_existing.assert_not_called()
+
+# =============================================================================
+# Graph JSONバッチテスト
+#
+# execute_graph_batch と複数宛先DMの段階的バッチ送信をテストします。
+# =============================================================================
+
+def batch_reply(*responses):
+    """$batchレスポンス作成（引数順にidを振る）"""
+    return {"responses": [dict(response, id=str(i)) for i, response in enumerate(responses)]}
+
+class TestGraphBatchSuccess:
+    """Graph JSONバッチの成功ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_20件ごとに分割し順序を維持(self, mock_graph_request):
+        """成功ケース: 21件は2回に分けて送信し、id順でなくても入力順に結果を返す"""
+        def reply(method, endpoint, token, body, request_id=None, **kwargs):
+            # 分割バッチは並列送信されるため、サブリクエストのURLから応答を作る
+            return {"responses": [
+                {"id": r["id"], "status": 200, "body": {"n": int(r["url"][len("/users/u"):])}}
+                for r in reversed(body["requests"])
+            ]}
+        mock_graph_request.side_effect = reply
+        sub_requests = [{"method": "GET", "url": f"/users/u{i}"} for i in range(21)]
+
+        results = execute_graph_batch(sub_requests, "token", "req-1")
+
+        assert mock_graph_request.call_count == 2
+        assert [r["body"]["n"] for r in results] == list(range(21))
+        assert sorted(len(c[0][3]["requests"]) for c in mock_graph_request.call_args_list) == [1, 20]
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_本文付きサブリクエスト(self, mock_graph_request):
+        """成功ケース: 本文付きサブリクエストにはContent-Typeを付与し、欠落した応答は502扱い"""
+        mock_graph_request.return_value = {"responses": []}
+
+        results = execute_graph_batch([{"method": "POST", "url": "/chats", "body": {"a": 1}}], "token", "req-1")
+
+        sent = mock_graph_request.call_args[0][3]["requests"][0]
+        assert sent["headers"] == {"Content-Type": "application/json"}
+        assert sent["body"] == {"a": 1}
+        assert results[0]["status"] == 502
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_複数宛先DMは3回の呼び出し(self, mock_graph_request, mock_caller):
+        """成功ケース: ユーザー解決・チャット解決・送信をそれぞれ1回の$batchで行う"""
+        mock_graph_request.side_effect = [
+            batch_reply({"status": 200, "body": {"id": "u1"}}, {"status": 200, "body": {"id": "u2"}},
+                        {"status": 200, "body": {"id": "u3", "displayName": "佐藤花子"}}),
+            batch_reply({"status": 201, "body": {"id": "c1"}}, {"status": 201, "body": {"id": "c2"}}),
+            batch_reply({"status": 201, "body": {}}, {"status": 201, "body": {}})
+        ]
+        request_data = DMRequestModel(
+            mode=1, email_addresses=["a@example.com", "b@example.com"], message_text="テスト",
+            mentions=[MentionModel(email_address="sato@example.com")]
+        )
+
+        result = handle_dm_mode(request_data, "token", "req-1")
+
+        assert result["statusCode"] == 200
+        assert mock_graph_request.call_count == 3
+        posts = mock_graph_request.call_args[0][3]["requests"]
+        assert [p["url"] for p in posts] == ["/chats/c1/messages", "/chats/c2/messages"]
+        assert posts[0]["body"]["mentions"][0]["mentioned"]["user"]["id"] == "u3"
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_キャッシュ済みチャットは作成しない(self, mock_graph_request, mock_caller):
+        """成功ケース: チャットIDキャッシュにある宛先はチャット解決のバッチに含めない"""
+        import teamsapi
+        teamsapi.chat_id_cache.set("u1", "c1")
+        mock_graph_request.side_effect = [
+            batch_reply({"status": 200, "body": {"id": "u1"}}, {"status": 200, "body": {"id": "u2"}}),
+            batch_reply({"status": 201, "body": {"id": "c2"}}),
+            batch_reply({"status": 201, "body": {}}, {"status": 201, "body": {}})
+        ]
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com", "b@example.com"], message_text="テスト")
+
+        handle_dm_mode(request_data, "token", "req-1")
+
+        chat_requests = mock_graph_request.call_args_list[1][0][3]["requests"]
+        assert len(chat_requests) == 1
+        assert "u2" in chat_requests[0]["body"]["members"][1]["user@odata.bind"]
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_大文字小文字違いの宛先は1回だけ送信(self, mock_graph_request, mock_caller):
+        """成功ケース: 同じユーザーになるアドレスは最初の表記で1宛先にまとめる"""
+        mock_graph_request.side_effect = [
+            batch_reply({"status": 200, "body": {"id": "u1"}}, {"status": 200, "body": {"id": "u2"}}),
+            batch_reply({"status": 201, "body": {"id": "c1"}}, {"status": 201, "body": {"id": "c2"}}),
+            batch_reply({"status": 201, "body": {}}, {"status": 201, "body": {}})
+        ]
+        request_data = DMRequestModel(mode=1, email_addresses=["A@example.com", "b@example.com", "a@example.com"],
+                                      message_text="テスト")
+
+        handle_dm_mode(request_data, "token", "req-1")
+
+        lookups = mock_graph_request.call_args_list[0][0][3]["requests"]
+        assert len(lookups) == 2
+        assert lookups[0]["url"].startswith("/users/A@example.com")
+        posts = mock_graph_request.call_args_list[2][0][3]["requests"]
+        assert [p["url"] for p in posts] == ["/chats/c1/messages", "/chats/c2/messages"]
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_再実行は未送信の宛先のみ(self, mock_graph_request, mock_caller):
+        """成功ケース: 同じ delivery_key での再実行では前回送信済みの宛先に送らない"""
+        import teamsapi
+        teamsapi.chat_id_cache.set("u1", "c1")
+        teamsapi.chat_id_cache.set("u2", "c2")
+        mock_graph_request.side_effect = [
+            batch_reply({"status": 200, "body": {"id": "u1"}}, {"status": 200, "body": {"id": "u2"}}),
+            batch_reply({"status": 201, "body": {}}, {"status": 503, "body": {"error": {"message": "unavailable"}}}),
+            batch_reply({"status": 201, "body": {}})
+        ]
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com", "B@example.com"], message_text="テスト")
+
+        with pytest.raises(APIException):
+            handle_dm_mode(request_data, "token", "req-1", delivery_key="msg-1")
+        handle_dm_mode(request_data, "token", "req-1", delivery_key="msg-1")
+
+        assert mock_graph_request.call_count == 3
+        resend = mock_graph_request.call_args_list[2][0][3]["requests"]
+        assert [r["url"] for r in resend] == ["/chats/c2/messages"]
+        assert teamsapi.delivery_log_cache.get("msg-1") == ["a@example.com", "b@example.com"]
+        assert len(teamsapi.idempotency_cache) == 0
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_送信済み宛先は別コンテナでも1レコードで共有(self, mock_graph_request, mock_caller):
+        """成功ケース: 送信済み宛先はメッセージごとに1レコードとして送信後に1回だけ永続ストアへ保存する"""
+        import teamsapi
+        from ttl_cache import InMemoryStore, TTLCache
+        store = Mock(wraps=InMemoryStore())
+        delivery_log = TTLCache("dm_delivery", 3600, max_entries=1, store=store)
+        teamsapi.chat_id_cache.set("u1", "c1")
+        teamsapi.chat_id_cache.set("u2", "c2")
+        teamsapi.chat_id_cache.set("u3", "c3")
+        mock_graph_request.side_effect = [
+            batch_reply(*[{"status": 200, "body": {"id": f"u{i}"}} for i in range(1, 4)]),
+            batch_reply({"status": 201, "body": {}}, {"status": 201, "body": {}}, {"status": 503, "body": {}}),
+            {"id": "u3", "displayName": "C"},
+            batch_reply({"status": 201, "body": {}})
+        ]
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com", "b@example.com", "c@example.com"],
+                                      message_text="テスト")
+
+        with patch('teamsapi.delivery_log_cache', delivery_log):
+            with pytest.raises(APIException):
+                handle_dm_mode(request_data, "token", "req-1", delivery_key="msg-1")
+            # 再配信は別コンテナ（メモリ上の記録なし）に届く
+            delivery_log.clear()
+            teamsapi.user_directory_cache.clear()
+            handle_dm_mode(request_data, "token", "req-1", delivery_key="msg-1")
+
+        resend = mock_graph_request.call_args_list[-1][0][3]["requests"]
+        assert [r["url"] for r in resend] == ["/chats/c3/messages"]
+        assert store.get.call_count == 2
+        assert store.put.call_count == 2
+        assert store.put.call_args[0][1]["value"] == ["a@example.com", "b@example.com", "c@example.com"]
+
+class TestGraphBatchFailure:
+    """Graph JSONバッチの失敗ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_失敗ケース_サブレスポンスのエラー変換(self, mock_graph_request):
+        """失敗ケース: 404はユーザー未発見、401は認証エラーとして宛先ごとに返す"""
+        mock_graph_request.return_value = batch_reply(
+            {"status": 404, "body": {"error": {"message": "not found"}}},
+            {"status": 401, "body": {"error": {"message": "expired"}}}
+        )
+
+        users = find_users_by_email("token", ["a@example.com", "b@example.com", "a@example.com"], "req-1")
+
+        assert users["a@example.com"].status_code == 404
+        assert users["b@example.com"].status_code == 401
+        assert len(mock_graph_request.call_args[0][3]["requests"]) == 2
+
+    @patch('teamsapi.get_caller_user_id', return_value="me")
+    @patch('teamsapi.make_graph_request')
+    def test_失敗ケース_認証エラーを優先して返す(self, mock_graph_request, mock_caller):
+        """失敗ケース: 複数の失敗があればトークン破棄のため401を優先する"""
+        mock_graph_request.side_effect = [
+            batch_reply({"status": 404, "body": {}}, {"status": 200, "body": {"id": "u2"}}),
+            batch_reply({"status": 401, "body": {"error": {"message": "expired"}}}),
+            batch_reply()
+        ]
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com", "b@example.com"], message_text="テスト")
+
+        with pytest.raises(APIException) as exc_info:
+            handle_dm_mode(request_data, "token", "req-1")
+
+        assert exc_info.value.status_code == 401
+
+# =============================================================================
+# 並列実行テスト
+#
+# run_concurrently の並列数上限と結果順序をテストします。
+# =============================================================================
+
+class TestRunConcurrentlySuccess:
+    """run_concurrently関数の成功ケーステスト"""
+
+    def test_成功ケース_並列実行と入力順の結果(self):
+        """成功ケース: 上限数まで同時に実行し、完了順に関わらず入力順で返す"""
+        import threading
+        import time as time_module
+        active = {"now": 0, "max": 0}
+        lock = threading.Lock()
+
+        def work(n):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            time_module.sleep(0.01 * (5 - n % 5))
+            with lock:
+                active["now"] -= 1
+            return n * 10
+
+        with patch('teamsapi.DM_MAX_CONCURRENCY', 3):
+            results = run_concurrently(work, list(range(10)))
+
+        assert results == [n * 10 for n in range(10)]
+        assert active["max"] == 3
+
+    def test_成功ケース_並列数1は逐次実行(self):
+        """成功ケース: 並列数1ではスレッドを使わず呼び出し元スレッドで順に実行する"""
+        import threading
+        threads = []
+
+        with patch('teamsapi.DM_MAX_CONCURRENCY', 1):
+            run_concurrently(lambda n: threads.append(threading.current_thread()), [1, 2, 3])
+
+        assert threads == [threading.main_thread()] * 3
+
+    def test_成功ケース_接続プールは並列数に合わせる(self):
+        """成功ケース: PoolManagerのホスト別接続数は DM_MAX_CONCURRENCY と一致する"""
+        import teamsapi
+        assert teamsapi.http.connection_pool_kw["maxsize"] == teamsapi.DM_MAX_CONCURRENCY
+
+    @patch('teamsapi.http')
+    def test_成功ケース_入れ子の並列でも同時送信数は上限内(self, mock_http):
+        """成功ケース: 並列処理が入れ子になってもGraphへの同時リクエスト数は接続プールのサイズを超えない"""
+        import threading
+        import time as time_module
+        active = {"now": 0, "max": 0}
+        lock = threading.Lock()
+
+        def request(method, url, **kwargs):
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+            time_module.sleep(0.01)
+            with lock:
+                active["now"] -= 1
+            return graph_response(200, '{"id": "me"}')
+        mock_http.request.side_effect = request
+
+        def outer(i):
+            return run_concurrently(lambda j: make_graph_request("GET", "/me", "token", request_id="req-1"), list(range(4)))
+
+        with patch('teamsapi.DM_MAX_CONCURRENCY', 4), \
+             patch('teamsapi._graph_request_slots', threading.BoundedSemaphore(3)):
+            results = run_concurrently(outer, list(range(4)))
+
+        assert len([result for inner in results for result in inner]) == 16
+        assert active["max"] == 3
+
+class TestRunConcurrentlyFailure:
+    """run_concurrently関数の失敗ケーステスト"""
+
+    def test_失敗ケース_例外は呼び出し元へ送出(self):
+        """失敗ケース: func内の例外はそのまま呼び出し元へ伝播する"""
+        def work(n):
+            if n == 2:
+                raise APIException(502, "External API error")
+            return n
+
+        with pytest.raises(APIException) as exc_info:
+            run_concurrently(work, [1, 2, 3])
+
+        assert exc_info.value.status_code == 502
+
+# =============================================================================
+# Graph API再試行テスト
+#
+# make_graph_request のスロットリング時再試行（Retry-After・予算・期限）をテストします。
+# =============================================================================
+
+def graph_response(status, body="{}", retry_after=None):
+    """urllib3レスポンス相当のモック作成"""
+    response = Mock()
+    response.status = status
+    response.data = body.encode()
+    response.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return response
+
+@pytest.fixture
+def retry_window():
+    """再試行予算を開始し、EMF出力をローカルシンクに差し替える"""
+    from emf_metrics import LocalMetricsSink, set_metrics_sink
+    sink = LocalMetricsSink()
+    previous = set_metrics_sink(sink)
+    start_retry_window()
+    yield sink
+    set_metrics_sink(previous)
+
+class TestGraphRetrySuccess:
+    """Graph API再試行の成功ケーステスト"""
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_成功ケース_Retry_Afterに従って再試行(self, mock_http, mock_sleep, retry_window):
+        """成功ケース: 429のRetry-After秒数だけ待機してGETを再試行する"""
+        mock_http.request.side_effect = [graph_response(429, retry_after="3"), graph_response(200, '{"id": "1"}')]
+
+        assert make_graph_request("GET", "/me", "token", request_id="req-1") == {"id": "1"}
+        mock_sleep.assert_called_once_with(3.0)
+
+        end_retry_window("req-1")
+        assert retry_window.values("GraphRetries") == [1]
+        assert retry_window.values("GraphThrottled") == [1]
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_成功ケース_安全と明示したPOSTは再試行(self, mock_http, mock_sleep, retry_window):
+        """成功ケース: retry_safe=TrueのPOSTは503でも再試行する"""
+        mock_http.request.side_effect = [graph_response(503), graph_response(201, '{"id": "chat-1"}')]
+
+        result = make_graph_request("POST", "/chats", "token", {"a": 1}, request_id="req-1", retry_safe=True)
+
+        assert result == {"id": "chat-1"}
+        assert mock_http.request.call_count == 2
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_バッチは抑制されたサブリクエストのみ再送(self, mock_graph_request, mock_sleep, retry_window):
+        """成功ケース: $batch内で429になったGETだけを再送し、結果を元の位置に戻す"""
+        mock_graph_request.side_effect = [
+            {"responses": [
+                {"id": "0", "status": 200, "body": {"n": 0}},
+                {"id": "1", "status": 429, "headers": {"Retry-After": "2"}, "body": {}}
+            ]},
+            {"responses": [{"id": "0", "status": 200, "body": {"n": 1}}]}
+        ]
+
+        results = execute_graph_batch([{"method": "GET", "url": "/users/a"}, {"method": "GET", "url": "/users/b"}], "token", "req-1")
+
+        assert [r["body"]["n"] for r in results] == [0, 1]
+        assert mock_graph_request.call_args[0][3]["requests"] == [{"id": "0", "method": "GET", "url": "/users/b"}]
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_成功ケース_メッセージ送信POSTは429で再試行(self, mock_http, mock_sleep, retry_window):
+        """成功ケース: 429は未実行のためメッセージ送信POSTもRetry-After秒数だけ待って再試行する"""
+        mock_http.request.side_effect = [graph_response(429, retry_after="2"), graph_response(201, '{"id": "m1"}')]
+
+        assert make_graph_request("POST", "/chats/c1/messages", "token", {"a": 1}, request_id="req-1") == {"id": "m1"}
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_バッチ内の429のPOSTは再送(self, mock_graph_request, mock_sleep, retry_window):
+        """成功ケース: $batch内で429になったメッセージ送信は再送し、503は再送しない"""
+        mock_graph_request.side_effect = [
+            {"responses": [
+                {"id": "0", "status": 429, "headers": {"Retry-After": "1"}, "body": {}},
+                {"id": "1", "status": 503, "body": {}}
+            ]},
+            {"responses": [{"id": "0", "status": 201, "body": {"id": "m1"}}]}
+        ]
+
+        results = execute_graph_batch([{"method": "POST", "url": "/chats/c1/messages", "body": {}},
+                                       {"method": "POST", "url": "/chats/c2/messages", "body": {}}], "token", "req-1")
+
+        assert [r["status"] for r in results] == [201, 503]
+        assert [r["url"] for r in mock_graph_request.call_args[0][3]["requests"]] == ["/chats/c1/messages"]
+
+    def test_成功ケース_待機秒数の算出(self):
+        """成功ケース: Retry-Afterは秒数・HTTP日付の両方に対応し、無ければ上限付きジッター"""
+        assert parse_retry_after("5") == 5.0
+        assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+        assert parse_retry_after(None) is None
+        assert parse_retry_after("soon") is None
+        for previous in [0.5, 2.0, 100.0]:
+            delay = next_retry_delay(previous)
+            assert 0.5 <= delay <= 8.0
+
+class TestGraphRetryFailure:
+    """Graph API再試行の失敗ケーステスト"""
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_失敗ケース_メッセージ送信POSTは503で再試行しない(self, mock_http, mock_sleep, retry_window):
+        """失敗ケース: 重複送信になり得るPOSTは503では再試行しない"""
+        mock_http.request.return_value = graph_response(503, retry_after="1")
+
+        with pytest.raises(APIException) as exc_info:
+            make_graph_request("POST", "/chats/c1/messages", "token", {"a": 1}, request_id="req-1")
+
+        assert exc_info.value.status_code == 502
+        assert mock_http.request.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @patch('teamsapi.GRAPH_RETRY_BUDGET', 2)
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_失敗ケース_呼び出し全体の再試行予算(self, mock_http, mock_sleep):
+        """失敗ケース: 再試行予算を使い切ったら以降の呼び出しは再試行しない"""
+        from emf_metrics import LocalMetricsSink, set_metrics_sink
+        sink = LocalMetricsSink()
+        previous = set_metrics_sink(sink)
+        try:
+            start_retry_window()
+            mock_http.request.return_value = graph_response(429, retry_after="0")
+
+            for _ in range(2):
+                with pytest.raises(APIException):
+                    make_graph_request("GET", "/me", "token", request_id="req-1")
+            end_retry_window("req-1")
+        finally:
+            set_metrics_sink(previous)
+
+        assert mock_sleep.call_count == 2
+        assert mock_http.request.call_count == 4
+        assert sink.values("GraphRetries") == [2]
+        assert sink.values("GraphRetryGiveUps") == [2]
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_失敗ケース_期限を超える待機は行わない(self, mock_http, mock_sleep, retry_window):
+        """失敗ケース: Retry-Afterが呼び出し期限を超える場合は待たずに失敗する"""
+        mock_http.request.return_value = graph_response(503, retry_after="120")
+
+        with pytest.raises(APIException):
+            make_graph_request("GET", "/me", "token", request_id="req-1")
+
+        mock_sleep.assert_not_called()
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_失敗ケース_呼び出し外では再試行しない(self, mock_http, mock_sleep):
+        """失敗ケース: lambda_handler外（予算未開始）の呼び出しは従来どおり即時失敗する"""
+        mock_http.request.return_value = graph_response(429, retry_after="1")
+
+        with pytest.raises(APIException):
+            make_graph_request("GET", "/me", "token", request_id="req-1")
+
+        assert mock_http.request.call_count == 1
+
+# =============================================================================
+# ユーザーディレクトリキャッシュテスト
+#
+# find_user_by_email / find_users_by_email のキャッシュ・ネガティブキャッシュ・重複排除をテストします。
+# =============================================================================
+
+class TestUserDirectoryCacheSuccess:
+    """ユーザーディレクトリキャッシュの成功ケーステスト"""
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_2回目はGraphを呼ばない(self, mock_graph_request):
+        """成功ケース: 解決済みアドレスは大文字小文字違いでもキャッシュから返す"""
+        mock_graph_request.return_value = {"id": "user-1", "displayName": "田中太郎", "mail": "tanaka@example.com"}
+
+        find_user_by_email("token", "tanaka@example.com", "req-1")
+        cached = find_user_by_email("token", "Tanaka@Example.com", "req-2")
+
+        assert cached == {"id": "user-1", "displayName": "田中太郎"}
+        assert mock_graph_request.call_count == 1
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_重複アドレスは1回だけ解決(self, mock_graph_request):
+        """成功ケース: 1リクエスト内の重複アドレスはまとめて1件として問い合わせる"""
+        mock_graph_request.return_value = {"id": "user-1", "displayName": "田中太郎"}
+
+        users = find_users_by_email("token", ["tanaka@example.com", "TANAKA@example.com", "tanaka@example.com"], "req-1")
+
+        assert mock_graph_request.call_count == 1
+        assert users["TANAKA@example.com"]["id"] == "user-1"
+
+    @patch('teamsapi.make_graph_request')
+    def test_成功ケース_キャッシュに無い分だけバッチ取得(self, mock_graph_request):
+        """成功ケース: キャッシュ済みアドレスはバッチに含めない"""
+        import teamsapi
+        teamsapi.cache_user("a@example.com", {"id": "user-a", "displayName": "A"})
+        mock_graph_request.return_value = {"responses": [
+            {"id": "0", "status": 200, "body": {"id": "user-b", "displayName": "B"}},
+            {"id": "1", "status": 200, "body": {"id": "user-c", "displayName": "C"}}
+        ]}
+
+        users = find_users_by_email("token", ["a@example.com", "b@example.com", "c@example.com"], "req-1")
+
+        assert [users[e]["id"] for e in ["a@example.com", "b@example.com", "c@example.com"]] == ["user-a", "user-b", "user-c"]
+        assert [r["url"] for r in mock_graph_request.call_args[0][3]["requests"]] == [
+            "/users/b@example.com?$select=id,displayName,mail", "/users/c@example.com?$select=id,displayName,mail"
+        ]
+        assert find_users_by_email("token", ["b@example.com", "c@example.com"], "req-2")["c@example.com"]["id"] == "user-c"
+        assert mock_graph_request.call_count == 1
+
+class TestUserDirectoryCacheFailure:
+    """ユーザーディレクトリキャッシュの失敗ケーステスト"""
+
+    @patch('teamsapi.make_graph_request', side_effect=APIException(404, "Resource not found"))
+    def test_失敗ケース_未発見アドレスはネガティブキャッシュ(self, mock_graph_request):
+        """失敗ケース: 404になったアドレスは短期間Graphへ再問い合わせしない"""
+        for _ in range(2):
+            with pytest.raises(APIException) as exc_info:
+                find_user_by_email("token", "nobody@example.com", "req-1")
+            assert exc_info.value.status_code == 404
+
+        assert mock_graph_request.call_count == 1
+
+    @patch('teamsapi.make_graph_request', side_effect=APIException(502, "External API error"))
+    def test_失敗ケース_一時的なエラーはキャッシュしない(self, mock_graph_request):
+        """失敗ケース: 404以外のエラーは次回も問い合わせる"""
+        for _ in range(2):
+            with pytest.raises(APIException):
+                find_user_by_email("token", "tanaka@example.com", "req-1")
+
+        assert mock_graph_request.call_count == 2
+
+# =============================================================================
+# 非同期送信（202受付）テスト
+#
+# lambda_handler のキュー投入と queue_worker_handler の送信をテストします。
+# =============================================================================
+
+@pytest.fixture
+def mock_context():
+    """Lambdaコンテキストのモック"""
+    context = Mock()
+    context.aws_request_id = "test-request-id-123"
+    return context
+
+@pytest.fixture
+def local_queue():
+    """プロセス内キューに差し替える"""
+    from message_queue import LocalQueue
+    queue = LocalQueue()
+    with patch('teamsapi.message_queue', queue):
+        yield queue
+
+class TestAsyncDeliverySuccess:
+    """非同期送信の成功ケーステスト"""
+
+    @patch('teamsapi.get_access_token')
+    def test_成功ケース_キュー投入のみで202(self, mock_get_token, local_queue, mock_context):
+        """成功ケース: トークン取得・Graph呼び出しをせずにメッセージIDを返す"""
+        event = {"body": json.dumps({
+            "mode": 2, "team_name": "開発チーム", "channel_name": "一般",
+            "message_text": "テスト", "async_delivery": True
+        })}
+
+        result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 202
+        message_id = json.loads(result["body"])["data"]["message_id"]
+        record = local_queue.receive_event()["Records"][0]
+        assert record["messageId"] == message_id
+        envelope = json.loads(record["body"])
+        assert envelope["request_id"] == "test-request-id-123"
+        assert "async_delivery" not in envelope["request"]
+        mock_get_token.assert_not_called()
+
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_ワーカーがモード別に送信(self, mock_get_token, mock_dm, mock_channel, local_queue, mock_context):
+        """成功ケース: ワーカーはトークンを1回だけ取得し、各メッセージを元のrequest_idで送信する"""
+        teamsapi_module = __import__('teamsapi')
+        teamsapi_module.enqueue_message_request(
+            DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="DM", async_delivery=True), "req-dm")
+        teamsapi_module.enqueue_message_request(
+            ChannelRequestModel(mode=2, team_name="T", channel_name="C", message_text="CH", async_delivery=True), "req-ch")
+
+        result = queue_worker_handler(local_queue.receive_event(), mock_context)
+
+        assert result == {"batchItemFailures": []}
+        mock_get_token.assert_called_once()
+        assert mock_dm.call_args[0][0].message_text == "DM"
+        assert mock_dm.call_args[0][2] == "req-dm"
+        assert mock_channel.call_args[0][2] == "req-ch"
+
+class TestAsyncDeliveryFailure:
+    """非同期送信の失敗ケーステスト"""
+
+    def test_失敗ケース_キュー未設定(self, mock_context):
+        """失敗ケース: キューが設定されていなければ500"""
+        event = {"body": json.dumps({"mode": 1, "email_addresses": ["a@example.com"], "message_text": "テスト", "async_delivery": True})}
+
+        with patch('teamsapi.message_queue', None):
+            result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 500
+        assert "not configured" in json.loads(result["body"])["message"]
+
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_失敗ケース_再試行可能な失敗のみ再配信(self, mock_get_token, mock_dm, mock_context):
+        """失敗ケース: 5xx/429は再配信対象、宛先不明(404)や不正メッセージは破棄する"""
+        def body(text):
+            return json.dumps({"request_id": text, "request": {"mode": 1, "email_addresses": ["a@example.com"], "message_text": text}})
+        def deliver(request_data, token, request_id, delivery_key=None):
+            if request_data.message_text == "throttled":
+                raise APIException(429, "throttled")
+            if request_data.message_text == "missing":
+                raise APIException(404, "User not found")
+        mock_dm.side_effect = deliver
+        event = {"Records": [
+            {"messageId": "m1", "body": body("throttled")},
+            {"messageId": "m2", "body": body("missing")},
+            {"messageId": "m3", "body": body("ok")},
+            {"messageId": "m4", "body": "not json"}
+        ]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+
+    @patch('teamsapi.get_access_token', side_effect=APIException(401, "Invalid refresh token"))
+    def test_失敗ケース_トークン取得失敗は全件再配信(self, mock_get_token, mock_context):
+        """失敗ケース: アクセストークンが取得できなければ全メッセージを再配信対象にする"""
+        event = {"Records": [{"messageId": "m1", "body": "{}"}, {"messageId": "m2", "body": "{}"}]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+
+def channel_record(message_id, text, enqueued_at, channel="エラー通知", content_type="text", mentions=None, subject="",
+                   idempotency_key=None):
+    request = {"mode": 2, "team_name": "開発チーム", "channel_name": channel, "message_text": text,
+               "content_type": content_type, "subject": subject, "mentions": mentions or []}
+    if idempotency_key:
+        request["idempotency_key"] = idempotency_key
+    return {"messageId": message_id,
+            "body": json.dumps({"request_id": f"req-{message_id}", "enqueued_at": enqueued_at, "request": request})}
+
+class TestChannelCoalesceSuccess:
+    """チャンネル通知まとめ送信の成功ケーステスト"""
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 10)
+    def test_成功ケース_時間幅内の同一チャンネルをまとめる(self):
+        """成功ケース: 同一チャンネルで時間幅内のものだけが同じグループになる"""
+        records = [
+            channel_record("m1", "A", 100),
+            channel_record("m2", "B", 105),
+            channel_record("m3", "C", 120),
+            channel_record("m4", "D", 101, channel="別チャンネル"),
+        ]
+
+        groups = coalesce_channel_records(records, "req")
+
+        assert [[r["messageId"] for r in g] for g in groups] == [["m1", "m2"], ["m3"], ["m4"]]
+
+    def test_成功ケース_本文とメンションを全て保持(self):
+        """成功ケース: 本文は区切り付きで連結、メンションはメール単位で重複排除、textはHTMLへ変換"""
+        requests = [
+            ChannelRequestModel(mode=2, team_name="T", channel_name="C", message_text="a<b\n2行目", subject="失敗1",
+                                mentions=[{"email_address": "yamada@example.com"}]),
+            ChannelRequestModel(mode=2, team_name="T", channel_name="C", message_text="<p>html</p>", content_type="html", subject="失敗2",
+                                mentions=[{"email_address": "YAMADA@example.com"}, {"email_address": "sato@example.com"}]),
+        ]
+
+        merged = merge_channel_requests(requests)
+
+        assert merged.content_type == "html"
+        assert merged.message_text == "<p><strong>失敗1</strong></p>a&lt;b<br>2行目<hr><p><strong>失敗2</strong></p><p>html</p>"
+        assert merged.subject == "失敗1 ほか1件"
+        assert [m.email_address.lower() for m in merged.mentions] == ["yamada@example.com", "sato@example.com"]
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_ワーカーは1回だけ投稿(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: まとめたメッセージは1回のGraph投稿になる"""
+        event = {"Records": [channel_record("m1", "A", 100), channel_record("m2", "B", 101)]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": []}
+        mock_channel.assert_called_once()
+        assert mock_channel.call_args[0][0].message_text == "A\n\n----------\n\nB"
+        assert mock_channel.call_args[0][2] == "req-m1"
+
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_既定では無効(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: 時間幅未設定では従来どおり1件ずつ投稿"""
+        event = {"Records": [channel_record("m1", "A", 100), channel_record("m2", "B", 100)]}
+
+        queue_worker_handler(event, mock_context)
+
+        assert mock_channel.call_count == 2
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_冪等キー付きもまとめてキーごとに記録(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: 冪等キー付きのメッセージもまとめて投稿し、再配信時は投稿しない"""
+        mock_channel.return_value = create_success_response("req-m1", message="Message posted")
+        event = {"Records": [channel_record("m1", "A", 100, idempotency_key="ses-1:acceptance"),
+                             channel_record("m2", "B", 101, idempotency_key="ses-2:acceptance")]}
+
+        first = queue_worker_handler(event, mock_context)
+        second = queue_worker_handler(event, mock_context)
+
+        assert first == second == {"batchItemFailures": []}
+        mock_channel.assert_called_once()
+        assert mock_channel.call_args[0][0].message_text == "A\n\n----------\n\nB"
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_記録済みのメッセージは除いてまとめる(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: 送信済みと記録されたメッセージを除いた残りだけを投稿する"""
+        mock_channel.return_value = create_success_response("req", message="Message posted")
+        queue_worker_handler({"Records": [channel_record("m1", "A", 100, idempotency_key="ses-1:acceptance")]}, mock_context)
+        event = {"Records": [channel_record("m1", "A", 100, idempotency_key="ses-1:acceptance"),
+                             channel_record("m2", "B", 101, idempotency_key="ses-2:acceptance"),
+                             channel_record("m3", "C", 102)]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": []}
+        assert mock_channel.call_count == 2
+        assert mock_channel.call_args[0][0].message_text == "B\n\n----------\n\nC"
+
+class TestChannelCoalesceFailure:
+    """チャンネル通知まとめ送信の失敗ケーステスト"""
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    def test_失敗ケース_上限超過は別グループ(self):
+        """失敗ケース: まとめると本文上限を超える場合は新しいグループにする"""
+        records = [channel_record("m1", "A" * 15000, 100), channel_record("m2", "B" * 15000, 101)]
+
+        groups = coalesce_channel_records(records, "req")
+
+        assert len(groups) == 2
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode', side_effect=APIException(429, "throttled"))
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_失敗ケース_まとめ投稿失敗は全件再配信(self, mock_get_token, mock_channel, mock_context):
+        """失敗ケース: まとめた投稿が再試行可能エラーならグループ内の全メッセージを再配信対象にする"""
+        event = {"Records": [channel_record("m1", "A", 100), channel_record("m2", "B", 101), {"messageId": "m3", "body": "not json"}]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+        mock_channel.assert_called_once()
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_失敗ケース_まとめ投稿の恒久エラーは1件ずつ送り直す(self, mock_get_token, mock_channel, mock_context):
+        """失敗ケース: 1件のメンション先不明でまとめ投稿が404になっても、他のメッセージは個別に投稿される"""
+        posted = []
+        def deliver(request_data, token, request_id):
+            if any(m.email_address == "missing@example.com" for m in request_data.mentions):
+                raise APIException(404, "User not found: missing@example.com")
+            posted.append(request_data.message_text)
+        mock_channel.side_effect = deliver
+        event = {"Records": [
+            channel_record("m1", "A", 100),
+            channel_record("m2", "B", 101, mentions=[{"email_address": "missing@example.com"}]),
+            channel_record("m3", "C", 102),
+        ]}
+
+        result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": []}
+        assert posted == ["A", "C"]
+        assert mock_channel.call_count == 4
+
+def make_batch_request(**kwargs):
+    return BatchRequestModel(mode=4, messages=[
+        {"mode": 1, "email_addresses": ["a@example.com"], "message_text": "DM",
+         "mentions": [{"email_address": "m@example.com"}]},
+        {"mode": 2, "team_name": "T", "channel_name": "C", "message_text": "CH"},
+    ], **kwargs)
+
+class TestBatchModeSuccess:
+    """一括送信モード（mode 4）の成功ケーステスト"""
+
+    def test_成功ケース_DMとチャンネルの混在を解析(self):
+        """成功ケース: mode で各メッセージのモデルが決まる"""
+        request_data = validate_and_parse_request(json.dumps(make_batch_request().model_dump(mode="json")))
+
+        assert [type(m).__name__ for m in request_data.messages] == ["DMRequestModel", "ChannelRequestModel"]
+
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.find_users_by_email')
+    def test_成功ケース_ユーザー先読みと結果一覧(self, mock_find_users, mock_dm, mock_channel):
+        """成功ケース: 宛先・メンションを1回で先読みし、メッセージごとの結果を返す"""
+        mock_dm.return_value = create_success_response("req", message="Messages sent to 1 users")
+        mock_channel.return_value = create_success_response("req", message="Channel message sent")
+
+        result = handle_batch_mode(make_batch_request(), "token", "req")
+
+        assert result["statusCode"] == 200
+        mock_find_users.assert_called_once_with("token", ["a@example.com", "m@example.com"], "req")
+        results = json.loads(result["body"])["data"]["results"]
+        assert [(r["index"], r["mode"], r["status"]) for r in results] == [(0, 1, 200), (1, 2, 200)]
+
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_トークン取得は1回(self, mock_get_token, mock_dm, mock_channel, mock_context):
+        """成功ケース: lambda_handler経由でもトークン取得は1回"""
+        mock_dm.return_value = create_success_response("req")
+        mock_channel.return_value = create_success_response("req")
+        event = {"body": json.dumps({"mode": 4, "messages": [
+            {"mode": 2, "team_name": "T", "channel_name": "C", "message_text": "1"},
+            {"mode": 2, "team_name": "T", "channel_name": "C", "message_text": "2"}]})}
+
+        result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 200
+        mock_get_token.assert_called_once()
+        assert mock_channel.call_count == 2
+
+    def test_成功ケース_非同期は個別にキュー投入(self, local_queue, mock_context):
+        """成功ケース: async_delivery指定時は各メッセージを個別にキュー投入する"""
+        event = {"body": json.dumps(make_batch_request(async_delivery=True).model_dump(mode="json"))}
+
+        result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 202
+        assert len(json.loads(result["body"])["data"]["message_ids"]) == 2
+        modes = [json.loads(r["body"])["request"]["mode"] for r in local_queue.receive_event()["Records"]]
+        assert modes == [1, 2]
+
+class TestBatchModeFailure:
+    """一括送信モード（mode 4）の失敗ケーステスト"""
+
+    def test_失敗ケース_一部のキュー投入失敗は207(self, mock_context):
+        """失敗ケース: 投入済みのメッセージIDと失敗したメッセージを個別に返す"""
+        from message_queue import LocalQueue
+        queue = LocalQueue()
+        sent = queue.send
+        calls = []
+        def send(body):
+            calls.append(body)
+            if len(calls) == 2:
+                raise Exception("ServiceUnavailable")
+            return sent(body)
+        queue.send = send
+        event = {"body": json.dumps(make_batch_request(async_delivery=True).model_dump(mode="json"))}
+
+        with patch('teamsapi.message_queue', queue):
+            result = lambda_handler(event, mock_context)
+
+        assert result["statusCode"] == 207
+        data = json.loads(result["body"])["data"]
+        assert data["message_ids"][0] is not None and data["message_ids"][1] is None
+        assert [r["status"] for r in data["results"]] == [202, 500]
+        assert len(queue) == 1
+
+    def test_失敗ケース_冪等キー付きは再送で再投入しない(self, local_queue, mock_context):
+        """失敗ケース: 受付済みの idempotency_key を含む一括送信の再送は同じメッセージIDを返す"""
+        body = make_batch_request(async_delivery=True).model_dump(mode="json")
+        for i, message in enumerate(body["messages"]):
+            message["idempotency_key"] = f"key-{i}"
+        event = {"body": json.dumps(body)}
+
+        first = lambda_handler(event, mock_context)
+        second = lambda_handler(event, mock_context)
+
+        assert json.loads(first["body"])["data"] == json.loads(second["body"])["data"]
+        assert len(local_queue) == 2
+
+    @patch('teamsapi.handle_channel_mode', side_effect=APIException(404, "Team not found: T"))
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.find_users_by_email', side_effect=APIException(502, "batch failed"))
+    def test_失敗ケース_一部失敗は207(self, mock_find_users, mock_dm, mock_channel):
+        """失敗ケース: 先読み失敗は無視し、失敗したメッセージのみ結果にステータスを載せる"""
+        mock_dm.return_value = create_success_response("req")
+
+        result = handle_batch_mode(make_batch_request(), "token", "req")
+
+        assert result["statusCode"] == 207
+        body = json.loads(result["body"])
+        assert body["message"] == "1/2 messages sent"
+        assert body["data"]["results"][1] == {"index": 1, "mode": 2, "status": 404, "message": "Team not found: T"}
+
+    def test_失敗ケース_メッセージ数上限(self):
+        """失敗ケース: BATCH_MAX_MESSAGES を超えるとバリデーションエラー"""
+        messages = [{"mode": 2, "team_name": "T", "channel_name": "C", "message_text": "x"}] * 21
+
+        with pytest.raises(APIException) as exc_info:
+            validate_and_parse_request(json.dumps({"mode": 4, "messages": messages}))
+
+        assert exc_info.value.status_code == 400
+
+    def test_失敗ケース_入れ子の一括送信は不可(self):
+        """失敗ケース: messages に mode 3/4 は含められない"""
+        with pytest.raises(APIException) as exc_info:
+            validate_and_parse_request(json.dumps({"mode": 4, "messages": [{"mode": 3}]}))
+
+        assert exc_info.value.status_code == 400
+
+class TestIdempotencySuccess:
+    """冪等キーによる重複送信防止の成功ケーステスト"""
+
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_再送は保存済み結果を返す(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: 同じキーの再送はGraphを呼ばずに最初の結果を返す"""
+        mock_channel.return_value = create_success_response("first-request", message="Channel message sent")
+        event = {"body": json.dumps({"mode": 2, "team_name": "T", "channel_name": "C",
+                                     "message_text": "承認依頼", "idempotency_key": "ses-1:approval"})}
+
+        first = lambda_handler(event, mock_context)
+        second = lambda_handler(event, mock_context)
+
+        assert second == first
+        mock_channel.assert_called_once()
+
+    def test_成功ケース_キーなしは毎回実行(self):
+        """成功ケース: idempotency_key 未指定なら従来どおり毎回送信"""
+        send = Mock(return_value=create_success_response("req"))
+
+        run_idempotent(make_channel_request(), "req", send)
+        run_idempotent(make_channel_request(), "req", send)
+
+        assert send.call_count == 2
+
+    def test_成功ケース_受付と送信は別扱い(self):
+        """成功ケース: キュー受付済みのキーでもワーカーの送信は実行される"""
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="DM", idempotency_key="k")
+        accept = Mock(return_value={"statusCode": 202, "body": "{}"})
+        send = Mock(return_value=create_success_response("req"))
+
+        run_idempotent(request_data, "req", accept, stage="accepted")
+        run_idempotent(request_data, "req", send)
+        run_idempotent(request_data, "req", send)
+
+        accept.assert_called_once()
+        send.assert_called_once()
+
+class TestIdempotencyFailure:
+    """冪等キーによる重複送信防止の失敗ケーステスト"""
+
+    def test_失敗ケース_失敗結果は保存しない(self):
+        """失敗ケース: 送信失敗したリクエストは再送時に再実行する"""
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="DM", idempotency_key="k")
+        send = Mock(side_effect=[APIException(502, "Graph error"), create_success_response("req")])
+
+        with pytest.raises(APIException):
+            run_idempotent(request_data, "req", send)
+        result = run_idempotent(request_data, "req", send)
+
+        assert result["statusCode"] == 200
+        assert send.call_count == 2
+
+    def test_失敗ケース_同じキーで内容が異なる(self):
+        """失敗ケース: キーの使い回しで本文が異なる場合は422"""
+        send = Mock(return_value=create_success_response("req"))
+        run_idempotent(DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="1", idempotency_key="k"), "req", send)
+
+        with pytest.raises(APIException) as exc_info:
+            run_idempotent(DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="2", idempotency_key="k"), "req", send)
+
+        assert exc_info.value.status_code == 422
+        send.assert_called_once()
+
+    def test_失敗ケース_永続ストア未設定は同一コンテナのみと警告(self, caplog):
+        """失敗ケース: ID_CACHE_BUCKET_NAME 未設定では別コンテナへの再送を検出できないことをログに出す"""
+        import logging
+        request_data = DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="DM", idempotency_key="k")
+
+        with patch('teamsapi.ID_CACHE_BUCKET_NAME', None), caplog.at_level(logging.WARNING, logger="teamsapi"):
+            run_idempotent(request_data, "req", Mock(return_value=create_success_response("req")))
+
+        assert "IDEMPOTENCY_LOCAL_ONLY" in caplog.text
+
+    def test_失敗ケース_冪等キーは件数上限で破棄しない(self):
+        """失敗ケース: 他のキーが大量に保存されても保持中のキーは押し出されない"""
+        import teamsapi
+        send = Mock(return_value=create_success_response("req"))
+        requests = [DMRequestModel(mode=1, email_addresses=["a@example.com"], message_text="DM", idempotency_key=f"k{i}")
+                    for i in range(teamsapi.ID_CACHE_MAX_ENTRIES + 10)]
+
+        for request_data in requests:
+            run_idempotent(request_data, "req", send)
+        run_idempotent(requests[0], "req", send)
+
+        assert send.call_count == len(requests)
+
+class TestConnectionMetrics:
+    """接続再利用メトリクスのテスト"""
+
+    def test_成功ケース_ホスト別の再利用率(self, retry_window):
+        """成功ケース: 呼び出し内でリクエストのあったホストのみ再利用率を出力する"""
+        before = {"graph.microsoft.com": {"requests": 10, "connections": 2},
+                  "login.microsoftonline.com": {"requests": 1, "connections": 1}}
+        after = {"graph.microsoft.com": {"requests": 14, "connections": 3},
+                 "login.microsoftonline.com": {"requests": 1, "connections": 1}}
+
+        with patch('teamsapi.connection_stats', return_value=after):
+            emit_connection_metrics(before, "req")
+
+        assert retry_window.values("ConnectionReuseRate", Host="graph.microsoft.com") == [75.0]
+        assert retry_window.values("NewConnections", Host="graph.microsoft.com") == [1]
+        assert retry_window.values("HttpRequests", Host="login.microsoftonline.com") == []
+
+    def test_成功ケース_Graphとログインのプールサイズ(self):
+        """成功ケース: Graphは並列送信数、トークン取得は少数のプールを使う"""
+        teamsapi_module = __import__('teamsapi')
+
+        graph_pool = teamsapi_module.http.connection_from_host("graph.microsoft.com", 443, "https")
+        login_pool = teamsapi_module.http.connection_from_host("login.microsoftonline.com", 443, "https")
+
+        assert graph_pool.pool.maxsize == teamsapi_module.GRAPH_POOL_MAXSIZE
+        assert login_pool.pool.maxsize == teamsapi_module.LOGIN_POOL_MAXSIZE
+
+# =============================================================================
+# 判別共用体によるリクエスト解析テスト
+# =============================================================================
+# validate_and_parse_request（REQUEST_ADAPTER）と parse_queued_records をテストします。
+
+class TestRequestAdapterSuccess:
+    """判別共用体によるリクエスト解析の成功ケーステスト"""
+
+    def test_成功ケース_bytesのまま解析(self):
+        """成功ケース: デコードせずにJSONのbytesを検証できる"""
+        request_data = validate_and_parse_request(b'{"mode": 2, "team_name": "T", "channel_name": "C", "message_text": "x"}')
+
+        assert isinstance(request_data, ChannelRequestModel)
+
+    @patch('teamsapi.CHANNEL_COALESCE_WINDOW_SECONDS', 30)
+    @patch('teamsapi.handle_channel_mode')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_ワーカーは各メッセージを1回だけ解析(self, mock_get_token, mock_channel, mock_context):
+        """成功ケース: グループ化と送信で解析結果を共有する"""
+        event = {"Records": [channel_record("m1", "A", 100), channel_record("m2", "B", 101), channel_record("m3", "C", 100, channel="別")]}
+
+        with patch('teamsapi.parse_queued_message', wraps=parse_queued_message) as mock_parse:
+            result = queue_worker_handler(event, mock_context)
+
+        assert result == {"batchItemFailures": []}
+        assert mock_parse.call_count == 3
+        assert mock_channel.call_count == 2
+
+class TestRequestAdapterFailure:
+    """判別共用体によるリクエスト解析の失敗ケーステスト"""
+
+    def test_失敗ケース_入れ子のmode不正は検証エラー(self):
+        """失敗ケース: Invalid mode はトップレベルの mode のみ。messages 内は Validation failed"""
+        with pytest.raises(APIException) as exc_info:
+            validate_and_parse_request(json.dumps({"mode": 4, "messages": [{"mode": 9}]}))
+
+        assert exc_info.value.message.startswith("Validation failed")
+
+    def test_失敗ケース_不正なメッセージは個別に保持(self):
+        """失敗ケース: 1件の不正で他のメッセージの解析は止まらない"""
+        records = [
+            channel_record("m1", "A", 100),
+            {"messageId": "m2", "body": "not json"},
+            {"messageId": "m3", "body": json.dumps({"request": {"mode": 7}})},
+            {"messageId": "m4"},
+        ]
+
+        parsed = parse_queued_records(records)
+
+        assert isinstance(parsed["m1"], QueuedMessageModel)
+        assert parsed["m1"].request_id == "req-m1"
+        assert "Invalid JSON format" in parsed["m2"].message
+        assert parsed["m3"].message.startswith("Invalid mode: 7")
+        assert all(parsed[m].status_code == 400 for m in ["m2", "m3", "m4"])
+
+# =============================================================================
+# 共有トークン事前更新テスト
+# =============================================================================
+# token_refresher_handler と BACKGROUND_TOKEN_REFRESH 有効時の get_access_token をmotoでテストします。
+
+def put_shared_token(client, access_token, expires_in):
+    import time as time_module
+    client.put_parameter(
+        Name='/test/access_token', Type='SecureString', Overwrite=True,
+        Value=json.dumps({"access_token": access_token, "expires_at": time_module.time() + expires_in})
+    )
+
+class TestTokenRefresherSuccess:
+    """共有トークン事前更新の成功ケーステスト"""
+
+    @patch('teamsapi.emit_metrics')
+    @patch('teamsapi.refresh_access_token', return_value=("access-v2", "refresh-v2"))
+    def test_成功ケース_期限間近のトークンを更新(self, mock_refresh, mock_emit, moto_ssm, mock_context):
+        """成功ケース: 残り時間が TOKEN_REFRESH_AHEAD_SECONDS 以下なら更新して公開する"""
+        put_shared_token(moto_ssm, "access-v1", 600)
+
+        result = token_refresher_handler({}, mock_context)
+
+        assert result["refreshed"] is True
+        assert result["remaining_seconds"] > 3000
+        shared = json.loads(moto_ssm.get_parameter(Name='/test/access_token', WithDecryption=True)['Parameter']['Value'])
+        assert shared["access_token"] == "access-v2"
+        assert mock_emit.call_args[0][2]["SharedTokenRefreshed"] == (1, "Count")
+
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_有効期間が十分なら更新しない(self, mock_refresh, moto_ssm, mock_context):
+        """成功ケース: 残り時間に余裕があればトークンエンドポイントを呼ばない"""
+        put_shared_token(moto_ssm, "access-v1", 3600)
+
+        result = token_refresher_handler({}, mock_context)
+
+        assert result["refreshed"] is False
+        mock_refresh.assert_not_called()
+
+    @patch('teamsapi.BACKGROUND_TOKEN_REFRESH', True)
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_送信処理は共有ストアのみ参照(self, mock_refresh, moto_ssm, moto_dynamodb):
+        """成功ケース: 事前更新済みのトークンを読み取り、リース取得・ローテーションを行わない"""
+        put_shared_token(moto_ssm, "access-v1", 900)
+
+        assert get_access_token("req-1") == "access-v1"
+        mock_refresh.assert_not_called()
+        assert get_lease(moto_dynamodb) is None
+
+    @patch('teamsapi.BACKGROUND_TOKEN_REFRESH', True)
+    @patch('teamsapi.emit_metrics')
+    @patch('teamsapi.refresh_access_token')
+    def test_成功ケース_期限間近でも失効前は共有トークンを使う(self, mock_refresh, mock_emit, moto_ssm, moto_dynamodb):
+        """成功ケース: 安全マージン内でも失効していなければローテーションしない"""
+        put_shared_token(moto_ssm, "access-v1", 120)
+
+        assert get_access_token("req-1") == "access-v1"
+        mock_refresh.assert_not_called()
+        mock_emit.assert_not_called()
+
+class TestTokenRefresherFailure:
+    """共有トークン事前更新の失敗ケーステスト"""
+
+    @patch('teamsapi.BACKGROUND_TOKEN_REFRESH', True)
+    @patch('teamsapi.emit_metrics')
+    @patch('teamsapi.refresh_access_token', return_value=("access-v2", "refresh-v2"))
+    def test_失敗ケース_失効時のみ送信処理でローテーション(self, mock_refresh, mock_emit, moto_ssm, moto_dynamodb):
+        """失敗ケース: 共有トークンが失効していれば送信処理でローテーションし、メトリクスを出力する"""
+        put_shared_token(moto_ssm, "access-v1", -10)
+
+        assert get_access_token("req-1") == "access-v2"
+        mock_refresh.assert_called_once()
+        assert mock_emit.call_args[0][2] == {"InlineTokenRefresh": (1, "Count")}
+        assert mock_emit.call_args[1]["properties"]["Reason"] == "Expired"
+
+    @patch('teamsapi.BACKGROUND_TOKEN_REFRESH', True)
+    @patch('teamsapi.emit_metrics')
+    @patch('teamsapi.refresh_access_token', return_value=("access-v2", "refresh-v2"))
+    @patch('teamsapi.handle_dm_mode')
+    @patch('teamsapi.validate_and_parse_request')
+    def test_失敗ケース_401は次回の事前更新を待たずに置き換え(self, mock_validate, mock_handle_dm, mock_refresh, mock_emit,
+                                               moto_ssm, moto_dynamodb, mock_context):
+        """失敗ケース: 有効期限内の共有トークンでも401なら送信処理でローテーションし、メトリクスを出力する"""
+        put_shared_token(moto_ssm, "revoked", 900)
+        mock_validate.return_value = DMRequestModel(mode=1, email_addresses=["user@example.com"], message_text="テスト")
+        mock_handle_dm.side_effect = [
+            ExternalAPIException(401, "Unauthorized access", 401, "Token revoked"),
+            create_success_response("req", message="ok")
+        ]
+
+        lambda_handler({"body": "{}"}, mock_context)
+        result = lambda_handler({"body": "{}"}, mock_context)
+
+        assert result["statusCode"] == 200
+        assert mock_handle_dm.call_args[0][1] == "access-v2"
+        mock_refresh.assert_called_once()
+        inline = [call for call in mock_emit.call_args_list if "InlineTokenRefresh" in call[0][2]]
+        assert [call[1]["properties"]["Reason"] for call in inline] == ["Rejected"]
+
+    def test_失敗ケース_共有ストア未設定(self, mock_context):
+        """失敗ケース: ACCESS_TOKEN_PARAM_NAME が無ければ500"""
+        with patch('teamsapi.ACCESS_TOKEN_PARAM_NAME', None), pytest.raises(APIException) as exc_info:
+            token_refresher_handler({}, mock_context)
+
+        assert exc_info.value.status_code == 500
+
+    @patch('teamsapi.refresh_access_token', side_effect=APIException(502, "Token refresh failed 503"))
+    def test_失敗ケース_更新失敗は例外でリース解放(self, mock_refresh, moto_ssm, moto_dynamodb, mock_context):
+        """失敗ケース: トークンエンドポイントの失敗は送出し、次回の実行が取得できるようリースを解放する"""
+        with pytest.raises(APIException) as exc_info:
+            token_refresher_handler({"force": True}, mock_context)
+
+        assert exc_info.value.status_code == 502
+        assert get_lease(moto_dynamodb) is None
+
+# =============================================================================
+# Graph呼び出しメトリクス・タイムラインテスト
+# =============================================================================
+# lambda_handler 1呼び出し内のGraph呼び出し記録（record_graph_calls）をテストします。
+
+def channel_event():
+    return {"body": json.dumps({"mode": 2, "team_name": "開発チーム", "channel_name": "一般", "message_text": "テスト"})}
+
+def channel_graph_responses():
+    return [
+        graph_response(200, '{"value": [{"id": "team-1", "displayName": "開発チーム"}]}'),
+        graph_response(200, '{"value": [{"id": "19:c@thread.tacv2", "displayName": "一般"}]}'),
+        graph_response(201, '{"id": "msg-1"}'),
+    ]
+
+class TestGraphCallMetricsSuccess:
+    """Graph呼び出しメトリクスの成功ケーステスト"""
+
+    @patch('teamsapi.http')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_エンドポイント別メトリクス(self, mock_get_token, mock_http, retry_window, mock_context):
+        """成功ケース: 呼び出し終了時にテンプレート単位の件数・所要時間を出力する"""
+        mock_http.request.side_effect = channel_graph_responses()
+
+        result = lambda_handler(channel_event(), mock_context)
+
+        assert result["statusCode"] == 200
+        assert "debug" not in json.loads(result["body"])
+        assert retry_window.values("Calls", Endpoint="GET /me/joinedTeams") == [1]
+        assert retry_window.values("Calls", Endpoint="POST /teams/{id}/channels/{id}/messages") == [1]
+        assert len(retry_window.values("CallLatency", Endpoint="GET /teams/{id}/channels")[0]) == 1
+
+    @patch('teamsapi.GRAPH_TIMELINE_DEBUG', True)
+    @patch('teamsapi.http')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_成功ケース_デバッグ用タイムライン(self, mock_get_token, mock_http, retry_window, mock_context):
+        """成功ケース: 有効時はレスポンスに呼び出し順のタイムラインを付与する"""
+        mock_http.request.side_effect = channel_graph_responses()
+
+        body = json.loads(lambda_handler(channel_event(), mock_context)["body"])
+
+        timeline = body["debug"]["graph_calls"]
+        assert [(c["method"], c["endpoint"], c["status"]) for c in timeline] == [
+            ("GET", "/me/joinedTeams", 200),
+            ("GET", "/teams/{id}/channels", 200),
+            ("POST", "/teams/{id}/channels/{id}/messages", 201),
+        ]
+        assert timeline[2]["response_bytes"] == len(b'{"id": "msg-1"}')
+
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    def test_成功ケース_バッチのサブリクエストもエンドポイント別に記録(self, mock_http, mock_sleep, retry_window):
+        """成功ケース: $batchの各サブリクエストを自身のテンプレート・最終ステータス・送信回数で記録する"""
+        import teamsapi
+        mock_http.request.side_effect = [
+            graph_response(200, json.dumps({"responses": [
+                {"id": "0", "status": 429, "headers": {"Retry-After": "0"}, "body": {}},
+                {"id": "1", "status": 201, "body": {"id": "m2"}},
+                {"id": "2", "status": 404, "body": {"error": {"message": "not found"}}}
+            ]})),
+            graph_response(200, json.dumps({"responses": [{"id": "0", "status": 201, "body": {"id": "m1"}}]}))
+        ]
+        teamsapi.graph_call_log.start()
+
+        execute_graph_batch([{"method": "POST", "url": "/chats/19:a@unq.gbl.spaces/messages", "body": {}},
+                             {"method": "POST", "url": "/chats/19:b@unq.gbl.spaces/messages", "body": {}},
+                             {"method": "GET", "url": "/users/c@example.com?$select=id"}], "token", "req-1")
+        calls = teamsapi.graph_call_log.end()
+
+        sub_calls = sorted((c["method"], c["endpoint"], c["status"], c["attempts"]) for c in calls if c["batched"])
+        assert sub_calls == [
+            ("GET", "/users/{id}", 404, 1),
+            ("POST", "/chats/{id}/messages", 201, 1),
+            ("POST", "/chats/{id}/messages", 201, 2),
+        ]
+        assert len([c for c in calls if c["endpoint"] == "/$batch"]) == 2
+
+class TestGraphCallMetricsFailure:
+    """Graph呼び出しメトリクスの失敗ケーステスト"""
+
+    @patch('teamsapi.GRAPH_TIMELINE_DEBUG', True)
+    @patch('teamsapi.time.sleep')
+    @patch('teamsapi.http')
+    @patch('teamsapi.get_access_token', return_value="token")
+    def test_失敗ケース_エラー応答と再試行回数も記録(self, mock_get_token, mock_http, mock_sleep, retry_window, mock_context):
+        """失敗ケース: 再試行後に失敗した呼び出しも送信回数・ステータス付きで記録する"""
+        mock_http.request.side_effect = [graph_response(429, retry_after="0"), graph_response(404, '{"error": {"message": "x"}}')]
+
+        result = lambda_handler(channel_event(), mock_context)
+
+        assert result["statusCode"] == 404
+        assert json.loads(result["body"])["debug"]["graph_calls"][0]["attempts"] == 2
+        assert retry_window.values("CallErrors", Endpoint="GET /me/joinedTeams") == [1]
+        assert retry_window.values("CallRetries", Endpoint="GET /me/joinedTeams") == [1]
+
 # 実行設定
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"]) 
\ No newline at end of file
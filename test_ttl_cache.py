@@ -0,0 +1,116 @@
+import pytest
+import os
+from unittest.mock import patch
+
+from ttl_cache import (
+    TTLCache,
+    InMemoryStore,
+    S3JsonStore,
+    NOT_FOUND
+)
+
+"""
+=============================================================================
+TTL付きキャッシュモジュール テストスイート
+=============================================================================
+"""
+
+class TestTTLCache:
+    """TTLCacheクラスのテスト"""
+
+    def test_成功ケース_保存と取得(self):
+        """成功ケース: 保存した値をTTL内に取得できる"""
+        cache = TTLCache("test", ttl_seconds=60)
+        cache.set("開発チーム", "team-1")
+
+        assert cache.get("開発チーム") == "team-1"
+        assert cache.get("未登録") is None
+
+    def test_成功ケース_TTL経過で失効(self):
+        """成功ケース: TTL経過後はキャッシュミスになる"""
+        cache = TTLCache("test", ttl_seconds=60)
+        with patch('ttl_cache.time.time', return_value=1000.0):
+            cache.set("key", "value")
+        with patch('ttl_cache.time.time', return_value=1061.0):
+            assert cache.get("key") is None
+        assert len(cache) == 0
+
+    def test_成功ケース_LRU上限(self):
+        """成功ケース: 上限超過時は最も古く使われたエントリから破棄される"""
+        cache = TTLCache("test", ttl_seconds=60, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.get("c") == 3
+
+    def test_成功ケース_ネガティブキャッシュ(self):
+        """成功ケース: NOT_FOUNDは短いTTLでメモリにのみ保持される"""
+        store = InMemoryStore()
+        cache = TTLCache("test", ttl_seconds=60, negative_ttl_seconds=5, store=store)
+        with patch('ttl_cache.time.time', return_value=1000.0):
+            cache.set_not_found("missing")
+            assert cache.get("missing") is NOT_FOUND
+        with patch('ttl_cache.time.time', return_value=1006.0):
+            assert cache.get("missing") is None
+        assert store.records == {}
+
+    def test_成功ケース_永続ストアから復元(self):
+        """成功ケース: メモリに無くても永続ストアの有効な値を取得しメモリへ反映する"""
+        store = InMemoryStore()
+        TTLCache("test", ttl_seconds=60, store=store).set("key", "value")
+
+        cache = TTLCache("test", ttl_seconds=60, store=store)
+        assert cache.get("key") == "value"
+        assert len(cache) == 1
+
+    def test_成功ケース_無効化は永続ストアにも反映(self):
+        """成功ケース: invalidateでメモリと永続ストアの両方から破棄される"""
+        store = InMemoryStore()
+        cache = TTLCache("test", ttl_seconds=60, store=store)
+        cache.set("key", "value")
+
+        cache.invalidate("key")
+
+        assert cache.get("key") is None
+        assert store.records == {}
+
+    def test_失敗ケース_永続ストア障害はキャッシュミス(self):
+        """失敗ケース: 永続ストアの例外は伝播させずキャッシュミスとして扱う"""
+        class BrokenStore:
+            def get(self, key):
+                raise RuntimeError("store down")
+            def put(self, key, record):
+                raise RuntimeError("store down")
+            def delete(self, key):
+                raise RuntimeError("store down")
+
+        cache = TTLCache("test", ttl_seconds=60, store=BrokenStore())
+        cache.set("key", "value")
+        cache.clear()
+
+        assert cache.get("key") is None
+        cache.invalidate("key")
+
+class TestS3JsonStore:
+    """S3JsonStoreクラスのテスト"""
+
+    def test_成功ケース_S3への保存と取得(self):
+        """成功ケース: キーをURLエンコードしたJSONオブジェクトとして保存・取得・削除できる"""
+        import boto3
+        from moto import mock_s3
+        with mock_s3(), patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing"}):
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket='cache-bucket')
+            store = S3JsonStore('cache-bucket', 'cache/team_id/', s3_client=s3)
+
+            store.put("team/開発", {"value": "team-1", "expires_at": 2000000000})
+
+            keys = [o["Key"] for o in s3.list_objects_v2(Bucket='cache-bucket')["Contents"]]
+            assert keys == ["cache/team_id/team%2F%E9%96%8B%E7%99%BA.json"]
+            assert store.get("team/開発") == {"value": "team-1", "expires_at": 2000000000}
+            store.delete("team/開発")
+            assert store.get("team/開発") is None
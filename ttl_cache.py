@@ -0,0 +1,168 @@
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# ========== TTL付きキャッシュ ==========
+# ウォームコンテナ内のメモリ（LRU上限付き）と、任意の永続ストアの2段構成。
+#   - 永続ストアはコールドスタート後や別インスタンスとの共有用（S3JsonStore 等）
+#   - 「見つからなかった」結果は NOT_FOUND として短いTTLでメモリにのみ保持する
+# 永続ストアは get(key) / put(key, record) / delete(key) を持つ任意のオブジェクト。
+# record は {"value": 値, "expires_at": UNIX秒} のdict。
+# ===============================
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+class _NotFound:
+    """ネガティブキャッシュ用の番兵"""
+    def __repr__(self):
+        return "NOT_FOUND"
+
+NOT_FOUND = _NotFound()
+
+class InMemoryStore:
+    """プロセス内dictによる永続ストア代替（テスト・ローカル実行用）"""
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            return self.records.get(key)
+
+    def put(self, key: str, record: dict) -> None:
+        with self.lock:
+            self.records[key] = record
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.records.pop(key, None)
+
+class S3JsonStore:
+    """S3オブジェクト（1キー1JSON）による永続ストア"""
+    def __init__(self, bucket_name: str, prefix: str = "", s3_client=None):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self._s3_client = s3_client
+
+    @property
+    def s3_client(self):
+        if self._s3_client is None:
+            import boto3
+            self._s3_client = boto3.client('s3')
+        return self._s3_client
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{urllib.parse.quote(key, safe='')}.json"
+
+    def get(self, key: str) -> Optional[dict]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket_name, Key=self._object_key(key))
+            return json.loads(response['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key: str, record: dict) -> None:
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=self._object_key(key),
+            Body=json.dumps(record, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+    def delete(self, key: str) -> None:
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key=self._object_key(key))
+
+class TTLCache:
+    """LRU上限・TTL・ネガティブキャッシュ付きキャッシュ
+
+    Args:
+        name: ログ出力用のキャッシュ名
+        ttl_seconds: 値の有効秒数
+        negative_ttl_seconds: NOT_FOUND の有効秒数（0で無効）
+        max_entries: メモリに保持する最大件数（超過時は最も古く使われたものから破棄）
+        store: 永続ストア（Noneでメモリのみ）
+    """
+    def __init__(self, name: str, ttl_seconds: float, negative_ttl_seconds: float = 0,
+                 max_entries: int = 1024, store=None):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.store = store
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """キャッシュ済みの値を返す（NOT_FOUNDを含む）。未キャッシュ・期限切れはNone"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+        if self.store is None:
+            return None
+
+        try:
+            record = self.store.get(key)
+        except Exception as e:
+            # 永続ストア障害時はキャッシュミスとして扱う
+            logger.warning(f"CACHE_STORE_GET_ERROR - {self.name}:{key} - {str(e)}")
+            return None
+        if not record or record.get("expires_at", 0) <= now:
+            return None
+
+        self._set_local(key, record["value"], record["expires_at"])
+        return record["value"]
+
+    def set(self, key: str, value: Any) -> None:
+        """値をメモリと永続ストアへ保存"""
+        expires_at = time.time() + self.ttl_seconds
+        self._set_local(key, value, expires_at)
+        if self.store is None:
+            return
+        try:
+            self.store.put(key, {"value": value, "expires_at": expires_at})
+        except Exception as e:
+            logger.warning(f"CACHE_STORE_PUT_ERROR - {self.name}:{key} - {str(e)}")
+
+    def set_not_found(self, key: str) -> None:
+        """「存在しない」結果をメモリにのみ短期間保存"""
+        if self.negative_ttl_seconds > 0:
+            self._set_local(key, NOT_FOUND, time.time() + self.negative_ttl_seconds)
+
+    def invalidate(self, key: str) -> None:
+        """指定キーをメモリと永続ストアから破棄"""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.store is None:
+            return
+        try:
+            self.store.delete(key)
+        except Exception as e:
+            logger.warning(f"CACHE_STORE_DELETE_ERROR - {self.name}:{key} - {str(e)}")
+
+    def clear(self) -> None:
+        """メモリ上のエントリを全破棄（永続ストアは変更しない）"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def _set_local(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)